@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+#------------------------------------------------------------
+# This program allows you to know the name of the IONEX file
+# you need for a given date, or the IONEX files needed by the
+# observations of a manifest (see ionFRM.py --manifest), and
+# which of them are still to be downloaded.
+# @version 1.0
+# @author carlos
+#
+# HOW TO run it:
+# $./IONEXFileNeeded.py [yyyy-mm-dd ...]
+# $./IONEXFileNeeded.py --manifest FILE [--ionexdir DIR] [--fetch]
+#------------------------------------------------------------
+
+import sys
+import datetime
+import optparse as op
+
+from ionfr.ionexfiles import ionex_name
+
+p = op.OptionParser(usage="%prog [yyyy-mm-dd ...] | --manifest FILE [options]")
+p.add_option('--type', '-t', default='codg', help='Type of ionex file (codg,upcg,igsg) [codg]')
+p.add_option('--manifest', default=None, help='Manifest of observations (see ionFRM.py --manifest)')
+p.add_option('--ionexdir', default='.', help='Directory of the (unpacked) IONEX files [%default]')
+p.add_option('--mirror', default=None, help='Local mirror of the archive (yyyy/ddd/)')
+p.add_option('--neighbours', default=0, type='int', help='Days around every observed day also needed [0]')
+p.add_option('--fetch', action='store_true', default=False, help='Download and unpack the missing files')
+ops, dates = p.parse_args()
+
+if ops.manifest is None:
+	# Reading the date(s) provided
+	if not dates:
+		dates = [input('date of observation?(yyyy-mm-dd): ')]
+	for date in dates:
+		try:
+			day = datetime.datetime.strptime(date.strip(), '%Y-%m-%d').date()
+		except ValueError:
+			p.error('Invalid date: %s' % date)
+		# Outputing the name of the IONEX file you require
+		print('file needed:', ionex_name(ops.type, day).upper())
+	sys.exit()
+
+# numpy and the rest only for a manifest
+import ionfr.batch
+import ionfr.prefetch
+
+try:
+	jobs = ionfr.batch.read_manifest(ops.manifest)
+except (IOError, ValueError) as detail:
+	p.error(str(detail))
+if ops.fetch:
+	plan, missing = ionfr.prefetch.prefetch(jobs, ops.ionexdir, ops.mirror, ops.neighbours)
+else:
+	plan = ionfr.prefetch.plan(jobs, ops.ionexdir, ops.mirror, ops.neighbours)
+	missing = plan.download
+for product, day in plan.needed:
+	if (product, day) in missing:
+		state = 'missing' if ops.fetch else 'to download'
+	elif (product, day) in plan.present:
+		state = 'present'
+	elif ops.fetch:
+		state = 'fetched'
+	else:
+		state = 'to unpack'
+	print(ionex_name(product, day), state)
+sys.exit(1 if missing and ops.fetch else 0)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+#------------------------------------------------------------
+# Benchmarks of ionFR.
+#
+# Times every stage on synthetic IONEX files of growing size
+# (see ionexgen.py) and the whole RM computation:
+#	parse		IONEX files per second, for several grid
+#			steps and map cadences
+#	interp		TEC interpolations (points) per second
+#	geometry	piercing points per second
+#	field		IGRF field evaluations per second, by
+#			synthesis and from a field grid
+#	epochs		RM epochs per second for one line of sight
+#	sources		RM for many sources (24 epochs each) per
+#			second
+#	startup		wall time of short command line calls (usage
+#			error, --help, a file name lookup, import ionfr)
+# Before timing anything the results for test/codg2930.11i are
+# checked against test/IonRM.txt, and the startup of the command
+# line tools against its budget: they must not import numpy, the
+# IGRF or the sidereal package, and must return within
+# StartupBudget seconds of a bare python.
+#
+# The results are saved as JSON (benchmarks/results/NAME.json)
+# with the commit they were obtained with, and can be compared
+# with an earlier file:
+#
+# $ python benchmarks/bench.py --save before
+# $ python benchmarks/bench.py --compare benchmarks/results/before.json
+#------------------------------------------------------------
+
+import json
+import optparse as op
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+ROOT = os.path.dirname(HERE)
+# the checkout the benchmarks belong to, rather than an installed ionfr
+sys.path.insert(0, ROOT)
+
+import ionfr  # noqa: E402
+from ionfr.igrf import fieldgrid, igrffield  # noqa: E402
+from ionfr.ionex import ionexmaps  # noqa: E402
+from ionfr.puncture import ippcoor_v2  # noqa: E402
+from ionexgen import writeIONEX  # noqa: E402
+
+# The observation of test/IonRM.txt (see README.md)
+TEST_SOURCE = (129.273333, 6.170694)  # 08h37m05.6s+06d10m14.5s
+TEST_STATION = (52.915167, 6.869917)  # 52d54m54.6sn 6d52m11.7se
+TEST_IONEX = os.path.join(ROOT, "test", "codg2930.11i")
+TEST_OUTPUT = os.path.join(ROOT, "test", "IonRM.txt")
+
+# (dlat, dlon, interval) of the synthetic files
+GRIDS = [(2.5, 5.0, 7200), (2.5, 5.0, 3600), (1.0, 2.5, 7200), (1.0, 1.0, 3600)]
+
+# Short calls of the command line tools, which have to return at once
+STARTUP = OrderedDict(
+    [
+        ("import", ["-c", "import ionfr"]),
+        ("usage", ["ionFRM.py"]),
+        ("help", ["ionFRM.py", "--help"]),
+        ("filename", ["IONEXFileNeeded.py", "2011-10-20"]),
+    ]
+)
+# Seconds they may take on top of a bare python, and the modules they
+# must not import
+StartupBudget = 0.05
+HeavyModules = ("numpy", "pyIGRF", "ionfr.sidereal.sidereal", "ionfr.compute")
+
+
+def best(function, repeat=3):
+    # shortest wall time of 'repeat' calls
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def checkReference():
+    # RM for the observation of test/IonRM.txt, compared with it.
+    # The TEC must agree to rounding; test/IonRM.txt was made with
+    # an earlier generation of IGRF coefficients than pyIGRF has
+    # now, so B (and RM) only agree to within 30%, and RM must be
+    # 2.6e-17 B TEC in both.
+    ref = numpy.loadtxt(TEST_OUTPUT)
+    times = ionfr.epoch_range("2011-10-20", "2011-10-21", 3600)
+    rm = ionfr.compute_rm(TEST_SOURCE[0], TEST_SOURCE[1], TEST_STATION[0], TEST_STATION[1], times, TEST_IONEX)
+    rm = rm[~numpy.isnan(rm["rm"])]
+    if not numpy.array_equal(rm["hour"], ref[:, 0]):
+        raise AssertionError("Not the epochs of %s" % TEST_OUTPUT)
+    checks = [("tecpath", 1, 1e-5), ("bfield", 2, 0.3), ("rm", 3, 0.3), ("rmerr", 4, 0.3)]
+    worst = OrderedDict()
+    for name, column, rtol in checks:
+        worst[name] = float(numpy.max(numpy.abs(rm[name] / ref[:, column] - 1.0)))
+        if worst[name] > rtol:
+            raise AssertionError("%s differs from %s by %.3g (> %g)" % (name, TEST_OUTPUT, worst[name], rtol))
+    for values in (rm["rm"] / (2.6e-17 * rm["bfield"] * rm["tecpath"]), ref[:, 3] / (2.6e-17 * ref[:, 2] * ref[:, 1])):
+        if numpy.max(numpy.abs(values - 1.0)) > 1e-9:
+            raise AssertionError("RM is not 2.6e-17 B TEC")
+    return worst
+
+
+def _python(args, env=None):
+    # wall time of one python call, from ROOT
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def checkStartup(repeat=5):
+    # wall times of the STARTUP calls and of a bare python (best of
+    # 'repeat'); raises AssertionError when a call imports one of
+    # HeavyModules or takes longer than StartupBudget over python
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    results = OrderedDict()
+    bare = min(_python(["-c", "pass"], env) for _ in range(repeat))
+    results["bare"] = bare
+    for name, args in STARTUP.items():
+        seconds = min(_python(args, env) for _ in range(repeat))
+        results[name] = seconds
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime"] + args, cwd=ROOT, env=env, capture_output=True, text=True
+        )
+        loaded = set(line.split("|")[-1].strip() for line in out.stderr.splitlines() if line.startswith("import time:"))
+        heavy = [module for module in HeavyModules if module in loaded]
+        if heavy:
+            raise AssertionError("%s imports %s" % (" ".join(args), ", ".join(heavy)))
+        if seconds - bare > StartupBudget:
+            raise AssertionError(
+                "%s takes %.3f s, %.3f s over python (> %g)" % (" ".join(args), seconds, seconds - bare, StartupBudget)
+            )
+    return results
+
+
+def benchParse(workdir, grids):
+    results = OrderedDict()
+    for dlat, dlon, interval in grids:
+        filename = os.path.join(workdir, "bench_%g_%g_%d.11i" % (dlat, dlon, interval))
+        writeIONEX(filename, dlat, dlon, interval)
+        seconds = best(lambda: ionexmaps.parseIONEX(filename))
+        data = ionexmaps.parseIONEX(filename)
+        results["%gx%g/%ds" % (dlat, dlon, interval)] = {
+            "seconds": seconds,
+            "megabytes_per_second": os.path.getsize(filename) / 1e6 / seconds,
+            "maps": data.tecMaps.shape[0],
+            "grid": list(data.tecMaps.shape[1:]),
+        }
+    return results
+
+
+def benchStages(ionex, n, rng):
+    lat = rng.uniform(-80.0, 80.0, n)
+    lon = rng.uniform(-180.0, 180.0, n)
+    hour = rng.uniform(0.0, 24.0, n)
+    az = rng.uniform(0.0, 2 * numpy.pi, n)
+    zen = rng.uniform(0.0, 1.4, n)
+    results = OrderedDict()
+    seconds = best(lambda: ionex.tec(lat, lon, hour))
+    results["interp"] = {"points": n, "seconds": seconds, "per_second": n / seconds}
+    seconds = best(lambda: ippcoor_v2.PuncIonOffset(numpy.radians(52.9), az, zen, 450e3))
+    results["geometry"] = {"points": n, "seconds": seconds, "per_second": n / seconds}
+    seconds = best(lambda: igrffield.calcField(lat, lon, 6821.0, 2011.8))
+    results["field"] = {"points": n, "seconds": seconds, "per_second": n / seconds}
+    gridDir = tempfile.mkdtemp(prefix="ionfr_grid_")
+    try:
+        grid = fieldgrid.getFieldGrid(gridDir, 2011.8, 6821.0)
+        seconds = best(lambda: grid.field(lat, lon))
+        results["fieldgrid"] = {"points": n, "seconds": seconds, "per_second": n / seconds}
+    finally:
+        shutil.rmtree(gridDir)
+    return results
+
+
+def benchRM(ionexFile, nEpochs, nSources, rng):
+    results = OrderedDict()
+    ionex = ionexmaps.readIONEX(ionexFile)
+    times = ionfr.epoch_range("2011-10-20", "2011-10-21", 86400.0 / nEpochs)
+    seconds = best(lambda: ionfr.compute_rm(TEST_SOURCE[0], TEST_SOURCE[1], TEST_STATION[0], TEST_STATION[1], times, ionex))
+    results["epochs"] = {"epochs": len(times), "seconds": seconds, "per_second": len(times) / seconds}
+
+    # nSources sources with 24 hourly epochs each, in one call
+    hourly = ionfr.epoch_range("2011-10-20", "2011-10-21", 3600)
+    ra = numpy.repeat(rng.uniform(0.0, 360.0, nSources), len(hourly))
+    dec = numpy.repeat(rng.uniform(-30.0, 90.0, nSources), len(hourly))
+    allTimes = numpy.tile(hourly, nSources)
+    seconds = best(lambda: ionfr.compute_rm(ra, dec, TEST_STATION[0], TEST_STATION[1], allTimes, ionex))
+    results["sources"] = {"sources": nSources, "seconds": seconds, "per_second": nSources / seconds}
+    return results
+
+
+def gitCommit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def flatten(results, prefix=""):
+    # {"parse/2.5x5/7200s/seconds": ...} of the nested results
+    flat = OrderedDict()
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(new, old, out=sys.stdout):
+    # the rates and times of two runs side by side
+    newFlat = flatten(new["results"])
+    oldFlat = flatten(old["results"])
+    out.write("%-45s %14s %14s %8s\n" % ("", "before", "now", "ratio"))
+    for key, value in newFlat.items():
+        if key in oldFlat and (key.endswith("per_second") or key.endswith("seconds")) and oldFlat[key]:
+            out.write("%-45s %14.4g %14.4g %8.3f\n" % (key, oldFlat[key], value, value / oldFlat[key]))
+
+
+def run(quick=False):
+    rng = numpy.random.RandomState(1)
+    n = 20000 if quick else 200000
+    workdir = tempfile.mkdtemp(prefix="ionfr_bench_")
+    try:
+        results = OrderedDict()
+        results["reference"] = checkReference()
+        results["startup"] = checkStartup()
+        results["parse"] = benchParse(workdir, GRIDS[:2] if quick else GRIDS)
+        results["stages"] = benchStages(ionexmaps.parseIONEX(TEST_IONEX), n, rng)
+        results["rm"] = benchRM(TEST_IONEX, 8640 if quick else 86400, 100 if quick else 1000, rng)
+    finally:
+        shutil.rmtree(workdir)
+    return OrderedDict(
+        [
+            ("commit", gitCommit()),
+            ("date", time.strftime("%Y-%m-%dT%H:%M:%S")),
+            ("python", platform.python_version()),
+            ("numpy", numpy.__version__),
+            ("machine", platform.machine()),
+            ("quick", quick),
+            ("results", results),
+        ]
+    )
+
+
+if __name__ == "__main__":
+    p = op.OptionParser(usage="%prog [options]")
+    p.add_option("--quick", action="store_true", default=False, help="Smaller sizes, for a quick check")
+    p.add_option("--save", default=None, help="Save the results as benchmarks/results/NAME.json")
+    p.add_option("--compare", default=None, help="Compare with the results saved in this file")
+    ops, args = p.parse_args()
+    data = run(ops.quick)
+    json.dump(data, sys.stdout, indent=1)
+    sys.stdout.write("\n")
+    if ops.save is not None:
+        os.makedirs(os.path.join(HERE, "results"), exist_ok=True)
+        with open(os.path.join(HERE, "results", ops.save + ".json"), "w") as f:
+            json.dump(data, f, indent=1)
+    if ops.compare is not None:
+        with open(ops.compare) as f:
+            compare(data, json.load(f))
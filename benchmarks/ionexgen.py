@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+#------------------------------------------------------------
+# Synthetic IONEX files for the benchmarks.
+#
+# The TEC maps are a smooth daytime bump that follows the Sun
+# (peaking at 14h local time and at the equator) on top of a
+# night-time floor, with a little noise; the RMS maps are a
+# tenth of the TEC. The files follow the IONEX 1.0 layout of
+# the CODE files (2-D maps, values in 0.1 TECU, 16 values per
+# line), so ionexmaps.parseIONEX reads them as real ones.
+#
+# Input of writeIONEX:
+#	filename	file to write
+#	dlat, dlon	grid step (degrees; the header has one
+#			decimal, and 175/dlat and 360/dlon must
+#			be whole)
+#	interval	seconds between maps (7200 or 3600 for
+#			ionexmaps)
+#	nMaps		number of maps [one day of maps]
+#	height		height of the shell (km)
+#	epoch		(year, month, day) of the first map
+#	seed		of the noise
+#
+# HOW TO run it:
+# $./ionexgen.py out.11i [--dlat 2.5] [--dlon 5] [--interval 7200]
+#------------------------------------------------------------
+
+import optparse as op
+
+import numpy
+
+LAT1 = 87.5
+LON1, LON2 = -180.0, 180.0
+
+
+def gridAxes(dlat, dlon):
+    # latitudes (north to south) and longitudes of the grid nodes
+    nLat = int(round(2 * LAT1 / dlat)) + 1
+    nLon = int(round((LON2 - LON1) / dlon)) + 1
+    return LAT1 - dlat * numpy.arange(nLat), LON1 + dlon * numpy.arange(nLon)
+
+
+def syntheticMaps(lats, lons, hours, seed=0):
+    # TEC maps (0.1 TECU, integers) of shape (hours, lats, lons)
+    rng = numpy.random.RandomState(seed)
+    lat = numpy.radians(lats)[None, :, None]
+    local = (hours[:, None, None] + lons[None, None, :] / 15.0) % 24.0
+    day = numpy.clip(numpy.cos((local - 14.0) * numpy.pi / 12.0), 0.0, None)
+    tec = 50.0 + 400.0 * day * numpy.cos(lat) ** 2 + 20.0 * rng.standard_normal(day.shape)
+    return numpy.clip(numpy.round(tec), 0, 9998).astype(int)
+
+
+def _record(text, label):
+    return "%-60s%-20s\n" % (text, label)
+
+
+def _mapLines(values, lats, lons, dlon, height):
+    lines = []
+    for i, lat in enumerate(lats):
+        lines.append(
+            _record("  %6.1f%6.1f%6.1f%6.1f%6.1f" % (lat, lons[0], lons[-1], dlon, height), "LAT/LON1/LON2/DLON/H")
+        )
+        row = values[i]
+        for j in range(0, len(row), 16):
+            lines.append("".join("%5d" % v for v in row[j : j + 16]) + "\n")
+    return lines
+
+
+def writeIONEX(
+    filename, dlat=2.5, dlon=5.0, interval=7200, nMaps=None, height=450.0, epoch=(2011, 10, 20), seed=0
+):
+    for step, span in ((dlat, 2 * LAT1), (dlon, LON2 - LON1)):
+        if round(step, 1) != step or abs(span / step - round(span / step)) > 1e-9:
+            raise ValueError("Grid step %g does not fit the IONEX grid" % step)
+    if nMaps is None:
+        nMaps = 86400 // interval + 1
+    lats, lons = gridAxes(dlat, dlon)
+    hours = numpy.arange(nMaps) * interval / 3600.0
+    tec = syntheticMaps(lats, lons, hours, seed)
+    rms = numpy.maximum(tec // 10, 1)
+
+    start = numpy.datetime64("%04d-%02d-%02d" % tuple(epoch), "s")
+    stamps = [start + numpy.timedelta64(int(k * interval), "s") for k in range(nMaps)]
+
+    def stamp(t):
+        t = t.item()
+        return "  %4d%6d%6d%6d%6d%6d" % (t.year, t.month, t.day, t.hour, t.minute, t.second)
+
+    out = [
+        _record("     1.0            IONOSPHERE MAPS     GNSS", "IONEX VERSION / TYPE"),
+        _record("ionexgen.py         ionFR               synthetic", "PGM / RUN BY / DATE"),
+        _record("Synthetic maps for the ionFR benchmarks", "COMMENT"),
+        _record(stamp(stamps[0]), "EPOCH OF FIRST MAP"),
+        _record(stamp(stamps[-1]), "EPOCH OF LAST MAP"),
+        _record("%6d" % interval, "INTERVAL"),
+        _record("%6d" % nMaps, "# OF MAPS IN FILE"),
+        _record("  NONE", "MAPPING FUNCTION"),
+        _record("    10.0", "ELEVATION CUTOFF"),
+        _record("  6371.0", "BASE RADIUS"),
+        _record("     2", "MAP DIMENSION"),
+        _record("  %6.1f%6.1f%6.1f" % (height, height, 0.0), "HGT1 / HGT2 / DHGT"),
+        _record("  %6.1f%6.1f%6.1f" % (lats[0], lats[-1], -dlat), "LAT1 / LAT2 / DLAT"),
+        _record("  %6.1f%6.1f%6.1f" % (lons[0], lons[-1], dlon), "LON1 / LON2 / DLON"),
+        _record("    -1", "EXPONENT"),
+        _record("", "END OF HEADER"),
+    ]
+    for kind, maps in (("TEC", tec), ("RMS", rms)):
+        for k in range(nMaps):
+            out.append(_record("%6d" % (k + 1), "START OF %s MAP" % kind))
+            out.append(_record(stamp(stamps[k]), "EPOCH OF CURRENT MAP"))
+            out.extend(_mapLines(maps[k], lats, lons, dlon, height))
+            out.append(_record("%6d" % (k + 1), "END OF %s MAP" % kind))
+    out.append(_record("", "END OF FILE"))
+    with open(filename, "w") as f:
+        f.writelines(out)
+    return filename
+
+
+if __name__ == "__main__":
+    p = op.OptionParser(usage="%prog [options] filename")
+    p.add_option("--dlat", default=2.5, type="float", help="Latitude step [%default]")
+    p.add_option("--dlon", default=5.0, type="float", help="Longitude step [%default]")
+    p.add_option("--interval", default=7200, type="int", help="Seconds between maps [%default]")
+    p.add_option("--maps", default=None, type="int", help="Number of maps [one day]")
+    p.add_option("--height", default=450.0, type="float", help="Shell height in km [%default]")
+    p.add_option("--seed", default=0, type="int", help="Seed of the noise [%default]")
+    ops, args = p.parse_args()
+    if len(args) != 1:
+        p.error("One output file name is needed.")
+    writeIONEX(args[0], ops.dlat, ops.dlon, ops.interval, ops.maps, ops.height, seed=ops.seed)
@@ -15,160 +15,471 @@
 # also changes.
 #
 # This program calculates the coordinates at the piercing
-# point during 24 hr, one point per every hour.
+# point during 24 hr, one point per every hour (or at the
+# epochs given with --start, --stop and --step).
 # Each coordinate is then used to calulate the TEC and B values
 # for every hour. Remember that there should be 25 coordinates,
 # each one corresponding to every hour during a day (from 00~24).
 #
 # NOTE: Actually due to problems with the 'sidereal' package we only
 # obtain 24 RM values (from 00~23)
+#
+# The computation itself is done by ionfr.compute_rm (or
+# ionfr.compute_rm_altaz), which can also be called directly from
+# python; this script only parses the command line and writes
+# IonRM.txt. numpy, the IGRF and the rest are imported once the
+# arguments have been checked, so a usage error or --help returns
+# at once.
 # -----------------------------------------------------------
 
-# `path` is the variable describing where the ionFR code is. Determine this
-# automatically.
-import os
+import optparse as op
+import sys
+from collections import OrderedDict
+from math import degrees
+from datetime import datetime, timedelta
 
-path = os.path.dirname(os.path.realpath(__file__)) + "/"
+import ionfr
 
-# -----------------------------------------------------------
 
-import sys
-from math import pi, sin, cos
-from datetime import datetime
-import pyIGRF
-
-# Add ionFR modules to the PYTHONPATH (internally, this is sys.path).
-sys.path.append("" + str(path) + "SiderealPackage")
-sys.path.append("" + str(path) + "PunctureIonosphereCoord")
-sys.path.append("" + str(path) + "IONEX")
-import rdalaz
-from rdalaz import usage
-import ippcoor_v1 as ippcoor
-import teccalc
-import tecrmscalc
-import ionheight
-
-# Defining some variables for further use
-TECU = pow(10, 16)
-TEC2m2 = 0.1 * TECU
-EarthRadius = 6371000.0  # in meters
-Tesla2Gauss = pow(10, 4)
+def usage(*L):
+    # the message of rdalaz.usage, without importing the sidereal
+    # package for it
+    sys.stderr.write("*** Usage:\n***   rdaa RA+dec lat lon datetime\n")
+    sys.stderr.write("*** Or:\n***   rdaa RA-dec lat lon datetime\n")
+    sys.stderr.write("*** Error: %s\n" % "".join(L))
+    raise SystemExit
+
+
+def writeRM(filename, RM, extra=(), mode="w", precision=None):
+    # Saving the Ionosheric RM and its corresponding rms value to a
+    # file, for the epochs at which the source is above the horizon.
+    # In .txt files the first column is the hour ('00'...'23') for
+    # hourly epochs, and the decimal hour otherwise. 'extra' are
+    # (name, values) columns to put first. mode 'w' overwrites the
+    # file and mode 'a' appends to it. Text files of any other layout
+    # than that of IonRM.txt start with a '# column names' line.
+    keep = ~numpy.isnan(RM["rm"])
+    hour = RM["hour"][keep]
+    if ionfr.writers.guess_format(filename) == "txt":
+        if numpy.all(RM["hour"] == numpy.round(RM["hour"])):
+            hour = numpy.char.mod("%02d", hour)
+        else:
+            hour = numpy.char.mod("%.6f", hour)
+    columns = [(name, numpy.asarray(values)[keep]) for name, values in extra]
+    columns.append(("hour", hour))
+    columns += [(name, RM[name][keep]) for name in RM.dtype.names[1:]]
+    rows = numpy.empty(len(hour), dtype=[(name, values.dtype) for name, values in columns])
+    for name, values in columns:
+        rows[name] = values
+    header = rows.dtype.names != ionfr.RM_DTYPE.names
+    with ionfr.writers.RMWriter(filename, rows.dtype, mode=mode, precision=precision, header=header) as writer:
+        writer.write(rows)
+
 
 # Cheking the arguments are given correctly
-argList = sys.argv[1:]
-if len(argList) != 5:
+p = op.OptionParser(
+    usage="%prog [options] RA+dec lat lon datetime IONEX_file\n"
+    "       %prog [options] --stations FILE RA+dec datetime IONEX_file\n"
+    "       %prog [options] --manifest FILE"
+)
+p.add_option(
+    "--fieldgrid",
+    default=None,
+    type="string",
+    help="Directory holding daily geomagnetic field grids (built on first "
+    "use). B is then interpolated from the grid instead of synthesised "
+    "at every IPP",
+)
+p.add_option(
+    "--shells",
+    default=1,
+    type="int",
+    help="Number of heights sampled along the line of sight [1, i.e. a "
+    "thin shell at the IONEX height]",
+)
+p.add_option(
+    "--shellprofile",
+    default="chapman",
+    type="string",
+    help="Vertical electron density profile weighting the shells "
+    "(chapman, uniform) [chapman, peak at the IONEX height]",
+)
+p.add_option(
+    "--scaleheight",
+    default=None,
+    type="float",
+    help="Scale height of the Chapman profile in km [100]",
+)
+p.add_option(
+    "--altaz",
+    action="store_true",
+    default=False,
+    help="Fixed pointing (drift scan): the first argument is az+alt "
+    "(e.g. 180d+90d) instead of RA+dec",
+)
+p.add_option(
+    "--start",
+    default=None,
+    type="string",
+    help="First epoch (UTC, yyyy-mm-ddThh:mm:ss) [00:00 of the date]",
+)
+p.add_option(
+    "--stop",
+    default=None,
+    type="string",
+    help="Last epoch, excluded (UTC, yyyy-mm-ddThh:mm:ss) [24:00 of the date]",
+)
+p.add_option(
+    "--step",
+    default=3600.0,
+    type="float",
+    help="Seconds between epochs [%default]",
+)
+p.add_option(
+    "--stations",
+    default=None,
+    type="string",
+    help="Table of stations (name lat lon per line) observing the same "
+    "source; the RM of every station is written to IonRM_<name>.txt",
+)
+p.add_option(
+    "--manifest",
+    default=None,
+    type="string",
+    help="CSV or JSON lines file of observations (source, station, start, "
+    "stop, cadence, product) to process in one run",
+)
+p.add_option(
+    "--ionexdir",
+    default=".",
+    type="string",
+    help="Directory of the IONEX files of a --manifest run [%default]",
+)
+p.add_option(
+    "--prefetch",
+    action="store_true",
+    default=False,
+    help="Before a --manifest run, download (from CDDIS) and unpack the "
+    "IONEX files it needs that are not in --ionexdir",
+)
+p.add_option(
+    "--mirror",
+    default=None,
+    type="string",
+    help="Local mirror of the IONEX archive (yyyy/ddd/ subdirectories) "
+    "used by --prefetch [the compressed files go to --ionexdir]",
+)
+p.add_option(
+    "--output",
+    default=None,
+    type="string",
+    help="Output file, its format (.txt, .csv, .jsonl, .npy, .npz) "
+    "following the extension [IonRM.txt, IonRMbatch.txt with --manifest, "
+    "IonRM_<name>.txt per station with --stations]; an existing file is "
+    "overwritten (see --append)",
+)
+p.add_option(
+    "--append",
+    action="store_true",
+    default=False,
+    help="Add to the output file instead of overwriting it",
+)
+p.add_option(
+    "--precision",
+    default=None,
+    type="int",
+    help="Significant digits of the floats in text outputs [as many as "
+    "needed to read back the same values]",
+)
+p.add_option(
+    "--processes",
+    default=1,
+    type="int",
+    help="Worker processes of a --manifest run, each one taking whole "
+    "IONEX days (0: one per core) [%default]",
+)
+p.add_option(
+    "--resume",
+    action="store_true",
+    default=False,
+    help="Go on with a --manifest run that stopped, from where its "
+    "journal (<output>.journal) ends, instead of starting again",
+)
+p.add_option(
+    "--products",
+    default=None,
+    type="string",
+    help="Comma separated IONEX products (e.g. codg,igsg,upcg,jplg) to "
+    "evaluate together, the IONEX_file argument being the directory of "
+    "their files for the day: the output has the mean of the products, "
+    "the spread (rmspread) of their RM and the RM of every product "
+    "(rm_<product>), the geometry and field being computed once",
+)
+p.add_option(
+    "--montecarlo",
+    default=None,
+    type="int",
+    metavar="N",
+    help="Add the 2.5, 16, 50, 84 and 97.5 percentiles of the RM over N "
+    "Monte Carlo realisations of the TEC (from the RMS maps, spatially "
+    "correlated), the shell height and the field (columns rm_p2.5 ... "
+    "rm_p97.5)",
+)
+p.add_option(
+    "--mcseed",
+    default=None,
+    type="int",
+    help="Seed of the --montecarlo draws, for repeatable percentiles",
+)
+p.add_option(
+    "--teccache",
+    default=None,
+    type="string",
+    help="Look the TEC up in a cache of points quantized to DEG degrees "
+    "of latitude and longitude and SECONDS of time (DEG[,SECONDS], "
+    "SECONDS 60 by default), so that nearby piercing points share one "
+    "interpolation. The TEC is then that of the centre of the quantum",
+)
+p.add_option(
+    "--teccachesize",
+    default=1 << 20,
+    type="int",
+    help="Points kept in the TEC cache [%default]",
+)
+p.add_option(
+    "--profile",
+    action="store_true",
+    default=False,
+    help="Print the time spent in every stage (IONEX parsing, "
+    "interpolation, geometry, field, ...) to stderr at the end",
+)
+p.add_option(
+    "--profile-json",
+    default=None,
+    type="string",
+    help="Write the same stage timings as JSON to this file",
+)
+ops, argList = p.parse_args()
+
+# the checks that need nothing but the command line
+if ops.precision is not None and ops.precision < 1:
+    p.error("The precision must be at least one digit.")
+if not ops.step > 0:
+    usage("The step must be positive.")
+if ops.manifest is not None:
+    if argList:
+        p.error("No positional arguments are expected with --manifest.")
+    if ops.processes < 0:
+        p.error("The number of processes cannot be negative.")
+elif ops.resume:
+    p.error("--resume is for --manifest runs.")
+elif ops.stations is not None:
+    if len(argList) != 3:
+        usage("Incorrect command line argument count.")
+    if ops.altaz:
+        p.error("--altaz and --stations cannot be combined.")
+elif len(argList) != 5:
     usage("Incorrect command line argument count.")
+if ops.products is not None:
+    ops.products = [name.strip().lower() for name in ops.products.split(",") if name.strip()]
+    if not ops.products or len(set(ops.products)) != len(ops.products):
+        p.error("--products takes a list of different product names.")
+    if ops.manifest is not None or ops.stations is not None or ops.altaz or ops.montecarlo is not None:
+        p.error("--products is for a single source and location (no --montecarlo).")
+if ops.montecarlo is not None:
+    if ops.montecarlo < 1:
+        p.error("--montecarlo needs at least one sample.")
+    if ops.manifest is not None or ops.stations is not None or ops.altaz:
+        p.error("--montecarlo is for a single source and location.")
+    if ops.shells != 1 or ops.fieldgrid is not None:
+        p.error("--montecarlo is for a thin shell and the IGRF (no --shells or --fieldgrid).")
+if ops.teccache is not None:
+    try:
+        quantum = [float(v) for v in ops.teccache.split(",")]
+    except ValueError:
+        quantum = []
+    if len(quantum) not in (1, 2) or min(quantum) <= 0:
+        p.error("--teccache takes DEG[,SECONDS], both positive.")
+    if len(quantum) == 1:
+        quantum.append(60.0)
+    ops.teccache = (quantum[0], quantum[0], quantum[1] / 3600.0)
+    if ops.teccachesize < 1:
+        p.error("The TEC cache must hold at least one point.")
+
+import numpy  # noqa: E402
+
+import ionfr.batch  # noqa: E402
+import ionfr.ionexfiles  # noqa: E402
+import ionfr.prefetch  # noqa: E402
+import ionfr.profiling  # noqa: E402
+import ionfr.stations  # noqa: E402
+import ionfr.writers  # noqa: E402
+from ionfr.ionex import ionexmaps  # noqa: E402
+from ionfr.puncture import montecarlo, multishell  # noqa: E402
+from ionfr.sidereal import aard, rdalaz, sidereal  # noqa: E402
+
+if ops.profile or ops.profile_json:
+    ionfr.profiling.enable()
+if ops.teccache is not None:
+    try:
+        ionexmaps.setTecCache(ops.teccache, ops.teccachesize)
+    except ValueError as detail:
+        p.error(str(detail))
+
+
+def finish():
+    # report the stage timings, if asked to
+    if ops.profile or ops.profile_json:
+        ionfr.profiling.report(ops.profile_json, table=ops.profile)
+
+
+mode = "a" if ops.append else "w"
+if ops.output is not None:
+    try:
+        ionfr.writers.guess_format(ops.output)
+    except ValueError as detail:
+        p.error(str(detail))
+if ops.shellprofile not in multishell.Profiles:
+    p.error(
+        "option --shellprofile: invalid choice: %r (choose from %s)"
+        % (ops.shellprofile, ", ".join(repr(name) for name in sorted(multishell.Profiles)))
+    )
+if ops.scaleheight is None:
+    ops.scaleheight = multishell.ScaleHeight / 1000.0
+options = dict(
+    shells=ops.shells,
+    profile=ops.shellprofile,
+    scale=ops.scaleheight * 1000.0,
+    fieldgrid=ops.fieldgrid,
+)
+
+if ops.manifest is not None:
+    # many observations in one run, all results in one file
+    try:
+        if ops.prefetch:
+            # all the files first, so the run cannot stop half way
+            jobs = ionfr.batch.read_manifest(ops.manifest)
+            ionfr.prefetch.prefetch(jobs, ops.ionexdir, ops.mirror)
+        ionfr.batch.run_manifest(
+            ops.manifest,
+            ops.output or "IonRMbatch.txt",
+            ops.ionexdir,
+            ops.processes,
+            mode,
+            ops.precision,
+            ops.resume,
+            **options
+        )
+    except (IOError, ValueError) as detail:
+        p.error(str(detail))
+    finish()
+    raise SystemExit
+
+if ops.stations is not None:
+    # several stations, the location comes from the table
+    rawRAscencionDeclination, rawDTime, nameIONEX = argList
+    try:
+        stations = ionfr.stations.read_stations(ops.stations)
+    except (IOError, ValueError) as detail:
+        p.error(str(detail))
 else:
     rawRAscencionDeclination, rawLatitude, rawLongitude, rawDTime, nameIONEX = argList
 
-# predict the ionospheric RM for every hour within a day
-for h in range(24):
-    if h < 10:
-        rawtime = str(rawDTime.split("T")[0] + "T0" + str(h) + ":00:00")
+    # Location of the antenna (degrees, north and east positive)
+    try:
+        lat = degrees(sidereal.parseLat(rawLatitude))
+        lon = degrees(sidereal.parseLon(rawLongitude))
+    except SyntaxError as detail:
+        usage("Invalid location: %s" % detail)
+    if lon > 180.0:
+        lon -= 360.0
+try:
+    date = datetime.combine(sidereal.parseDatetime(rawDTime).date(), datetime.min.time())
+    start = date if ops.start is None else sidereal.parseDatetime(ops.start)
+    stop = date + timedelta(days=1) if ops.stop is None else sidereal.parseDatetime(ops.stop)
+except SyntaxError as detail:
+    usage("Invalid timestamp: %s" % detail)
+
+# predict the ionospheric RM for every hour within a day (or at
+# any other cadence), all the epochs at once
+times = ionfr.epoch_range(start, stop, ops.step)
+try:
+    if ops.stations is not None:
+        # all the stations at once, the sidereal time computed once
+        raDec = rdalaz.checkRADec(rawRAscencionDeclination)
+        RM = ionfr.compute_rm_stations(
+            degrees(raDec.ra),
+            degrees(raDec.dec),
+            [lat for _, lat, _ in stations],
+            [lon for _, _, lon in stations],
+            times,
+            nameIONEX,
+            **options
+        )
+    elif ops.altaz:
+        # The line of sight is fixed in horizon coordinates, so no
+        # sidereal time is needed
+        altAz = aard.checkAltAz(rawRAscencionDeclination)
+        RM = ionfr.compute_rm_altaz(
+            degrees(altAz.az), degrees(altAz.alt), lat, lon, times, nameIONEX, **options
+        )
+    elif ops.products is not None:
+        # the ensemble of the products, then the RM of every product
+        raDec = rdalaz.checkRADec(rawRAscencionDeclination)
+        try:
+            files = [(name, ionfr.ionexfiles.ionex_path(nameIONEX, name, date)) for name in ops.products]
+        except IOError as detail:
+            p.error(str(detail))
+        members, ensemble = ionfr.compute_rm_ensemble(
+            degrees(raDec.ra), degrees(raDec.dec), lat, lon, times, OrderedDict(files), **options
+        )
+        RM = numpy.empty(
+            ensemble.shape, dtype=ionfr.ENSEMBLE_DTYPE.descr + [("rm_" + name, numpy.float64) for name in members]
+        )
+        for name in ionfr.ENSEMBLE_DTYPE.names:
+            RM[name] = ensemble[name]
+        for name, values in members.items():
+            RM["rm_" + name] = values["rm"]
+    elif ops.montecarlo is not None:
+        # the percentiles as extra columns
+        raDec = rdalaz.checkRADec(rawRAscencionDeclination)
+        MC = ionfr.compute_rm_mc(
+            degrees(raDec.ra),
+            degrees(raDec.dec),
+            lat,
+            lon,
+            times,
+            nameIONEX,
+            samples=ops.montecarlo,
+            seed=ops.mcseed,
+        )
+        names = ["rm_p%g" % q for q in montecarlo.Percentiles]
+        RM = numpy.empty(MC.shape, dtype=ionfr.RM_DTYPE.descr + [(name, numpy.float64) for name in names])
+        for name in ionfr.RM_DTYPE.names:
+            RM[name] = MC[name]
+        for i, name in enumerate(names):
+            RM[name] = MC["rmpct"][:, i]
     else:
-        rawtime = str(rawDTime.split("T")[0] + "T" + str(h) + ":00:00")
-
-    hour = rawtime.split("T")[1].split(":")[0]
-    date = rawtime.split("T")[0].split("-")
-    year = rawtime.split("T")[0].split("-")[0]
-    month = rawtime.split("T")[0].split("-")[1]
-    day = rawtime.split("T")[0].split("-")[2]
-
-    # RA and Dec (of the source in degrees) to Alt and Az (radians)
-    # NB only rawtime is passed to rdalaz.alaz because
-    # source RA and Dec are obtained by alaz from sys.argv
-    AzS, AlS, HA, LatO, LonO = rdalaz.alaz(rawtime)
-    ZenS = (pi / 2.0) - AlS
-
-    # output data only when the altitude of the source is above 0 degrees
-    if not AlS * (180.0 / pi) > 0:
-        continue
-
-    # Reading the altitude of the Ionosphere in km (from IONEX file)
-    AltIon = ionheight.calcionheight(nameIONEX)
-    AltIon = AltIon * 1000.0  # km to m
-
-    # Alt and AZ coordinates of the Ionospheric piercing point
-    # Lon and Lat distances wrt the location of the antenna are also
-    # calculated (radians)
-    offLat, offLon, AzPunct, ZenPunct = ippcoor.PuncIonOffset(LatO, AzS, ZenS, AltIon)
-    AlSPunct = (pi / 2.0) - ZenPunct
-
-    # Calculate offset lat and lon in degrees
-    if rawLatitude[-1] == "s":
-        if rawLongitude[-1] == "e":
-            lat = -(LatO + offLat) * 180.0 / pi
-            lon = (LonO + offLon) * 180.0 / pi
-        if rawLongitude[-1] == "w":
-            lat = -(LatO + offLat) * 180.0 / pi
-            lon = -(LonO + offLon) * 180.0 / pi
-    if rawLatitude[-1] == "n":
-        if rawLongitude[-1] == "e":
-            lat = (LatO + offLat) * 180.0 / pi
-            lon = (LonO + offLon) * 180.0 / pi
-        if rawLongitude[-1] == "w":
-            lat = (LatO + offLat) * 180.0 / pi
-            lon = -(LonO + offLon) * 180.0 / pi
-
-    # Calculation of TEC path value for the indicated 'hour' and therefore
-    # at the IPP
-    TECarr = teccalc.calcTEC(
-        lat,
-        lon,
-        nameIONEX,
-    )
-    VTEC = TECarr[int(hour)]
-    TECpath = VTEC * TEC2m2 / cos(ZenPunct)  # from vertical TEC to line of sight TEC
-
-    # Calculation of RMS TEC path value (same as the step above)
-    RMSTECarr = tecrmscalc.calcRMSTEC(
-        lat,
-        lon,
-        nameIONEX,
-    )
-    VRMSTEC = RMSTECarr[int(hour)]
-    RMSTECpath = (
-        VRMSTEC * TEC2m2 / cos(ZenPunct)
-    )  # from vertical RMS TEC to line of sight RMS TEC
-
-    # Calculation of the total magnetic field along the line of sight at the IPP
-    date = datetime(int(year), int(month), int(day))
-    decimalyear = int(year) + (
-        date.timetuple().tm_yday / 365.0
-        if int(year) % 4
-        else date.timetuple().tm_yday / 366.0
-    ) # +/- 1 day fine for this purpose.
-    Xfield, Yfield, Zfield, _ = pyIGRF.calculate.igrf12syn(
-        date=decimalyear,
-        itype=2, # assume sphere (not WGS84 spheroid)
-        alt=(EarthRadius + AltIon) / 1000.0, # from Earth centre in km
-        lat=lat, # deg
-        elong=lon, # deg
-    )
-    Xfield = abs(Xfield) * pow(10, -9) * Tesla2Gauss
-    Yfield = abs(Yfield) * pow(10, -9) * Tesla2Gauss
-    Zfield = abs(Zfield) * pow(10, -9) * Tesla2Gauss
-    Totfield = (
-        Zfield * cos(ZenPunct)
-        + Yfield * sin(ZenPunct) * sin(AzPunct)
-        - Xfield * sin(ZenPunct) * cos(AzPunct)
-    )
+        raDec = rdalaz.checkRADec(rawRAscencionDeclination)
+        RM = ionfr.compute_rm(
+            degrees(raDec.ra), degrees(raDec.dec), lat, lon, times, nameIONEX, **options
+        )
+except ValueError as detail:
+    # (e.g. epochs outside the day of the IONEX file)
+    p.error(str(detail))
 
-    # Saving the Ionosheric RM and its corresponding
-    # rms value to a file for the given 'hour' value
-    IFR = 2.6 * pow(10, -17) * Totfield * TECpath
-    RMSIFR = 2.6 * pow(10, -17) * Totfield * RMSTECpath
-    f = open("" + str(os.getcwd()) + "/IonRM.txt", "a")
-    f.write(
-        ""
-        + str(hour)
-        + " "
-        + str(TECpath)
-        + " "
-        + str(Totfield)
-        + " "
-        + str(IFR)
-        + " "
-        + str(RMSIFR)
-        + "\n"
-    )
+# output data only when the altitude of the source is above 0 degrees.
+# With --stations there is one file per station, IonRM_<name>.txt, or
+# a single --output file with the station name as first column.
+try:
+    if ops.stations is None:
+        writeRM(ops.output or "IonRM.txt", RM, mode=mode, precision=ops.precision)
+    elif ops.output is None:
+        for i, (name, _, _) in enumerate(stations):
+            writeRM("IonRM_%s.txt" % name, RM[i], mode=mode, precision=ops.precision)
+    else:
+        names = numpy.repeat([name for name, _, _ in stations], RM.shape[1])
+        writeRM(ops.output, RM.ravel(), [("station", names)], mode, ops.precision)
+except (IOError, ValueError) as detail:
+    p.error(str(detail))
+finish()
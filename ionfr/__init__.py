@@ -0,0 +1,42 @@
+"""ionFR: ionospheric Faraday rotation for a line of sight, a location and
+an epoch, as a library.
+
+    >>> from ionfr import compute_rm
+    >>> rm = compute_rm(129.273, 6.171, 52.915, 6.870,
+    ...                 ["2011-10-20T03:00:00"], "codg2930.11i")
+    >>> rm["rm"], rm["rmerr"]
+
+The modules of the original ionFR live in the subpackages
+ionfr.sidereal (SiderealPackage), ionfr.puncture
+(PunctureIonosphereCoord), ionfr.ionex (IONEX) and ionfr.igrf (IGRF).
+
+Importing ionfr is cheap: numpy, the IGRF and the sidereal package are
+only imported when one of the names below is first used, so command
+line tools can check their arguments before paying for them.
+"""
+
+__all__ = [
+    "ENSEMBLE_DTYPE",
+    "RM_DTYPE",
+    "SCAN_DTYPE",
+    "compute_rm",
+    "compute_rm_altaz",
+    "compute_rm_ensemble",
+    "compute_rm_mc",
+    "compute_rm_scans",
+    "compute_rm_stations",
+    "epoch_range",
+]
+
+
+def __getattr__(name):
+    # the names of ionfr.compute, imported on first use
+    if name in __all__:
+        from ionfr import compute
+
+        return getattr(compute, name)
+    raise AttributeError("module 'ionfr' has no attribute %r" % name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,276 @@
+"""Batch processing of many observations in one process.
+
+A manifest lists one observation per row, either as CSV (with a header
+line) or as JSON lines, with the fields
+
+    source   RA+dec of the source, as on the ionFRM.py command line
+             (08h37m05.6s+06d10m14.5s) or in degrees ("129.273 6.171")
+    station  latitude and longitude of the station separated by a
+             space (52d54m54.6sn 6d52m11.7se) or in degrees
+    start    first epoch, UTC (2011-10-20T03:00:00)
+    stop     last epoch, excluded
+    cadence  seconds between epochs
+    product  IONEX product (codg, igsg, upcg, ...)
+
+The observations are split by UT day and grouped by (product, day) so
+every IONEX file is parsed once, whatever the number of observations
+that need it. Progress is kept in a journal next to the output (see
+ionfr.journal), so that a run that stopped can be resumed.
+"""
+
+import csv
+import json
+import os
+import re
+from collections import namedtuple
+
+import numpy
+
+from ionfr.compute import RM_DTYPE, compute_rm, epoch_range
+from ionfr.ionex import ionexmaps
+from ionfr.ionexfiles import ionex_name, ionex_path
+from ionfr.journal import Journal, cut_output, fingerprint, journal_name
+from ionfr.sidereal import sidereal
+from ionfr.writers import RMWriter, guess_format
+
+FIELDS = ("source", "station", "start", "stop", "cadence", "product")
+
+# One observation of the manifest. ra, dec, lat and lon are in degrees.
+Job = namedtuple("Job", "id source station ra dec lat lon start stop cadence product")
+
+# Columns of the output: the job (row of the manifest), the IONEX
+# product and the UTC epoch, then those of RM_DTYPE
+BATCH_DTYPE = numpy.dtype(
+    [("job", numpy.int64), ("product", "U16"), ("time", "datetime64[us]")]
+    + [(name, RM_DTYPE[name]) for name in RM_DTYPE.names]
+)
+
+SIGN_PAT = re.compile(r"[\-+]")
+
+
+def parse_source(s):
+    """RA and dec (degrees) of 'RA+dec' or 'ra dec' (degrees)."""
+    parts = s.split()
+    if len(parts) == 2:
+        return float(parts[0]), float(parts[1])
+    m = SIGN_PAT.search(s)
+    if m is None:
+        raise ValueError("Equatorial coordinates must be separated by '+' or '-': '%s'" % s)
+    try:
+        ra = sidereal.hoursToRadians(sidereal.parseHours(s[: m.start()]))
+        dec = sidereal.parseAngle(s[m.end() :])
+    except SyntaxError as detail:
+        raise ValueError("Invalid source '%s': %s" % (s, detail))
+    if m.group() == "-":
+        dec = -dec
+    return numpy.degrees(ra), numpy.degrees(dec)
+
+
+def parse_station(s):
+    """Latitude and longitude (degrees, north and east positive)."""
+    rawLat, rawLon = s.split()
+    try:
+        return float(rawLat), float(rawLon)
+    except ValueError:
+        pass
+    try:
+        lat = numpy.degrees(sidereal.parseLat(rawLat))
+        lon = numpy.degrees(sidereal.parseLon(rawLon))
+    except SyntaxError as detail:
+        raise ValueError("Invalid station '%s': %s" % (s, detail))
+    return lat, (lon - 360.0 if lon > 180.0 else lon)
+
+
+def make_job(id, row):
+    missing = [f for f in FIELDS if not row.get(f)]
+    if missing:
+        raise ValueError("Manifest row %d lacks %s" % (id, ", ".join(missing)))
+    ra, dec = parse_source(row["source"])
+    lat, lon = parse_station(row["station"])
+    return Job(
+        id,
+        row["source"],
+        row["station"],
+        ra,
+        dec,
+        lat,
+        lon,
+        numpy.datetime64(row["start"], "us"),
+        numpy.datetime64(row["stop"], "us"),
+        float(row["cadence"]),
+        row["product"],
+    )
+
+
+def read_manifest(filename):
+    """The observations of a CSV or JSON lines manifest, as Jobs."""
+    with open(filename) as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        rows = list(csv.DictReader(line for line in text.splitlines() if line.strip()))
+    return [make_job(i, row) for i, row in enumerate(rows)]
+
+
+def group_by_day(jobs):
+    """{(product, day): [(job, epochs), ...]} with the epochs of every
+    job split by UT day, in a deterministic order."""
+    groups = {}
+    for job in jobs:
+        times = epoch_range(job.start, job.stop, job.cadence)
+        days = times.astype("datetime64[D]")
+        for day in numpy.unique(days):
+            groups.setdefault((job.product, day), []).append((job, times[days == day]))
+    return dict(sorted(groups.items(), key=lambda kv: (kv[0][1], kv[0][0])))
+
+
+def missing_ionex(jobs, ionexdir=".", done=()):
+    """Names of the IONEX files 'jobs' need that are not in ionexdir
+    (leaving out the (product, day) units in 'done')."""
+    missing = []
+    for product, day in group_by_day(jobs):
+        if (product, day) in done:
+            continue
+        try:
+            ionex_path(ionexdir, product, day)
+        except IOError:
+            missing.append(ionex_name(product, day))
+    return missing
+
+
+def run_jobs(jobs, ionexdir=".", done=(), **options):
+    """Compute every job; yields (job, times, rm) per job and UT day.
+
+    The IONEX files are read one (product, day) at a time and
+    released afterwards; the (product, day) units in 'done' are
+    skipped. 'options' are passed on to compute_rm.
+    """
+    for (product, day), segments in group_by_day(jobs).items():
+        if (product, day) in done:
+            continue
+        path = ionex_path(ionexdir, product, day)
+        for result in compute_group(path, day, segments, options):
+            yield result
+        ionexmaps.dropIONEX(path)
+
+
+def compute_group(path, day, segments, options):
+    """[(job, times, rm), ...] for the segments of one (product, day)
+    from the IONEX file 'path'.
+
+    The file must hold the maps of 'day' (its EPOCH OF FIRST MAP), so
+    that a mislabelled file fails the unit.
+    """
+    ionex = ionexmaps.readIONEX(path)
+    first = numpy.datetime64("%04d-%02d-%02d" % ionex.epoch, "D")
+    if first != numpy.datetime64(day, "D"):
+        raise ValueError("%s holds the maps of %s, not of %s" % (path, first, numpy.datetime64(day, "D")))
+    return [
+        (job, times, compute_rm(job.ra, job.dec, job.lat, job.lon, times, ionex, **options))
+        for job, times in segments
+    ]
+
+
+def last_day(job):
+    """The UT day of the last epoch of 'job'."""
+    return epoch_range(job.start, job.stop, job.cadence)[-1].astype("datetime64[D]")
+
+
+def result_rows(job, times, rm):
+    """The output rows (BATCH_DTYPE) of a result of run_jobs, without
+    the epochs below the horizon."""
+    keep = ~numpy.isnan(rm["rm"])
+    rows = numpy.empty(keep.sum(), dtype=BATCH_DTYPE)
+    rows["job"] = job.id
+    rows["product"] = job.product
+    rows["time"] = times[keep]
+    for name in RM_DTYPE.names:
+        rows[name] = rm[name][keep]
+    return rows
+
+
+def write_results(results, output, mode="w", precision=None, journal=None):
+    """Write the results of run_jobs to 'output' (any format of
+    ionfr.writers), leaving out the epochs below the horizon.
+
+    With a Journal every (product, day) is recorded in it once its
+    rows are on disk.
+    """
+    with RMWriter(output, BATCH_DTYPE, mode=mode, precision=precision, header=True) as writer:
+        if journal is not None:
+            journal.start(writer.flush())
+        unit, finished = None, []
+        for job, times, rm in results:
+            # the results of a unit come one after the other
+            day = times[0].astype("datetime64[D]")
+            if journal is not None and (job.product, day) != unit:
+                if unit is not None:
+                    journal.record(unit, finished, writer.flush())
+                unit, finished = (job.product, day), []
+            writer.write(result_rows(job, times, rm))
+            if journal is not None and day == last_day(job):
+                finished.append(job.id)
+        if unit is not None:
+            journal.record(unit, finished, writer.flush())
+
+
+def run_fingerprint(manifest, output, settings):
+    """The fingerprint (see ionfr.journal) of a manifest run with
+    'settings'."""
+    extra = {"teccache": settings["teccache"]} if settings.get("teccache") else {}
+    return fingerprint(
+        manifest, output=guess_format(output), precision=settings["precision"], options=settings["options"], **extra
+    )
+
+
+def run_manifest(manifest, output, ionexdir=".", processes=1, mode="w", precision=None, resume=False, **options):
+    """Process a whole manifest and write all results to 'output'.
+
+    With processes other than 1 the IONEX days are shared among that
+    many worker processes (0 or None: one per core), see
+    ionfr.scheduler. The progress is kept in <output>.journal (not for
+    .npz outputs, which are written at the end); with resume=True a
+    run that stopped goes on from where its journal ends, cutting the
+    output back to the last (product, day) it recorded. The journal
+    also tags every (product, day) with the digests of its inputs, for
+    ionfr.refresh.
+    """
+    jobs = read_manifest(manifest)
+    if options.get("fieldgrid"):
+        options = dict(options, fieldgrid=os.path.abspath(options["fieldgrid"]))
+    journal = None
+    done = set()
+    if guess_format(output) != "npz":
+        settings = {
+            "manifest": os.path.abspath(manifest),
+            "ionexdir": os.path.abspath(ionexdir),
+            "precision": precision,
+            "options": options,
+        }
+        # (the TEC cache changes the results a little)
+        teccache = ionexmaps.tecCacheSettings()
+        if teccache is not None:
+            settings["teccache"] = teccache
+        run = run_fingerprint(manifest, output, settings)
+        journal = Journal(journal_name(output), run, resume, settings)
+        if journal.offset is not None:
+            cut_output(output, journal.offset)
+            mode = "a"
+            done = journal.units()
+    elif resume:
+        raise ValueError(".npz outputs cannot be resumed")
+    missing = missing_ionex(jobs, ionexdir, done)
+    if missing:
+        raise IOError("IONEX files not found in %s: %s" % (ionexdir, " ".join(missing)))
+    if processes == 1:
+        results = run_jobs(jobs, ionexdir, done, **options)
+    else:
+        from ionfr.scheduler import run_jobs_parallel
+
+        results = run_jobs_parallel(jobs, ionexdir, processes, done, **options)
+    try:
+        write_results(results, output, mode, precision, journal)
+    finally:
+        if journal is not None:
+            journal.close()
@@ -0,0 +1,546 @@
+"""Ionospheric Faraday rotation for arrays of epochs.
+
+compute_rm() and compute_rm_altaz() do what ionFRM.py does, without
+touching sys.argv or writing any file: they return a structured numpy
+array (see RM_DTYPE) with one row per requested epoch. Epochs at which
+the line of sight is below the horizon are returned as NaN; epochs
+outside the maps of the IONEX file raise ValueError.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy
+
+from ionfr.ionex import ionexmaps
+from ionfr.puncture import multishell
+from ionfr.puncture import driftscan
+from ionfr.puncture import montecarlo
+from ionfr.sidereal import siderealarray
+
+# hour:    UT hours since the start of the IONEX day
+# tecpath: TEC along the line of sight (m^-2)
+# bfield:  geomagnetic field along the line of sight (Gauss)
+# rm:      ionospheric Faraday rotation (rad m^-2)
+# rmerr:   its uncertainty from the RMS TEC maps (rad m^-2)
+RM_DTYPE = numpy.dtype(
+    [
+        ("hour", numpy.float64),
+        ("tecpath", numpy.float64),
+        ("bfield", numpy.float64),
+        ("rm", numpy.float64),
+        ("rmerr", numpy.float64),
+    ]
+)
+
+
+# hour:     UT hours since the start of the IONEX day
+# tecpath, rm, rmerr: their means over the products (as in RM_DTYPE)
+# rmspread: standard deviation of the RM of the products
+ENSEMBLE_DTYPE = numpy.dtype(
+    [
+        ("hour", numpy.float64),
+        ("tecpath", numpy.float64),
+        ("rm", numpy.float64),
+        ("rmerr", numpy.float64),
+        ("rmspread", numpy.float64),
+    ]
+)
+
+# start, stop: UT hours of the scan since the start of the IONEX day
+# tecpath, rm, rmerr: their means over the part of the scan the source
+#          is up (as in RM_DTYPE; the RM errors of a scan come from
+#          the same maps, so their mean is the error of the mean RM)
+# up:      the fraction of the scan the source is up
+# error:   estimate of the error of the mean RM from the quadrature
+SCAN_DTYPE = numpy.dtype(
+    [
+        ("start", numpy.float64),
+        ("stop", numpy.float64),
+        ("tecpath", numpy.float64),
+        ("rm", numpy.float64),
+        ("rmerr", numpy.float64),
+        ("up", numpy.float64),
+        ("error", numpy.float64),
+    ]
+)
+
+# 15-point Gauss-Kronrod rule on [-1, 1] and the 7-point Gauss rule
+# embedded in it (nodes 1, 3, ..., 13), as in QUADPACK's qk15
+_XK = numpy.array(
+    [
+        0.991455371120812639206854697526329,
+        0.949107912342758524526189684047851,
+        0.864864423359769072789712788640926,
+        0.741531185599394439863864773280788,
+        0.586087235467691130294144845693013,
+        0.405845151377397166906606412076961,
+        0.207784955007898467600689403773245,
+        0.0,
+    ]
+)
+_WK = numpy.array(
+    [
+        0.022935322010529224963732008058970,
+        0.063092092629978553290700663189204,
+        0.104790010322250183839876322541518,
+        0.140653259715525918745189590510238,
+        0.169004726639267902826583426598550,
+        0.190350578064785409913256402421014,
+        0.204432940075298892414161999234649,
+        0.209482141084727828012999174891714,
+    ]
+)
+_WG = numpy.array(
+    [
+        0.0,
+        0.129484966168869693270611432679082,
+        0.0,
+        0.279705391489276667901467771423780,
+        0.0,
+        0.381830050505118944950369775488975,
+        0.0,
+        0.417959183673469387755102040816327,
+    ]
+)
+KRONROD_NODES = numpy.concatenate([-_XK[:-1], _XK[::-1]])
+KRONROD_WEIGHTS = numpy.concatenate([_WK[:-1], _WK[::-1]])
+GAUSS_WEIGHTS = numpy.concatenate([_WG[:-1], _WG[::-1]])
+
+
+def load_ionex(ionex):
+    """An ionexmaps.IonexData for a file name (parsed once per process)."""
+    if isinstance(ionex, ionexmaps.IonexData):
+        return ionex
+    return ionexmaps.readIONEX(ionex)
+
+
+def to_datetime64(times):
+    """Epochs (datetimes, ISO strings or datetime64) as datetime64[us]."""
+    if isinstance(times, (str, datetime, numpy.datetime64)):
+        times = [times]
+    return numpy.atleast_1d(numpy.asarray(times, dtype="datetime64[us]"))
+
+
+def epoch_range(start, stop, step):
+    """UTC epochs from start (included) to stop (excluded) every 'step' s."""
+    start = numpy.datetime64(start, "us")
+    stop = numpy.datetime64(stop, "us")
+    return numpy.arange(start, stop, numpy.timedelta64(int(round(step * 1e6)), "us"))
+
+
+def decimal_year(year, month, day):
+    """Epoch of the geomagnetic field for a (UT) day."""
+    yday = datetime(year, month, day).timetuple().tm_yday
+    # +/- 1 day fine for this purpose.
+    return year + (yday / 365.0 if year % 4 else yday / 366.0)
+
+
+def ionex_hours(ionex, times):
+    """UT hours of the epochs since the first map of the IONEX file.
+
+    The maps are not extrapolated: epochs before the first map or
+    after the last one raise ValueError.
+    """
+    start = numpy.datetime64("%04d-%02d-%02d" % ionex.epoch, "us")
+    hours = (times - start) / numpy.timedelta64(3600, "s")
+    last = ionex.tecMaps.shape[0] - 1
+    if hours.size and (hours.min() < 0 or hours.max() > last):
+        raise ValueError(
+            "Epochs from %s to %s are outside the maps of the IONEX file (%s, hours 0 to %d)"
+            % (times.min(), times.max(), "%04d-%02d-%02d" % ionex.epoch, last)
+        )
+    return hours
+
+
+def _empty(hours):
+    out = numpy.full(hours.shape, numpy.nan, dtype=RM_DTYPE)
+    out["hour"] = hours
+    return out
+
+
+def compute_rm(
+    ra,
+    dec,
+    lat,
+    lon,
+    times,
+    ionex,
+    shells=1,
+    profile="chapman",
+    scale=multishell.ScaleHeight,
+    fieldgrid=None,
+):
+    """Ionospheric RM towards (ra, dec) seen from (lat, lon) at 'times'.
+
+    ra, dec, lat and lon are in degrees (north and east positive),
+    times is a sequence of UTC epochs within the day of the IONEX file
+    'ionex' (a file name or an ionexmaps.IonexData), at any cadence (see
+    epoch_range); all of them are evaluated at once. ra, dec, lat and
+    lon can also be arrays with one value per epoch, so that unrelated
+    queries on the same IONEX file share one evaluation. With shells > 1
+    the line of sight is integrated through that many shells weighted
+    by 'profile' (see multishell.calcMultiShell); 'fieldgrid' is a
+    directory of daily field grids to interpolate B from.
+    """
+    ionex = load_ionex(ionex)
+    times = to_datetime64(times)
+    out = _empty(ionex_hours(ionex, times))
+
+    # RA and Dec of the source to Alt and Az (radians) at every epoch
+    latRad = numpy.radians(lat)
+    lonRad = numpy.radians(lon)
+    AzS, AlS, _ = siderealarray.altAz(numpy.radians(ra), numpy.radians(dec), latRad, lonRad, times)
+
+    # output data only when the altitude of the source is above 0 degrees
+    up = AlS > 0
+    _line_of_sight(
+        out, up, latRad, lonRad, AzS[up], (numpy.pi / 2.0) - AlS[up], ionex, shells, profile, scale, fieldgrid
+    )
+    return out
+
+
+def compute_rm_stations(
+    ra,
+    dec,
+    lats,
+    lons,
+    times,
+    ionex,
+    shells=1,
+    profile="chapman",
+    scale=multishell.ScaleHeight,
+    fieldgrid=None,
+):
+    """Ionospheric RM towards (ra, dec) from several stations at once.
+
+    As compute_rm, with sequences of station latitudes and longitudes
+    (degrees). The sidereal time of the epochs is computed once and the
+    piercing points, TEC and field of all the stations and epochs in
+    one pass; the result has one row per station and one column per
+    epoch.
+    """
+    ionex = load_ionex(ionex)
+    times = to_datetime64(times)
+    latRad = numpy.radians(numpy.atleast_1d(numpy.asarray(lats, dtype=float)))[:, None]
+    lonRad = numpy.radians(numpy.atleast_1d(numpy.asarray(lons, dtype=float)))[:, None]
+    if latRad.shape != lonRad.shape:
+        raise ValueError("One longitude per station latitude is needed")
+    out = _empty(numpy.repeat(ionex_hours(ionex, times)[None, :], len(latRad), axis=0))
+
+    AzS, AlS, _ = siderealarray.altAz(numpy.radians(ra), numpy.radians(dec), latRad, lonRad, times)
+    up = AlS > 0
+    _line_of_sight(
+        out, up, latRad, lonRad, AzS[up], (numpy.pi / 2.0) - AlS[up], ionex, shells, profile, scale, fieldgrid
+    )
+    return out
+
+
+def compute_rm_ensemble(
+    ra,
+    dec,
+    lat,
+    lon,
+    times,
+    ionexes,
+    shells=1,
+    profile="chapman",
+    scale=multishell.ScaleHeight,
+    fieldgrid=None,
+):
+    """Ionospheric RM from several IONEX products of one day, and their
+    ensemble mean and spread.
+
+    As compute_rm, with 'ionexes' a dict {product: IONEX file name or
+    ionexmaps.IonexData} (or a sequence of file names, named by
+    themselves). The sidereal time is computed once, and the piercing
+    points and the field once for all the products with the same shell
+    height (see multishell.calcEnsemble). Returns (members, ensemble):
+    an OrderedDict {product: RM_DTYPE array} and an ENSEMBLE_DTYPE
+    array, the spread being the standard deviation of the RM over the
+    products (ddof 1).
+    """
+    if not hasattr(ionexes, "items"):
+        ionexes = OrderedDict((name, name) for name in ionexes)
+    datasets = OrderedDict((name, load_ionex(ionex)) for name, ionex in ionexes.items())
+    if not datasets:
+        raise ValueError("At least one IONEX product is needed")
+    first = next(iter(datasets.values()))
+    if any(data.epoch != first.epoch for data in datasets.values()):
+        raise ValueError("The IONEX files are not all of the same day")
+    times = to_datetime64(times)
+    hours = ionex_hours(first, times)
+    members = OrderedDict((name, _empty(hours)) for name in datasets)
+
+    latRad = numpy.radians(lat)
+    lonRad = numpy.radians(lon)
+    AzS, AlS, _ = siderealarray.altAz(numpy.radians(ra), numpy.radians(dec), latRad, lonRad, times)
+    up = AlS > 0
+    if up.any():
+        if shells == 1:
+            bottom = top = None
+        else:
+            bottom, top = multishell.ShellBottom, multishell.ShellTop
+        results = multishell.calcEnsemble(
+            numpy.broadcast_to(latRad, up.shape)[up],
+            numpy.broadcast_to(lonRad, up.shape)[up],
+            AzS[up],
+            (numpy.pi / 2.0) - AlS[up],
+            hours[up],
+            decimal_year(*first.epoch),
+            list(datasets.values()),
+            nShells=shells,
+            profile=profile,
+            scale=scale,
+            bottom=bottom,
+            top=top,
+            gridDir=fieldgrid,
+        )
+        for out, res in zip(members.values(), results):
+            for name, values in zip(RM_DTYPE.names[1:], res):
+                out[name][up] = values
+
+    ensemble = numpy.full(hours.shape, numpy.nan, dtype=ENSEMBLE_DTYPE)
+    ensemble["hour"] = hours
+    for name in ("tecpath", "rm", "rmerr"):
+        ensemble[name] = numpy.mean([out[name] for out in members.values()], axis=0)
+    if len(members) > 1:
+        ensemble["rmspread"] = numpy.std([out["rm"] for out in members.values()], axis=0, ddof=1)
+    return members, ensemble
+
+
+def compute_rm_mc(
+    ra,
+    dec,
+    lat,
+    lon,
+    times,
+    ionex,
+    samples=1000,
+    percentiles=montecarlo.Percentiles,
+    height_sigma=montecarlo.HeightSigma,
+    field_sigma=montecarlo.FieldSigma,
+    corr_length=montecarlo.CorrLength,
+    corr_time=montecarlo.CorrTime,
+    seed=None,
+):
+    """Percentiles of the RM over Monte Carlo realisations of the TEC,
+    the shell height and the field (thin shell).
+
+    As compute_rm, with an extra field 'rmpct' holding the given
+    percentiles (0-100) of the RM at every epoch. The TEC errors are
+    drawn from the RMS maps, correlated over corr_length degrees and
+    corr_time hours; the shell height is drawn around the IONEX height
+    with height_sigma (m) and the field scaled by 1 + field_sigma n
+    (see montecarlo.calcMonteCarlo). All the samples and epochs are
+    evaluated as one array computation; 'seed' makes the draws
+    repeatable.
+    """
+    ionex = load_ionex(ionex)
+    times = to_datetime64(times)
+    hours = ionex_hours(ionex, times)
+    dtype = numpy.dtype(RM_DTYPE.descr + [("rmpct", numpy.float64, (len(percentiles),))])
+    out = numpy.full(hours.shape, numpy.nan, dtype=dtype)
+    out["hour"] = hours
+
+    # the Alt and Az of the source once, for the nominal RM (that of
+    # compute_rm) and the realisations
+    latRad = numpy.radians(lat)
+    lonRad = numpy.radians(lon)
+    AzS, AlS, _ = siderealarray.altAz(numpy.radians(ra), numpy.radians(dec), latRad, lonRad, times)
+    up = AlS > 0
+    ZenS = (numpy.pi / 2.0) - AlS[up]
+    _line_of_sight(out, up, latRad, lonRad, AzS[up], ZenS, ionex, 1, "chapman", multishell.ScaleHeight, None)
+    if up.any():
+        out["rmpct"][up] = montecarlo.calcMonteCarlo(
+            numpy.broadcast_to(latRad, up.shape)[up],
+            numpy.broadcast_to(lonRad, up.shape)[up],
+            AzS[up],
+            ZenS,
+            out["hour"][up],
+            decimal_year(*ionex.epoch),
+            ionex,
+            nSamples=samples,
+            percentiles=percentiles,
+            heightSigma=height_sigma,
+            fieldSigma=field_sigma,
+            corrLength=corr_length,
+            corrTime=corr_time,
+            seed=seed,
+        ).T
+    return out
+
+
+def compute_rm_scans(
+    ra,
+    dec,
+    lat,
+    lon,
+    starts,
+    stops,
+    ionex,
+    tol=1e-3,
+    rounds=8,
+    shells=1,
+    profile="chapman",
+    scale=multishell.ScaleHeight,
+    fieldgrid=None,
+):
+    """Mean ionospheric RM over scans from 'starts' to 'stops'.
+
+    As compute_rm, for sequences of scan start and stop epochs (within
+    the day of the IONEX file) instead of single epochs; the result
+    has one row per scan (see SCAN_DTYPE). The means are integrals
+    over the scans by 15-point Gauss-Kronrod quadrature, the embedded
+    7-point Gauss rule estimating the error. Every round evaluates the
+    nodes of all the (parts of) scans still to do in one compute_rm
+    call, and the parts whose mean RM (or time up) is not yet within
+    'tol' (rad m^-2) are cut in two for the next round, for at most
+    'rounds' rounds. Scans during which the source sets or rises are
+    averaged over the time it is up.
+    """
+    ionex = load_ionex(ionex)
+    a = ionex_hours(ionex, to_datetime64(starts))
+    b = ionex_hours(ionex, to_datetime64(stops))
+    if a.shape != b.shape:
+        raise ValueError("One stop per scan start is needed")
+    if numpy.any(b < a):
+        raise ValueError("Scans cannot stop before they start")
+    options = dict(shells=shells, profile=profile, scale=scale, fieldgrid=fieldgrid)
+    day = numpy.datetime64("%04d-%02d-%02d" % ionex.epoch, "us")
+
+    # integrals of tecpath, rm, rmerr and of the time up, per scan
+    sums = numpy.zeros((4, len(a)))
+    up = numpy.zeros(len(a))
+    error = numpy.zeros(len(a))
+    scan = numpy.arange(len(a))
+    lo, hi = a, b
+    for n in range(rounds):
+        if not len(scan):
+            break
+        half = 0.5 * (hi - lo)
+        nodes = 0.5 * (hi + lo)[:, None] + half[:, None] * KRONROD_NODES
+        times = day + numpy.round(nodes * 3.6e9).astype("timedelta64[us]")
+        rm = compute_rm(ra, dec, lat, lon, times.ravel(), ionex, **options).reshape(nodes.shape)
+
+        # the source up (1) or not (0) at every node, the values 0 when
+        # it is not
+        seen = ~numpy.isnan(rm["rm"])
+        values = numpy.stack([numpy.where(seen, rm[name], 0.0) for name in ("tecpath", "rm", "rmerr")] + [seen])
+        kronrod = half * (values * KRONROD_WEIGHTS).sum(axis=-1)
+        gauss = half * (values * GAUSS_WEIGHTS).sum(axis=-1)
+        diff = numpy.abs(kronrod - gauss)
+
+        # done: the mean RM and the time up of the part within 'tol'
+        done = (diff[1] <= tol * 2.0 * half) & (diff[3] <= tol * 2.0 * half)
+        if n == rounds - 1:
+            done[:] = True
+        for i in range(3):
+            numpy.add.at(sums[i], scan[done], kronrod[i, done])
+        numpy.add.at(up, scan[done], kronrod[3, done])
+        numpy.add.at(error, scan[done], diff[1, done])
+
+        # the rest cut in two
+        mid = 0.5 * (lo + hi)
+        todo = ~done
+        scan = numpy.repeat(scan[todo], 2)
+        lo = numpy.stack([lo[todo], mid[todo]], axis=1).ravel()
+        hi = numpy.stack([mid[todo], hi[todo]], axis=1).ravel()
+
+    out = numpy.full(len(a), numpy.nan, dtype=SCAN_DTYPE)
+    out["start"], out["stop"] = a, b
+    length = b - a
+    point = length == 0
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        for i, name in enumerate(("tecpath", "rm", "rmerr")):
+            out[name] = numpy.where(up > 0, sums[i] / up, numpy.nan)
+        out["up"] = numpy.where(point, 0.0, up / length)
+        out["error"] = numpy.where(up > 0, error / up, numpy.nan)
+    if point.any():
+        # scans of no length are single epochs
+        times = day + numpy.round(a[point] * 3.6e9).astype("timedelta64[us]")
+        rm = compute_rm(ra, dec, lat, lon, times, ionex, **options)
+        for name in ("tecpath", "rm", "rmerr"):
+            out[name][point] = rm[name]
+        out["up"][point] = ~numpy.isnan(rm["rm"])
+        out["error"][point] = numpy.where(numpy.isnan(rm["rm"]), numpy.nan, 0.0)
+    return out
+
+
+def compute_rm_altaz(
+    az,
+    alt,
+    lat,
+    lon,
+    times,
+    ionex,
+    shells=1,
+    profile="chapman",
+    scale=multishell.ScaleHeight,
+    fieldgrid=None,
+):
+    """Ionospheric RM for a line of sight fixed at (az, alt) (degrees).
+
+    As compute_rm, for drift scans and zenith pointing. No sidereal
+    time is needed and, for a thin shell, the piercing point and the
+    field are computed once for all the epochs.
+    """
+    ionex = load_ionex(ionex)
+    times = to_datetime64(times)
+    out = _empty(ionex_hours(ionex, times))
+    if alt <= 0:
+        return out
+
+    latRad = numpy.radians(lat)
+    lonRad = numpy.radians(lon)
+    if shells == 1:
+        res = driftscan.calcFixedAltAz(
+            latRad,
+            lonRad,
+            numpy.radians(az),
+            numpy.radians(alt),
+            out["hour"],
+            decimal_year(*ionex.epoch),
+            ionex,
+            gridDir=fieldgrid,
+        )
+        for name, values in zip(RM_DTYPE.names[1:], res):
+            out[name] = values
+        return out
+
+    up = numpy.ones(len(times), dtype=bool)
+    AzS = numpy.full(len(times), numpy.radians(az))
+    ZenS = numpy.full(len(times), numpy.radians(90.0 - alt))
+    _line_of_sight(out, up, latRad, lonRad, AzS, ZenS, ionex, shells, profile, scale, fieldgrid)
+    return out
+
+
+def _line_of_sight(out, up, latRad, lonRad, AzS, ZenS, ionex, shells, profile, scale, fieldgrid):
+    # TEC, B and RM along the line of sight for the epochs 'up', a
+    # thin shell at the IONEX height being the one shell case. The
+    # station coordinates broadcast against 'up'.
+    if not up.any():
+        return
+    latRad = numpy.broadcast_to(latRad, up.shape)[up]
+    lonRad = numpy.broadcast_to(lonRad, up.shape)[up]
+    if shells == 1:
+        bottom = top = ionex.height * 1000.0
+    else:
+        bottom, top = multishell.ShellBottom, multishell.ShellTop
+    res = multishell.calcMultiShell(
+        latRad,
+        lonRad,
+        AzS,
+        ZenS,
+        out["hour"][up],
+        decimal_year(*ionex.epoch),
+        ionex,
+        nShells=shells,
+        profile=profile,
+        scale=scale,
+        bottom=bottom,
+        top=top,
+        gridDir=fieldgrid,
+    )
+    for name, values in zip(RM_DTYPE.names[1:], res):
+        out[name][up] = values
@@ -0,0 +1,312 @@
+"""Correct Stokes Q/U data for the ionospheric Faraday rotation
+(ionfr-derotate).
+
+The RM of an ionFRM.py output (any of its formats) is interpolated to
+the epochs of the data, and the polarisation angle of every (time,
+frequency) sample is turned back by RM lambda^2:
+
+    Q' + iU' = (Q + iU) exp(-2i RM lambda^2)
+
+Q and U are .npy cubes with time on the first axis, frequency on the
+second and anything else (baselines, ...) after them. They are worked
+through in chunks of whole time rows of about 'chunk' bytes, on
+'threads' threads, every chunk memory mapped on its own (NpyRows), so
+cubes much larger than memory are corrected in one pass. The corrected
+data go to new .npy files of the same shape and type, or back into Q
+and U.
+
+ionFR gives the magnitude of the RM along the field (see README.md):
+for a station below the magnetic equator the RM is negative, which
+sign=-1 (--south) applies before the data are turned.
+
+    ionfr-derotate IonRM.txt Q.npy U.npy --freqs FREQS (--times T.npy |
+        --start HOUR --step SECONDS) [--output-q Q2.npy --output-u U2.npy]
+        [--south]
+"""
+
+import csv
+import json
+import optparse as op
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import numpy.lib.format as npformat
+
+from ionfr.writers import guess_format
+
+SpeedOfLight = 299792458.0  # m/s
+
+# Bytes of data (of both Q and U) taken at a time by every thread
+ChunkBytes = 64 << 20
+
+
+def read_rm(filename, job=None, station=None):
+    """(hours, rm) of an ionFRM.py output, sorted by hour. A --manifest
+    output needs the 'job' and a --stations output the 'station' to
+    take; of a --products output the RM is the mean of the products.
+    Text outputs are those of IonRM.txt or start with a '# column
+    names' line."""
+    fmt = guess_format(filename)
+    if fmt in ("npy", "npz"):
+        data = numpy.load(filename)
+        columns = {name: numpy.asarray(data[name]) for name in (data.dtype.names if fmt == "npy" else data.files)}
+    elif fmt == "csv":
+        with open(filename) as f:
+            rows = list(csv.DictReader(f))
+        columns = {name: numpy.array([row[name] for row in rows]) for name in (rows[0] if rows else ())}
+    elif fmt == "jsonl":
+        with open(filename) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        columns = {name: numpy.array([row[name] for row in rows]) for name in (rows[0] if rows else ())}
+    else:
+        with open(filename) as f:
+            first = f.readline()
+        if first.startswith("#"):
+            names = first[1:].split()
+        else:
+            # IonRM.txt
+            names = ["hour", "tecpath", "bfield", "rm", "rmerr"]
+        text = numpy.loadtxt(filename, dtype=str, ndmin=2, skiprows=int(first.startswith("#")))
+        if text.size and text.shape[1] != len(names):
+            raise ValueError("%s: expected the columns %s" % (filename, " ".join(names)))
+        columns = {name: text[:, i] for i, name in enumerate(names)}
+    if "hour" not in columns or "rm" not in columns:
+        raise ValueError("%s has no hour and rm columns" % filename)
+
+    keep = numpy.ones(len(columns["hour"]), dtype=bool)
+    for name, value in (("job", job), ("station", station)):
+        if name not in columns:
+            continue
+        if value is None:
+            raise ValueError("%s holds several %ss; choose one with --%s" % (filename, name, name))
+        keep &= columns[name].astype(str) == str(value)
+    hours = columns["hour"][keep].astype(float)
+    rm = numpy.array([numpy.nan if v is None else v for v in columns["rm"][keep].tolist()], dtype=float)
+    if not len(hours):
+        raise ValueError("%s has no RM for this selection" % filename)
+    if numpy.any(numpy.diff(hours) <= 0):
+        raise ValueError("The hours of %s do not increase (a job over several days?)" % filename)
+    return hours, rm
+
+
+def rm_at(hours, rm, times):
+    """The RM at 'times' (hours), linearly interpolated between the
+    rows of the RM around them. The times must be within those of the
+    RM, and not in a gap of it: the rows around a time must both have
+    an RM (not NaN) and be at most half as far again apart as the
+    usual (median) step of the RM, or the source was down there."""
+    times = numpy.asarray(times, dtype=float)
+    hours = numpy.asarray(hours, dtype=float)
+    rm = numpy.asarray(rm, dtype=float)
+    if not len(hours) or times.min() < hours[0] or times.max() > hours[-1]:
+        raise ValueError("The data go beyond the epochs of the RM (source down, or another day?)")
+    # the rows at or after every time, and those before them
+    after = numpy.searchsorted(hours, times)
+    on = hours[after] == times
+    before = numpy.where(on, after, after - 1)
+    step = numpy.median(numpy.diff(hours)) if len(hours) > 1 else 0.0
+    down = numpy.isnan(rm[before]) | numpy.isnan(rm[after]) | (hours[after] - hours[before] > 1.5 * step)
+    if down.any():
+        raise ValueError(
+            "The data at %g h fall in a gap of the RM (source down?)" % times.ravel()[numpy.argmax(down.ravel())]
+        )
+    good = ~numpy.isnan(rm)
+    return numpy.interp(times, hours[good], rm[good])
+
+
+def derotate(q, u, rm, freqs, qout=None, uout=None, chunk=ChunkBytes, threads=1):
+    """Turn back the polarisation angle of Q and U (arrays, e.g. memory
+    maps, of (time, frequency, ...)) by rm lambda^2, with 'rm' one value
+    per time and 'freqs' one frequency (Hz) per channel. The results go
+    to qout and uout (arrays of the same shape), by default back into
+    q and u. The rows of time are taken in chunks of about 'chunk'
+    bytes of data, on 'threads' threads."""
+    qout = q if qout is None else qout
+    uout = u if uout is None else uout
+    rm = numpy.asarray(rm, dtype=float)
+    lambda2 = (SpeedOfLight / numpy.asarray(freqs, dtype=float)) ** 2
+    if q.shape != u.shape or q.shape != qout.shape or q.shape != uout.shape:
+        raise ValueError("Q and U (and their outputs) must have the same shape")
+    if q.ndim < 2 or q.shape[0] != len(rm) or q.shape[1] != len(lambda2):
+        raise ValueError(
+            "The data (%s) must have one row per epoch (%d) and one column per frequency (%d)"
+            % ("x".join(map(str, q.shape)), len(rm), len(lambda2))
+        )
+    rowBytes = 2 * max(1, int(numpy.prod(q.shape[1:]))) * 8
+    rows = max(1, chunk // rowBytes)
+    more = (1,) * (q.ndim - 2)
+
+    def work(start):
+        stop = start + rows
+        angle = 2.0 * rm[start:stop, None] * lambda2
+        c = numpy.cos(angle).reshape(angle.shape + more)
+        s = numpy.sin(angle).reshape(angle.shape + more)
+        # (copies, so that the data can be written back in place)
+        qs = numpy.array(q[start:stop], dtype=float)
+        us = numpy.array(u[start:stop], dtype=float)
+        qout[start:stop] = c * qs + s * us
+        uout[start:stop] = c * us - s * qs
+
+    starts = range(0, len(rm), rows)
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            for _ in pool.map(work, starts):
+                pass
+    else:
+        for start in starts:
+            work(start)
+    for a in (qout, uout):
+        if isinstance(a, numpy.memmap):
+            a.flush()
+
+
+class NpyRows:
+    """The .npy file 'filename' as an array of which only rows (the
+    first axis) are read or written, every slice of rows mapped on its
+    own and unmapped when done, so that the pages of a file much
+    larger than memory do not pile up in the process."""
+
+    def __init__(self, filename, mode="r"):
+        self.filename = filename
+        self.mode = mode
+        with open(filename, "rb") as f:
+            if npformat.read_magic(f) == (1, 0):
+                self.shape, fortran, self.dtype = npformat.read_array_header_1_0(f)
+            else:
+                self.shape, fortran, self.dtype = npformat.read_array_header_2_0(f)
+            self.offset = f.tell()
+        if fortran or self.dtype.kind != "f":
+            raise ValueError("%s must be a C-ordered array of floats" % filename)
+        self.ndim = len(self.shape)
+        self.rowBytes = int(numpy.prod(self.shape[1:])) * self.dtype.itemsize
+
+    def _map(self, rows, mode):
+        start, stop, step = rows.indices(self.shape[0])
+        if step != 1:
+            raise ValueError("Only contiguous rows can be mapped")
+        return numpy.memmap(
+            self.filename,
+            self.dtype,
+            mode,
+            offset=self.offset + start * self.rowBytes,
+            shape=(max(stop - start, 0),) + tuple(self.shape[1:]),
+        )
+
+    def __getitem__(self, rows):
+        m = self._map(rows, "r")
+        data = numpy.array(m)
+        del m
+        return data
+
+    def __setitem__(self, rows, values):
+        if self.mode == "r":
+            raise ValueError("%s is open for reading only" % self.filename)
+        m = self._map(rows, "r+")
+        m[...] = values
+        m.flush()
+        del m
+
+
+def derotate_files(
+    rmfile,
+    qfile,
+    ufile,
+    times,
+    freqs,
+    qout=None,
+    uout=None,
+    chunk=ChunkBytes,
+    threads=1,
+    job=None,
+    station=None,
+    sign=1,
+):
+    """derotate() of the .npy cubes 'qfile' and 'ufile' by the RM of
+    the ionFRM.py output 'rmfile' at 'times' (UT hours, as its hour
+    column), into the new files 'qout' and 'uout' (by default back
+    into qfile and ufile). The RM is multiplied by 'sign', -1 for a
+    station below the magnetic equator."""
+    if (qout is None) != (uout is None):
+        raise ValueError("Give both outputs, or neither to correct Q and U in place")
+    if sign not in (1, -1):
+        raise ValueError("The sign of the RM is 1 or -1")
+    hours, rm = read_rm(rmfile, job, station)
+    inPlace = qout is None
+    q = NpyRows(qfile, "r+" if inPlace else "r")
+    u = NpyRows(ufile, "r+" if inPlace else "r")
+    if inPlace:
+        qo, uo = q, u
+    else:
+        # (the headers of the new files, then their rows chunk by chunk)
+        for name, a in ((qout, q), (uout, u)):
+            with open(name, "wb") as f:
+                header = {"descr": npformat.dtype_to_descr(a.dtype), "fortran_order": False, "shape": a.shape}
+                npformat.write_array_header_1_0(f, header)
+                f.truncate(f.tell() + a.shape[0] * a.rowBytes)
+        qo, uo = NpyRows(qout, "r+"), NpyRows(uout, "r+")
+    derotate(q, u, sign * rm_at(hours, rm, times), freqs, qo, uo, chunk, threads)
+
+
+def _load(filename):
+    # a .npy file or a text file of numbers
+    if filename.endswith(".npy"):
+        return numpy.load(filename)
+    return numpy.loadtxt(filename, ndmin=1)
+
+
+def main(argv=None):
+    p = op.OptionParser(usage="%prog [options] RMFILE Q.npy U.npy")
+    p.add_option("--freqs", default=None, help="Frequency (Hz) of every channel (.npy or text file)")
+    p.add_option("--times", default=None, help="UT hour of every time row, as the hour column of RMFILE (.npy or text)")
+    p.add_option("--start", default=None, type="float", help="UT hour of the first time row (instead of --times)")
+    p.add_option("--step", default=None, type="float", help="Seconds between the time rows (with --start)")
+    p.add_option("--output-q", default=None, help="File of the corrected Q [Q.npy itself]")
+    p.add_option("--output-u", default=None, help="File of the corrected U [U.npy itself]")
+    p.add_option("--job", default=None, help="Job of a --manifest RMFILE to take")
+    p.add_option("--station", default=None, help="Station of a --stations RMFILE to take")
+    p.add_option(
+        "--south",
+        action="store_true",
+        default=False,
+        help="The station is below the magnetic equator: negate the RM (see README.md)",
+    )
+    p.add_option("--chunk", default=ChunkBytes >> 20, type="int", help="MB of data per chunk [%default]")
+    p.add_option("--threads", default=1, type="int", help="Chunks corrected at a time [%default]")
+    ops, args = p.parse_args(argv)
+    if len(args) != 3:
+        p.error("The RM file and the Q and U files are needed.")
+    if ops.freqs is None:
+        p.error("--freqs is needed.")
+    if (ops.times is None) == (ops.start is None) or (ops.start is not None and not ops.step):
+        p.error("Give either --times, or --start and --step.")
+    if ops.chunk < 1 or ops.threads < 1:
+        p.error("The chunk size and the number of threads must be positive.")
+    rmfile, qfile, ufile = args
+    try:
+        if ops.times is not None:
+            times = _load(ops.times)
+        else:
+            rows = NpyRows(qfile).shape[0]
+            times = ops.start + numpy.arange(rows) * ops.step / 3600.0
+        derotate_files(
+            rmfile,
+            qfile,
+            ufile,
+            times,
+            _load(ops.freqs),
+            ops.output_q,
+            ops.output_u,
+            ops.chunk << 20,
+            ops.threads,
+            ops.job,
+            ops.station,
+            -1 if ops.south else 1,
+        )
+    except (IOError, ValueError) as detail:
+        p.error(str(detail))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
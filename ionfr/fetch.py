@@ -0,0 +1,529 @@
+"""Download IONEX files into a local mirror of the archive.
+
+The files of a set of products and days are fetched concurrently (at
+most 'concurrency' at a time) with asyncio. Connections are kept open
+and reused from one file to the next, an interrupted download is
+resumed from the partial file (<name>.part) it left, and every file is
+checked against the SHA512SUMS (or MD5SUMS) list of its archive
+directory when there is one. The mirror has the layout of the
+archive, <mirror>/<yyyy>/<ddd>/<file>, unless 'flat' is set.
+
+The archive is given as a URL: https:// or http:// (CDDIS by default)
+or ftp:// or ftps://, so a local stand-in server can take its place.
+Credentials come from ~/.netrc (see README.md for CDDIS).
+"""
+
+import asyncio
+import base64
+import email.message
+import ftplib
+import hashlib
+import http.cookiejar
+import netrc
+import optparse as op
+import os
+import ssl
+import sys
+import urllib.request
+from collections import namedtuple
+from urllib.parse import urljoin, urlsplit
+
+import numpy
+
+from ionfr.ionexfiles import ionex_name
+
+DefaultURL = "https://cddis.nasa.gov/archive/gps/products/ionex"
+
+# Files downloaded at the same time
+Concurrency = 4
+
+# Compressed forms of the files, tried in this order (CDDIS moved
+# from .Z to .gz at the end of 2020)
+Suffixes = (".Z", ".gz")
+
+# Checksum lists of the archive directories and their hash
+ChecksumFiles = (("SHA512SUMS", "sha512"), ("MD5SUMS", "md5"))
+
+MaxRedirects = 10
+ChunkSize = 1 << 16
+
+# Times an interrupted download is resumed before giving up
+Retries = 3
+
+# status: present (already in the mirror), downloaded, missing (not in
+# the archive) or failed, with the reason in 'error'
+Fetched = namedtuple("Fetched", "product day path status error")
+
+
+class FetchError(IOError):
+    """A download that did not succeed."""
+
+
+class Interrupted(FetchError):
+    """A connection lost in the middle of a file."""
+
+
+def archive_path(product, day, suffix=Suffixes[0]):
+    """Path of a file within the archive, yyyy/ddd/<name><suffix>."""
+    day = numpy.datetime64(day, "D")
+    year = int(day.astype("datetime64[Y]").astype(int)) + 1970
+    doy = int((day - day.astype("datetime64[Y]")).astype(int)) + 1
+    return "%04d/%03d/%s%s" % (year, doy, ionex_name(product, day), suffix)
+
+
+def mirror_file(mirror, product, day, suffix=Suffixes[0], flat=False):
+    """Where a file goes in the local mirror."""
+    path = archive_path(product, day, suffix)
+    return os.path.join(mirror, os.path.basename(path) if flat else path)
+
+
+def _credentials(host):
+    # (login, password) of 'host' in ~/.netrc, or None
+    try:
+        auth = netrc.netrc().authenticators(host)
+    except (IOError, netrc.NetrcParseError):
+        return None
+    return auth and (auth[0], auth[2])
+
+
+class _Response:
+    # what http.cookiejar needs of a response
+    def __init__(self, headers):
+        self._headers = headers
+
+    def info(self):
+        return self._headers
+
+
+class HTTPClient:
+    """Minimal asyncio HTTP/1.1 client: keep-alive connections per
+    host, redirects, cookies and basic authentication from ~/.netrc
+    (what the Earthdata login of CDDIS needs)."""
+
+    def __init__(self):
+        self._idle = {}
+        self._cookies = http.cookiejar.CookieJar()
+        self._ssl = ssl.create_default_context()
+
+    async def _connect(self, key, fresh=False):
+        idle = self._idle.get(key)
+        if idle and not fresh:
+            return idle.pop(), True
+        scheme, host, port = key
+        conn = await asyncio.open_connection(host, port, ssl=self._ssl if scheme == "https" else None)
+        return conn, False
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            self._idle.setdefault(key, []).append(conn)
+        else:
+            conn[1].close()
+
+    def close(self):
+        for conns in self._idle.values():
+            for _, writer in conns:
+                writer.close()
+        self._idle.clear()
+
+    def _headers(self, url, extra):
+        parts = urlsplit(url)
+        headers = {
+            "Host": parts.netloc,
+            "User-Agent": "ionFR",
+            "Accept-Encoding": "identity",
+            "Connection": "keep-alive",
+        }
+        # (the jar leaves out the cookies of other domains and paths,
+        # expired ones and Secure ones over plain http)
+        request = urllib.request.Request(url)
+        self._cookies.add_cookie_header(request)
+        if request.has_header("Cookie"):
+            headers["Cookie"] = request.get_header("Cookie")
+        auth = _credentials(parts.hostname)
+        if auth:
+            token = base64.b64encode(("%s:%s" % auth).encode("utf-8")).decode("ascii")
+            headers["Authorization"] = "Basic " + token
+        headers.update(extra)
+        return headers
+
+    def _keepCookies(self, url, values):
+        # the Set-Cookie headers of a response to 'url', with their
+        # Domain, Path, Secure and Expires attributes
+        if values:
+            message = email.message.Message()
+            for value in values:
+                message["Set-Cookie"] = value
+            self._cookies.extract_cookies(_Response(message), urllib.request.Request(url))
+
+    async def _exchange(self, url, extra):
+        # send a GET, return (status, headers, body chunks, key, conn)
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target = parts.path + ("?" + parts.query if parts.query else "")
+        request = "GET %s HTTP/1.1\r\n" % (target or "/")
+        request += "".join("%s: %s\r\n" % kv for kv in self._headers(url, extra).items()) + "\r\n"
+        for attempt in (0, 1):
+            conn, reused = await self._connect(key, fresh=attempt > 0)
+            reader, writer = conn
+            try:
+                writer.write(request.encode("latin1"))
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionResetError("connection closed")
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused or attempt:
+                    raise
+        status = int(line.split()[1])
+        headers = {}
+        cookies = []
+        while True:
+            line = (await reader.readline()).decode("latin1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            if name == "set-cookie":
+                cookies.append(value.strip())
+            headers[name] = value.strip()
+        self._keepCookies(url, cookies)
+        return status, headers, key, conn
+
+    async def _body(self, reader, headers):
+        # the chunks of a response body
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()).strip():
+                        pass
+                    return
+                remaining = size
+                while remaining:
+                    chunk = await reader.read(min(remaining, ChunkSize))
+                    if not chunk:
+                        raise Interrupted("Connection lost %d bytes before the end of a chunk" % remaining)
+                    remaining -= len(chunk)
+                    yield chunk
+                await reader.readline()
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining:
+                chunk = await reader.read(min(remaining, ChunkSize))
+                if not chunk:
+                    raise Interrupted("Connection lost %d bytes before the end" % remaining)
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await reader.read(ChunkSize)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def get(self, url, extra=None, sink=None):
+        """(status, body) of a GET of 'url' after the redirects. With
+        'sink', the body of a successful response is passed to
+        sink(status, chunk) as it comes, and not returned."""
+        for _ in range(MaxRedirects):
+            status, headers, key, conn = await self._exchange(url, extra or {})
+            reusable = (
+                headers.get("connection", "").lower() != "close"
+                and ("content-length" in headers or "transfer-encoding" in headers)
+            )
+            body = []
+            try:
+                async for chunk in self._body(conn[0], headers):
+                    if sink is not None and 200 <= status < 300:
+                        sink(status, chunk)
+                    else:
+                        body.append(chunk)
+            except BaseException:
+                conn[1].close()
+                raise
+            self._release(key, conn, reusable)
+            if status in (301, 302, 303, 307, 308) and "location" in headers:
+                url = urljoin(url, headers["location"])
+                continue
+            return status, b"".join(body)
+        raise FetchError("Too many redirects for %s" % url)
+
+    async def read(self, url):
+        """The content of 'url', or None if there is no such file."""
+        status, body = await self.get(url)
+        if status == 404:
+            return None
+        if status != 200:
+            raise FetchError("HTTP %d for %s" % (status, url))
+        return body
+
+    async def download(self, url, part):
+        """Fetch 'url' into the file 'part', resuming from what it
+        holds. False if there is no such file."""
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        with open(part, "ab") as f:
+
+            def sink(status, chunk):
+                if status == 200 and f.tell() and not sink.started:
+                    # the server sent the whole file again
+                    f.seek(0)
+                    f.truncate()
+                sink.started = True
+                f.write(chunk)
+
+            sink.started = False
+            extra = {"Range": "bytes=%d-" % offset} if offset else {}
+            status, _ = await self.get(url, extra, sink)
+        if status == 416 and offset:
+            # the partial file is already complete
+            return True
+        if status == 404:
+            return False
+        if status not in (200, 206):
+            raise FetchError("HTTP %d for %s" % (status, url))
+        return True
+
+
+class FTPClient:
+    """The same for ftp:// and ftps:// archives, with ftplib in threads
+    and one login per concurrent download, reused between files."""
+
+    def __init__(self):
+        self._idle = {}
+
+    def _login(self, key):
+        scheme, host, port = key
+        ftp = ftplib.FTP_TLS() if scheme == "ftps" else ftplib.FTP()
+        ftp.connect(host, port)
+        user, password = _credentials(host) or ("anonymous", "anonymous")
+        ftp.login(user, password)
+        if scheme == "ftps":
+            ftp.prot_p()
+        return ftp
+
+    def _run(self, url, action):
+        # call action(ftp, path) on a pooled connection
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or 21)
+        idle = self._idle.setdefault(key, [])
+        ftp = idle.pop() if idle else self._login(key)
+        try:
+            result = action(ftp, parts.path)
+        except ftplib.error_perm:
+            idle.append(ftp)
+            raise
+        except BaseException:
+            ftp.close()
+            raise
+        idle.append(ftp)
+        return result
+
+    async def _call(self, url, action):
+        return await asyncio.get_running_loop().run_in_executor(None, self._run, url, action)
+
+    def close(self):
+        for ftps in self._idle.values():
+            for ftp in ftps:
+                try:
+                    ftp.quit()
+                except ftplib.all_errors:
+                    ftp.close()
+        self._idle.clear()
+
+    async def read(self, url):
+        def action(ftp, path):
+            chunks = []
+            ftp.retrbinary("RETR " + path, chunks.append)
+            return b"".join(chunks)
+
+        try:
+            return await self._call(url, action)
+        except ftplib.error_perm as detail:
+            if str(detail).startswith("550"):
+                return None
+            raise FetchError("FTP error for %s: %s" % (url, detail))
+
+    async def download(self, url, part):
+        def action(ftp, path):
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            with open(part, "ab") as f:
+                ftp.retrbinary("RETR " + path, f.write, ChunkSize, rest=offset or None)
+
+        try:
+            await self._call(url, action)
+        except ftplib.error_perm as detail:
+            if str(detail).startswith("550"):
+                return False
+            raise FetchError("FTP error for %s: %s" % (url, detail))
+        return True
+
+
+class Fetcher:
+    """Downloads files of the archive at 'url' into 'mirror'."""
+
+    def __init__(self, mirror=".", url=DefaultURL, concurrency=Concurrency, verify=True, flat=False):
+        self.mirror = mirror
+        self.url = url.rstrip("/")
+        self.verify = verify
+        self.flat = flat
+        self.concurrency = concurrency
+        self._checksums = {}
+        scheme = urlsplit(self.url).scheme
+        if scheme in ("http", "https"):
+            self.client = HTTPClient()
+        elif scheme in ("ftp", "ftps"):
+            self.client = FTPClient()
+        else:
+            raise ValueError("Unsupported archive URL '%s'" % url)
+
+    def _checksumList(self, directory):
+        # {file name: (hash name, hex digest)} of an archive directory,
+        # fetched once (a task shared by the downloads that need it)
+        if directory not in self._checksums:
+            self._checksums[directory] = asyncio.ensure_future(self._readChecksums(directory))
+        return self._checksums[directory]
+
+    async def _readChecksums(self, directory):
+        for name, algorithm in ChecksumFiles:
+            text = await self.client.read("%s/%s/%s" % (self.url, directory, name))
+            if text is not None:
+                sums = {}
+                for line in text.decode("latin1").splitlines():
+                    fields = line.split()
+                    if len(fields) == 2:
+                        sums[fields[1].lstrip("*")] = (algorithm, fields[0].lower())
+                return sums
+        return {}
+
+    async def _expected(self, path):
+        if not self.verify:
+            return None
+        directory, name = path.rsplit("/", 1)
+        return (await self._checksumList(directory)).get(name)
+
+    @staticmethod
+    def _matches(filename, expected):
+        if expected is None:
+            return True
+        digest = hashlib.new(expected[0])
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest() == expected[1]
+
+    async def fetch_one(self, product, day):
+        """Fetched result for the file of 'product' and 'day'."""
+        day = numpy.datetime64(day, "D")
+        try:
+            for suffix in Suffixes:
+                path = archive_path(product, day, suffix)
+                target = mirror_file(self.mirror, product, day, suffix, self.flat)
+                expected = await self._expected(path)
+                if os.path.exists(target) and self._matches(target, expected):
+                    return Fetched(product, day, target, "present", None)
+                found = await self._download(self.url + "/" + path, target, expected)
+                if found:
+                    return Fetched(product, day, target, "downloaded", None)
+            return Fetched(product, day, None, "missing", None)
+        except ftplib.all_errors as detail:
+            # (OSError, FetchError among them, ftplib.Error and EOFError:
+            # a lost FTP control connection or asyncio.IncompleteReadError)
+            return Fetched(product, day, None, "failed", str(detail) or type(detail).__name__)
+
+    async def _download(self, url, target, expected):
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        part = target + ".part"
+        for attempt in (0, 1):
+            if not await self._resume(url, part):
+                if os.path.exists(part):
+                    os.remove(part)
+                return False
+            if self._matches(part, expected):
+                os.replace(part, target)
+                return True
+            # a corrupt (or stale) partial file: start again once
+            os.remove(part)
+        raise FetchError("Checksum mismatch for %s" % url)
+
+    async def _resume(self, url, part):
+        # download, picking up from the partial file after every
+        # interruption (EOFError: an FTP control connection lost, or
+        # asyncio.IncompleteReadError)
+        for attempt in range(Retries + 1):
+            try:
+                return await self.client.download(url, part)
+            except (Interrupted, ConnectionError, EOFError):
+                if attempt == Retries:
+                    raise
+
+    async def fetch_all(self, items):
+        """Fetched results for (product, day) pairs, in their order."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(product, day):
+            async with semaphore:
+                return await self.fetch_one(product, day)
+
+        try:
+            return await asyncio.gather(*[bounded(product, day) for product, day in items])
+        finally:
+            self.client.close()
+
+
+def fetch(items, mirror=".", url=DefaultURL, concurrency=Concurrency, verify=True, flat=False):
+    """Download the files of (product, day) pairs; [Fetched, ...]."""
+    fetcher = Fetcher(mirror, url, concurrency, verify, flat)
+    return asyncio.run(fetcher.fetch_all(list(items)))
+
+
+def day_range(start, stop):
+    """The days from 'start' to 'stop', both included."""
+    start = numpy.datetime64(start, "D")
+    stop = numpy.datetime64(stop, "D")
+    return numpy.arange(start, stop + numpy.timedelta64(1, "D"))
+
+
+def main(argv=None):
+    p = op.OptionParser(usage="%prog -d yyyy-mm-dd [--stop yyyy-mm-dd] [-t codg,igsg] [options]")
+    p.add_option("--date", "-d", default=None, help="(First) date (yyyy-mm-dd)")
+    p.add_option("--stop", default=None, help="Last date, included [--date]")
+    p.add_option(
+        "--type",
+        "-t",
+        default="codg",
+        help="Type(s) of ionex file, comma separated (codg,upcg,igsg) [codg]",
+    )
+    p.add_option(
+        "--mirror",
+        default=None,
+        help="Local mirror directory (yyyy/ddd/ subdirectories) [the files go to the current directory]",
+    )
+    p.add_option("--url", default=DefaultURL, help="Archive to download from [%default]")
+    p.add_option(
+        "--concurrency", default=Concurrency, type="int", help="Files downloaded at a time [%default]"
+    )
+    p.add_option(
+        "--no-verify", dest="verify", action="store_false", default=True, help="Do not check checksums"
+    )
+    ops, args = p.parse_args(argv)
+    if ops.date is None or args:
+        p.error("A date is needed (and no arguments).")
+    if ops.concurrency < 1:
+        p.error("The concurrency must be at least 1.")
+    try:
+        days = day_range(ops.date, ops.stop or ops.date)
+    except ValueError as detail:
+        p.error("Invalid date: %s" % detail)
+    items = [(product, day) for day in days for product in ops.type.split(",")]
+    results = fetch(items, ops.mirror or ".", ops.url, ops.concurrency, ops.verify, ops.mirror is None)
+    failed = False
+    for r in results:
+        print("%s %s %s %s" % (r.product, r.day, r.status, r.path or r.error or ""))
+        failed = failed or r.status in ("missing", "failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
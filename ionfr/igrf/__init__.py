@@ -0,0 +1,2 @@
+"""The geomagnetic field (the IGRF package of ionFR): igrffield, the
+IGRF synthesis, and fieldgrid, daily grids of it."""
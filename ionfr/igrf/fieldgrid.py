@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+#------------------------------------------------------------
+# Precomputed geomagnetic field grids on the Ionospheric shell.
+#
+# Within a day the IGRF field at the height of the shell
+# hardly changes, and it varies smoothly with position. So
+# rather than synthesising the field at every piercing point,
+# the X, Y and Z components are computed once per (day, shell
+# height) on a regular latitude/longitude grid, stored as a
+# memory-mapped .npy file, and then interpolated (bilinearly)
+# at the piercing points. Every source and every station
+# observed on that day shares the same grid.
+#
+# The grid file holds an array of shape (3, nLat, nLon) with
+# X, Y, Z in nT; a JSON file next to it ('<grid>.json')
+# describes the grid. Both are written under temporary names
+# and renamed, the description last, so a grid whose .json is
+# there is complete. The file names carry the digest of the
+# IGRF coefficients, so a new IGRF generation gets new grids.
+#------------------------------------------------------------
+
+import json
+import os
+from collections import OrderedDict
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from ionfr.igrf import igrffield
+
+# Default grid spacing in degrees (finer than the 2.5 x 5.0 degree
+# IONEX maps)
+GridStep = 1.0
+
+# Grids already opened by this process, keyed by file name, least
+# recently used first. At most GridCacheSize of them are kept open
+# (None: no limit).
+GridCacheSize = None
+_openGrids = OrderedDict()
+
+
+class FieldGrid:
+    """X, Y, Z components of the field on a regular lat/lon grid.
+
+    The grid nodes are lat = lat1 + i*step, lon = lon1 + j*step.
+    """
+
+    def __init__(self, data, lat1, lon1, step, radius, epoch):
+        self.data = data
+        self.lat1 = lat1
+        self.lon1 = lon1
+        self.step = step
+        self.radius = radius
+        self.epoch = epoch
+        self.nLat = data.shape[1]
+        self.nLon = data.shape[2]
+        # a grid spanning 360 degrees in longitude is wrapped around
+        self.wraps = abs((self.nLon - 1) * step - 360.0) < 1e-9
+
+    def field(self, lat, lon):
+        """Bilinear interpolation of X, Y, Z (nT) at lat, lon (degrees)."""
+        lat = numpy.asarray(lat, dtype=float)
+        lon = numpy.asarray(lon, dtype=float)
+        y = (lat - self.lat1) / self.step
+        if self.wraps:
+            x = ((lon - self.lon1) % 360.0) / self.step
+        else:
+            x = (lon - self.lon1) / self.step
+        if (
+            numpy.any(y < 0)
+            or numpy.any(y > self.nLat - 1)
+            or numpy.any(x < 0)
+            or numpy.any(x > self.nLon - 1)
+        ):
+            raise ValueError("Coordinates outside of the field grid")
+
+        i = numpy.minimum(numpy.floor(y).astype(int), self.nLat - 2)
+        j = numpy.minimum(numpy.floor(x).astype(int), self.nLon - 2)
+        q = y - i
+        p = x - j
+        d = self.data
+        out = (
+            (1.0 - p) * (1.0 - q) * d[:, i, j]
+            + p * (1.0 - q) * d[:, i, j + 1]
+            + q * (1.0 - p) * d[:, i + 1, j]
+            + p * q * d[:, i + 1, j + 1]
+        )
+        return out[0], out[1], out[2]
+
+
+def buildFieldGrid(
+    filename, decimalyear, radius, step=GridStep, latRange=(-90.0, 90.0), lonRange=(-180.0, 180.0)
+):
+    # Synthesise the field on the grid and write it (and its
+    # description) to 'filename'. radius is in km from the centre
+    # of the Earth.
+    lats = numpy.arange(latRange[0], latRange[1] + 0.5 * step, step)
+    lons = numpy.arange(lonRange[0], lonRange[1] + 0.5 * step, step)
+
+    # written under a temporary name first so that a half written
+    # grid is never picked up by another run
+    tmpname = filename + ".tmp%d" % os.getpid()
+    data = open_memmap(tmpname, mode="w+", dtype=numpy.float64, shape=(3, len(lats), len(lons)))
+    # one latitude band at a time keeps the memory bounded for fine grids
+    rows = max(1, 200000 // len(lons))
+    for i in range(0, len(lats), rows):
+        lat, lon = numpy.meshgrid(lats[i : i + rows], lons, indexing="ij")
+        X, Y, Z = igrffield.calcField(lat, lon, radius, decimalyear)
+        data[0, i : i + rows] = X
+        data[1, i : i + rows] = Y
+        data[2, i : i + rows] = Z
+    data.flush()
+    del data
+
+    meta = {
+        "lat1": float(lats[0]),
+        "lon1": float(lons[0]),
+        "step": float(step),
+        "radius": float(radius),
+        "epoch": float(decimalyear),
+    }
+    with open(tmpname + ".json", "w") as f:
+        json.dump(meta, f)
+    os.replace(tmpname, filename)
+    os.replace(tmpname + ".json", filename + ".json")
+
+
+def loadFieldGrid(filename):
+    # Open a grid written by buildFieldGrid (memory-mapped, read only)
+    if filename not in _openGrids:
+        with open(filename + ".json") as f:
+            meta = json.load(f)
+        data = numpy.load(filename, mmap_mode="r")
+        _openGrids[filename] = FieldGrid(data, **meta)
+    _openGrids.move_to_end(filename)
+    while GridCacheSize is not None and len(_openGrids) > GridCacheSize:
+        _openGrids.popitem(last=False)
+    return _openGrids[filename]
+
+
+def setGridCache(maxsize):
+    # Keep at most 'maxsize' grids open (None: no limit)
+    global GridCacheSize
+    if maxsize is not None and maxsize < 1:
+        raise ValueError("Grid cache size must be >= 1")
+    GridCacheSize = maxsize
+    while maxsize is not None and len(_openGrids) > maxsize:
+        _openGrids.popitem(last=False)
+
+
+def getFieldGrid(
+    directory, decimalyear, radius, step=GridStep, latRange=(-90.0, 90.0), lonRange=(-180.0, 180.0)
+):
+    # The grid for the day of 'decimalyear' at shell radius 'radius'
+    # (km), built in 'directory' the first time it is needed
+    epoch = float(igrffield.roundEpoch(decimalyear))
+    name = "igrf_%s_%.5f_%.1fkm_%gdeg" % (igrffield.modelDigest()[:8], epoch, radius, step)
+    if tuple(latRange) != (-90.0, 90.0) or tuple(lonRange) != (-180.0, 180.0):
+        name += "_%g_%g_%g_%g" % (tuple(latRange) + tuple(lonRange))
+    filename = os.path.join(directory, name + ".npy")
+
+    if not os.path.exists(filename + ".json"):
+        os.makedirs(directory, exist_ok=True)
+        buildFieldGrid(filename, epoch, radius, step, latRange, lonRange)
+    return loadFieldGrid(filename)
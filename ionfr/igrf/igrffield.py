@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+#------------------------------------------------------------
+# Vectorised synthesis of the IGRF geomagnetic field.
+#
+# This is a port of the synthesis loop in
+# pyIGRF.calculate.igrf12syn (geocentric case, itype = 2)
+# in which the Schmidt quasi-normalised Legendre recursion
+# and the spherical harmonic sums are evaluated on whole
+# arrays of points at once, so the field at thousands of
+# Ionospheric piercing points costs a single call. The
+# Gauss coefficients themselves are still taken from
+# pyIGRF.
+#
+# Interpolating the coefficient tables to an epoch is done
+# once per epoch: the coefficient arrays are memoised in a
+# bounded (least recently used) cache keyed by the epoch
+# rounded to 'CoeffResolution' years. Both the resolution
+# and the size of the cache can be changed with
+# setCoeffCache().
+#
+# Input:
+#	lat		geocentric latitude (degrees)
+#	lon		east longitude (degrees)
+#	radius		distance from the centre of the Earth (km)
+#	decimalyear	epoch as a decimal year
+#	(all of them scalars or arrays that broadcast together)
+# Output:
+#	X, Y, Z		north, east and vertical (down) components
+#			of the field (nT), arrays with the broadcast
+#			shape of the input
+#------------------------------------------------------------
+
+import hashlib
+from collections import OrderedDict
+
+import numpy
+from pyIGRF.loadCoeffs import get_coeffs
+
+# Reference radius of the IGRF coefficients (km). This is NOT the
+# mean radius of the Earth, see pyIGRF.calculate.igrf12syn
+IGRFRadius = 6371.2
+
+# Epochs are rounded to this many years before looking up the
+# coefficients (one day by default, the secular variation over a
+# day is well below a nT). Zero disables the rounding.
+CoeffResolution = 1.0 / 365.25
+# Maximum number of epochs kept in the coefficient cache
+CoeffCacheSize = 64
+
+_coeffCache = OrderedDict()
+_modelDigest = None
+
+
+def setCoeffCache(resolution=None, maxsize=None):
+    # Change the epoch resolution and/or the size of the
+    # coefficient cache. The cache is emptied.
+    global CoeffResolution, CoeffCacheSize
+    if resolution is not None:
+        if resolution < 0:
+            raise ValueError("Coefficient resolution must be >= 0")
+        CoeffResolution = float(resolution)
+    if maxsize is not None:
+        if maxsize < 1:
+            raise ValueError("Coefficient cache size must be >= 1")
+        CoeffCacheSize = int(maxsize)
+    clearCoeffCache()
+
+
+def clearCoeffCache():
+    _coeffCache.clear()
+
+
+def roundEpoch(decimalyear):
+    # Epoch(s) rounded to the coefficient resolution
+    if CoeffResolution == 0:
+        return decimalyear
+    return numpy.round(numpy.asarray(decimalyear) / CoeffResolution) * CoeffResolution
+
+
+def coeffArrays(decimalyear):
+    # Gauss coefficients for the given epoch as two
+    # (nmax+1, nmax+1) arrays indexed [n, m], taken from the
+    # cache whenever the rounded epoch has been seen before
+    key = float(roundEpoch(decimalyear))
+    if key in _coeffCache:
+        _coeffCache.move_to_end(key)
+        return _coeffCache[key]
+
+    g, h = get_coeffs(key)
+    if len(g) == 0:
+        raise ValueError("No IGRF coefficients for epoch %s" % decimalyear)
+    nmax = len(g) - 1
+    gnm = numpy.zeros((nmax + 1, nmax + 1))
+    hnm = numpy.zeros((nmax + 1, nmax + 1))
+    for n in range(1, nmax + 1):
+        gnm[n, : n + 1] = g[n]
+        hnm[n, 1 : n + 1] = h[n][1:]
+    # the arrays are shared by every caller, make sure nobody alters them
+    gnm.flags.writeable = False
+    hnm.flags.writeable = False
+
+    _coeffCache[key] = (gnm, hnm)
+    while len(_coeffCache) > CoeffCacheSize:
+        _coeffCache.popitem(last=False)
+    return gnm, hnm
+
+
+def modelDigest():
+    # Digest of the coefficients pyIGRF provides (taken every 5 years
+    # from 1900 to 2025), which changes with the IGRF generation
+    # installed
+    global _modelDigest
+    if _modelDigest is None:
+        digest = hashlib.sha256()
+        for epoch in range(1900, 2026, 5):
+            g, h = get_coeffs(float(epoch))
+            digest.update(repr((g, h)).encode())
+        _modelDigest = digest.hexdigest()[:16]
+    return _modelDigest
+
+
+def synthField(gnm, hnm, lat, lon, radius):
+    # Spherical harmonic synthesis for one set of coefficients.
+    # lat, lon and radius are 1-D arrays of the same length.
+    nmax = gnm.shape[0] - 1
+    colat = (90.0 - lat) * numpy.pi / 180.0
+    phi = lon * numpy.pi / 180.0
+    ct = numpy.cos(colat)
+    st = numpy.sin(colat)
+    ratio = IGRFRadius / radius
+    poles = st == 0.0
+    safest = numpy.where(poles, 1.0, st)
+
+    # cos(m*phi) and sin(m*phi) for every order
+    cl = [numpy.cos(m * phi) for m in range(nmax + 1)]
+    sl = [numpy.sin(m * phi) for m in range(nmax + 1)]
+
+    zero = numpy.zeros_like(ct)
+    # Schmidt quasi-normalised P(n,m) and q(n,m) = dP(n,m)/dtheta,
+    # the arrays of degree n-1 and n-2 are kept for the recursion
+    P = {(0, 0): numpy.ones_like(ct)}
+    Q = {(0, 0): zero}
+
+    X = numpy.zeros_like(ct)
+    Y = numpy.zeros_like(ct)
+    Z = numpy.zeros_like(ct)
+    rr = ratio * ratio
+    for n in range(1, nmax + 1):
+        rr = rr * ratio
+        for m in range(n + 1):
+            if m != n:
+                one = numpy.sqrt(n * n - m * m)
+                two = numpy.sqrt((n - 1) * (n - 1) - m * m) / one
+                three = (2 * n - 1) / one
+                Pm2 = P.get((n - 2, m), zero)
+                Qm2 = Q.get((n - 2, m), zero)
+                P[n, m] = three * ct * P[n - 1, m] - two * Pm2
+                Q[n, m] = three * (ct * Q[n - 1, m] - st * P[n - 1, m]) - two * Qm2
+            elif n == 1:
+                P[1, 1] = st
+                Q[1, 1] = ct
+            else:
+                one = numpy.sqrt(1.0 - 0.5 / m)
+                P[n, m] = one * st * P[n - 1, m - 1]
+                Q[n, m] = one * (st * Q[n - 1, m - 1] + ct * P[n - 1, m - 1])
+
+            # synthesis of X, Y and Z in geocentric coordinates
+            one = gnm[n, m] * rr
+            if m == 0:
+                X += one * Q[n, m]
+                Z -= (n + 1.0) * one * P[n, m]
+            else:
+                two = hnm[n, m] * rr
+                three = one * cl[m] + two * sl[m]
+                X += three * Q[n, m]
+                Z -= (n + 1.0) * three * P[n, m]
+                Y += (one * sl[m] - two * cl[m]) * numpy.where(
+                    poles, Q[n, m] * ct, m * P[n, m] / safest
+                )
+
+        # degrees below n-1 are no longer needed
+        for m in range(n - 1):
+            del P[n - 2, m], Q[n - 2, m]
+
+    return X, Y, Z
+
+
+def calcField(lat, lon, radius, decimalyear):
+
+    lat, lon, radius, decimalyear = numpy.broadcast_arrays(
+        numpy.asarray(lat, dtype=float),
+        numpy.asarray(lon, dtype=float),
+        numpy.asarray(radius, dtype=float),
+        numpy.asarray(decimalyear, dtype=float),
+    )
+    shape = lat.shape
+    lat, lon, radius, decimalyear = (
+        lat.ravel(),
+        lon.ravel(),
+        radius.ravel(),
+        decimalyear.ravel(),
+    )
+
+    X = numpy.zeros(lat.size)
+    Y = numpy.zeros(lat.size)
+    Z = numpy.zeros(lat.size)
+
+    # one synthesis per distinct (rounded) epoch, every point sharing
+    # it in one go
+    epochs, inverse = numpy.unique(roundEpoch(decimalyear), return_inverse=True)
+    for i, epoch in enumerate(epochs):
+        gnm, hnm = coeffArrays(epoch)
+        if len(epochs) == 1:
+            X, Y, Z = synthField(gnm, hnm, lat, lon, radius)
+            break
+        sel = inverse == i
+        X[sel], Y[sel], Z[sel] = synthField(gnm, hnm, lat[sel], lon[sel], radius[sel])
+
+    return X.reshape(shape), Y.reshape(shape), Z.reshape(shape)
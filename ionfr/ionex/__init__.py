@@ -0,0 +1,2 @@
+"""Reading IONEX TEC maps (the IONEX package of ionFR): ionexmaps, and
+the older teccalc, tecrmscalc and ionheight."""
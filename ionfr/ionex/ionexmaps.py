@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+
+#------------------------------------------------------
+# Read the TEC and RMS TEC maps of an IONEX file once
+# and interpolate them at arrays of coordinates and
+# times.
+#
+# This does the same as teccalc.calcTEC and
+# tecrmscalc.calcRMSTEC, i.e. the 13 two-hourly maps
+# are completed to 25 hourly maps with the third
+# interpolation method of the IONEX manual and then
+# the 4-point formula is used in latitude and
+# longitude, but
+#   - the file is parsed a single time, and
+#   - any number of points and (fractional) hours are
+#     evaluated in one call. Between two hourly maps
+#     the values are interpolated linearly in time, so
+#     on the hour the results are those of calcTEC
+#     (except that on a grid all around the globe the
+#     odd maps are completed across the dateline, where
+#     calcTEC has zeros).
+#
+# Input of IonexData.tec / IonexData.rms (IonexData.tecRms
+# for both):
+#	lat	latitude (degrees)
+#	lon	longitude (degrees)
+#	hour	UT hours since the first map (0~24)
+#	(scalars or arrays that broadcast together)
+# Output:
+#	TEC or RMS TEC values, in the units of the file
+#	(0.1 TECU for 'EXPONENT -1')
+#
+# Optionally (setTecCache) the values are looked up in a
+# cache of the TEC and RMS TEC at points quantized in
+# latitude, longitude and time, so that piercing points
+# within a quantum of each other (sources in one field,
+# stations of one array) share one interpolation. The
+# values are then those at the centre of the quantum.
+#------------------------------------------------------
+
+import itertools
+import os
+from collections import OrderedDict
+
+import numpy
+
+# Parsed files kept by this process, keyed by file name, least
+# recently used first. At most DatasetCacheSize of them are kept
+# (None: no limit).
+DatasetCacheSize = None
+_datasets = OrderedDict()
+
+# Quantum of the TEC cache (degrees of latitude and longitude, hours)
+# and the number of points it keeps
+TecQuantum = (0.05, 0.05, 60.0 / 3600.0)
+TecCacheSize = 1 << 20
+_tecCache = None
+_serials = itertools.count()
+
+
+class IonexData:
+    """TEC and RMS TEC maps of one IONEX file on an hourly grid."""
+
+    def __init__(self, tec, rms, height, lat1, dlat, lon1, dlon, epoch):
+        # tec, rms: arrays of shape (hours + 1, nLat, nLon)
+        self.tecMaps = tec
+        self.rmsMaps = rms
+        self.height = height  # km
+        self.lat1 = lat1
+        self.dlat = dlat
+        self.lon1 = lon1
+        self.dlon = dlon
+        self.epoch = epoch  # (year, month, day) of the first map
+        self.serial = next(_serials)  # tells the files apart in the TEC cache
+
+    def tec(self, lat, lon, hour):
+        if _tecCache is not None:
+            return _tecCache.lookup(self, lat, lon, hour)[0]
+        return interpMaps(self, self.tecMaps, lat, lon, hour)
+
+    def rms(self, lat, lon, hour):
+        if _tecCache is not None:
+            return _tecCache.lookup(self, lat, lon, hour)[1]
+        return interpMaps(self, self.rmsMaps, lat, lon, hour)
+
+    def tecRms(self, lat, lon, hour):
+        # (TEC, RMS TEC) at the same points, with a single lookup of
+        # the TEC cache
+        if _tecCache is not None:
+            return _tecCache.lookup(self, lat, lon, hour)
+        return interpMaps(self, self.tecMaps, lat, lon, hour), interpMaps(self, self.rmsMaps, lat, lon, hour)
+
+    def tecSeries(self, lat, lon):
+        # TEC of every hourly map at one point
+        return mapSeries(self, self.tecMaps, lat, lon)
+
+    def rmsSeries(self, lat, lon):
+        return mapSeries(self, self.rmsMaps, lat, lon)
+
+
+def isGlobal(nLon, dlon):
+    # Whether 'nLon' columns 'dlon' degrees apart go all around the
+    # globe (the last column being the first one again)
+    return abs(abs((nLon - 1) * dlon) - 360.0) < 1e-6
+
+
+def stencil(data, lat, lon):
+    # Locating the 4 points in the IONEX grid map which surround
+    # the coordinates: lower indices and fractional offsets. On a
+    # grid all around the globe the longitudes are taken modulo 360
+    # degrees; points beyond the edges of the grid (the poles) get
+    # the values at the edge rather than extrapolated ones.
+    nLat, nLon = data.tecMaps.shape[1:]
+    y = numpy.clip((lat - data.lat1) / data.dlat, 0, nLat - 1)
+    x = (lon - data.lon1) / data.dlon
+    if isGlobal(nLon, data.dlon):
+        x = x % (nLon - 1)
+    else:
+        x = numpy.clip(x, 0, nLon - 1)
+    i = numpy.clip(numpy.floor(y).astype(int), 0, nLat - 2)
+    j = numpy.clip(numpy.floor(x).astype(int), 0, nLon - 2)
+    return i, j, y - i, x - j
+
+
+def mapSeries(data, maps, lat, lon):
+    # the 4-point formula at one point for all the maps at once
+    i, j, q, p = stencil(data, float(lat), float(lon))
+    return (
+        (1.0 - p) * (1.0 - q) * maps[:, i, j]
+        + p * (1.0 - q) * maps[:, i, j + 1]
+        + q * (1.0 - p) * maps[:, i + 1, j]
+        + p * q * maps[:, i + 1, j + 1]
+    )
+
+
+def interpMaps(data, maps, lat, lon, hour):
+    lat, lon, hour = numpy.broadcast_arrays(
+        numpy.asarray(lat, dtype=float),
+        numpy.asarray(lon, dtype=float),
+        numpy.asarray(hour, dtype=float),
+    )
+    nT = maps.shape[-3]
+
+    # the 4 points surrounding the coordinates, then the 4-point
+    # formula of the IONEX manual
+    i, j, q, p = stencil(data, lat, lon)
+
+    # the two hourly maps around every epoch
+    k = numpy.clip(numpy.floor(hour).astype(int), 0, nT - 2)
+    t = hour - k
+
+    # (maps of several files on the grid of 'data' can be stacked
+    # along a first axis, giving one result per file)
+    def grid(m):
+        return (
+            (1.0 - p) * (1.0 - q) * maps[..., m, i, j]
+            + p * (1.0 - q) * maps[..., m, i, j + 1]
+            + q * (1.0 - p) * maps[..., m, i + 1, j]
+            + p * q * maps[..., m, i + 1, j + 1]
+        )
+
+    return (1.0 - t) * grid(k) + t * grid(k + 1)
+
+
+def sameGrid(datasets):
+    # Whether the maps of the files are on one grid
+    first = datasets[0]
+    key = (first.lat1, first.dlat, first.lon1, first.dlon, first.tecMaps.shape)
+    return all((d.lat1, d.dlat, d.lon1, d.dlon, d.tecMaps.shape) == key for d in datasets)
+
+
+def tecStack(datasets, lat, lon, hour):
+    # TEC and RMS TEC of several files at the same points, one row
+    # per file. Files on one grid are interpolated together, with
+    # one stencil for all of them (but through the TEC cache when it
+    # is on).
+    if _tecCache is not None or not sameGrid(datasets):
+        tec, rms = zip(*[d.tecRms(lat, lon, hour) for d in datasets])
+        return numpy.array(tec), numpy.array(rms)
+    maps = numpy.stack([d.tecMaps for d in datasets] + [d.rmsMaps for d in datasets])
+    values = interpMaps(datasets[0], maps, lat, lon, hour)
+    return values[: len(datasets)], values[len(datasets) :]
+
+
+class TecCache:
+    """TEC and RMS TEC at points quantized to 'quantum' (degrees of
+    latitude and longitude, hours), for every file, keeping the
+    'maxsize' points used last.
+
+    The points of every file are kept sorted in arrays, so a whole
+    array of points is looked up at once; 'lookups' counts the points
+    asked for and 'hits' those that did not need an interpolation.
+    """
+
+    def __init__(self, quantum=TecQuantum, maxsize=TecCacheSize):
+        self.quantum = tuple(float(q) for q in quantum)
+        if len(self.quantum) != 3 or min(self.quantum) <= 0 or maxsize < 1:
+            raise ValueError("The TEC cache needs three positive quanta and a positive size")
+        self.maxsize = int(maxsize)
+        # cells of latitude, longitude and time (25 hourly maps)
+        self.cells = tuple(int(numpy.ceil(span / q)) + 2 for span, q in zip((180.0, 360.0, 25.0), self.quantum))
+        if float(numpy.prod(self.cells, dtype=float)) >= 2**63:
+            raise ValueError("The TEC cache quantum is too fine")
+        # {serial of the file: [keys, values (n, 2), last use]}, the
+        # last use being a number given to one point at a time, so
+        # that no two points were used last at the same time
+        self.tables = {}
+        self.clock = 0
+        self.lookups = 0
+        self.hits = 0
+
+    def _keys(self, lat, lon, hour):
+        qlat, qlon, qhour = self.quantum
+        nLat, nLon, nT = self.cells
+        i = numpy.floor((lat + 90.0) / qlat).astype(numpy.int64)
+        j = numpy.floor((lon + 180.0) % 360.0 / qlon).astype(numpy.int64)
+        k = numpy.clip(numpy.floor(hour / qhour), -1, nT - 2).astype(numpy.int64) + 1
+        return (i * nLon + j) * nT + k
+
+    def _centres(self, keys):
+        qlat, qlon, qhour = self.quantum
+        nLat, nLon, nT = self.cells
+        i, j, k = keys // (nT * nLon), keys // nT % nLon, keys % nT
+        return (i + 0.5) * qlat - 90.0, (j + 0.5) * qlon - 180.0, (k - 0.5) * qhour
+
+    def lookup(self, data, lat, lon, hour):
+        """(TEC, RMS TEC) of 'data' at the quantized points."""
+        lat, lon, hour = numpy.broadcast_arrays(
+            numpy.asarray(lat, dtype=float), numpy.asarray(lon, dtype=float), numpy.asarray(hour, dtype=float)
+        )
+        shape = lat.shape
+        keys = self._keys(lat.ravel(), lon.ravel(), hour.ravel())
+        wanted, inverse = numpy.unique(keys, return_inverse=True)
+        uses = self.clock + numpy.arange(len(wanted))
+        self.clock += len(wanted)
+        empty = numpy.empty(0, dtype=numpy.int64)
+        table = self.tables.setdefault(data.serial, [empty, numpy.empty((0, 2)), empty])
+
+        values = numpy.empty((len(wanted), 2))
+        pos = numpy.searchsorted(table[0], wanted)
+        found = pos < len(table[0])
+        found[found] = table[0][pos[found]] == wanted[found]
+        values[found] = table[1][pos[found]]
+        table[2][pos[found]] = uses[found]
+
+        new = wanted[~found]
+        if len(new):
+            cLat, cLon, cHour = self._centres(new)
+            values[~found, 0] = interpMaps(data, data.tecMaps, cLat, cLon, cHour)
+            values[~found, 1] = interpMaps(data, data.rmsMaps, cLat, cLon, cHour)
+            order = numpy.argsort(numpy.concatenate([table[0], new]), kind="stable")
+            table[0] = numpy.concatenate([table[0], new])[order]
+            table[1] = numpy.concatenate([table[1], values[~found]])[order]
+            table[2] = numpy.concatenate([table[2], uses[~found]])[order]
+            self._evict()
+
+        self.lookups += len(keys)
+        self.hits += len(keys) - len(new)
+        values = values[inverse.ravel()]
+        return values[:, 0].reshape(shape), values[:, 1].reshape(shape)
+
+    def _evict(self):
+        # keep the maxsize points used last, whatever their file (the
+        # last uses all differ, so exactly maxsize of them)
+        size = len(self)
+        if size <= self.maxsize:
+            return
+        used = numpy.concatenate([table[2] for table in self.tables.values()])
+        limit = numpy.partition(used, size - self.maxsize)[size - self.maxsize]
+        for serial, table in list(self.tables.items()):
+            keep = table[2] >= limit
+            if not keep.any():
+                del self.tables[serial]
+            elif not keep.all():
+                self.tables[serial] = [a[keep] for a in table]
+
+    def __len__(self):
+        return sum(len(table[0]) for table in self.tables.values())
+
+
+def setTecCache(quantum=TecQuantum, maxsize=TecCacheSize):
+    # Look the TEC and RMS TEC up in a TecCache with the given quantum
+    # and size from now on; quantum None switches the cache off
+    global _tecCache
+    _tecCache = None if quantum is None else TecCache(quantum, maxsize)
+
+
+def tecCacheSettings():
+    # (quantum, maxsize) of the TEC cache, or None when it is off
+    if _tecCache is None:
+        return None
+    return _tecCache.quantum, _tecCache.maxsize
+
+
+def hourlyMaps(a, dlon=5.0):
+    # Producing interpolated maps from the two-hourly ones, the
+    # interpolation type 3 of the IONEX manual (the maps before and
+    # after are rotated by the 15 degrees the Earth turns in an hour,
+    # 3 columns of 5 degrees). On a grid all around the globe the
+    # columns rotated past either edge come in from the other one;
+    # otherwise, as in teccalc, the 3 or 4 columns at either edge of
+    # the odd maps are zero.
+    nMaps, nLat, nLon = a.shape
+    s = int(round(15.0 / abs(dlon)))
+    newa = numpy.zeros((2 * nMaps - 1, nLat, nLon))
+    newa[0::2] = a
+    newa[1::2, :, s + 1 : nLon - s] = 0.5 * a[:-1, :, 2 * s + 1 : nLon] + 0.5 * a[1:, :, 1 : nLon - 2 * s]
+    if isGlobal(nLon, dlon):
+        edges = numpy.r_[0 : s + 1, nLon - s : nLon]
+        newa[1::2, :, edges] = (
+            0.5 * a[:-1, :, (edges + s) % (nLon - 1)] + 0.5 * a[1:, :, (edges - s) % (nLon - 1)]
+        )
+    return newa
+
+
+def parseIONEX(filename):
+
+    # opening and reading the IONEX file into memory
+    with open(filename, "r") as f:
+        lines = f.read().split("\n")
+
+    header = True
+    maps = {"TEC": [], "RMS": []}
+    current = None
+    rows = []
+    interval = 7200.0
+    for line in lines:
+        # records are labelled in columns 61-80, lines of values
+        # (up to 16 values of 5 columns) are not
+        label = line[60:].strip()
+        if not label[:1].isalpha():
+            label = ""
+        if header:
+            if label == "INTERVAL":
+                interval = float(line.split()[0])
+            elif label == "HGT1 / HGT2 / DHGT":
+                height = float(line.split()[0])
+            elif label == "LAT1 / LAT2 / DLAT":
+                lat1, lat2, dlat = [float(v) for v in line.split()[:3]]
+            elif label == "LON1 / LON2 / DLON":
+                lon1, lon2, dlon = [float(v) for v in line.split()[:3]]
+            elif label == "EPOCH OF FIRST MAP":
+                epoch = tuple(int(v) for v in line.split()[:3])
+            elif label == "END OF HEADER":
+                header = False
+            continue
+
+        if label in ("START OF TEC MAP", "START OF RMS MAP"):
+            current = label.split()[2]
+            rows = []
+        elif label in ("END OF TEC MAP", "END OF RMS MAP"):
+            maps[current].append(rows)
+            current = None
+        elif current is not None and label == "" and line.strip():
+            # a line of values of the current latitude band
+            rows.append(line)
+
+    pointsLat = int(round((lat2 - lat1) / dlat)) + 1
+    pointsLon = int(round((lon2 - lon1) / dlon)) + 1
+
+    def toArray(blocks):
+        a = numpy.array(" ".join(" ".join(b) for b in blocks).split(), dtype=float)
+        return a.reshape(len(blocks), pointsLat, pointsLon)
+
+    tec = toArray(maps["TEC"])
+    rms = toArray(maps["RMS"])
+    if interval == 7200.0:
+        tec = hourlyMaps(tec, dlon)
+        rms = hourlyMaps(rms, dlon)
+    elif interval != 3600.0:
+        raise ValueError(
+            "IONEX files with maps every %g s are not supported" % interval
+        )
+
+    return IonexData(tec, rms, height, lat1, dlat, lon1, dlon, epoch)
+
+
+def readIONEX(filename):
+    # The parsed file, read from disk only the first time (or when
+    # it has changed since)
+    key = os.path.realpath(filename)
+    mtime = os.path.getmtime(key)
+    if key not in _datasets or _datasets[key][0] != mtime:
+        _datasets[key] = (mtime, parseIONEX(filename))
+    _datasets.move_to_end(key)
+    while DatasetCacheSize is not None and len(_datasets) > DatasetCacheSize:
+        _datasets.popitem(last=False)
+    return _datasets[key][1]
+
+
+def setDatasetCache(maxsize):
+    # Keep at most 'maxsize' parsed files (None: no limit)
+    global DatasetCacheSize
+    if maxsize is not None and maxsize < 1:
+        raise ValueError("Dataset cache size must be >= 1")
+    DatasetCacheSize = maxsize
+    while maxsize is not None and len(_datasets) > maxsize:
+        _datasets.popitem(last=False)
+
+
+def dropIONEX(filename):
+    # Forget a parsed file (to free its memory)
+    _datasets.pop(os.path.realpath(filename), None)
@@ -0,0 +1,41 @@
+"""Names of IONEX files.
+
+IONEX products are distributed as one file per product and day, named
+<product><day of year>0.<yy>i, e.g. codg2930.11i for the CODE maps of
+2011-10-20 (see url_download.py).
+"""
+
+import datetime
+import os
+
+
+def _date(day):
+    # a datetime.date of a date, datetime, numpy.datetime64 or
+    # 'yyyy-mm-dd...' string, without importing numpy
+    if isinstance(day, datetime.datetime):
+        return day.date()
+    if isinstance(day, datetime.date):
+        return day
+    if isinstance(day, str):
+        return datetime.date.fromisoformat(day[:10])
+    return day.astype("datetime64[D]").item()
+
+
+def ionex_name(product, day):
+    """File name of the IONEX 'product' (codg, igsg, ...) for 'day'."""
+    day = _date(day)
+    return "%s%03d0.%02di" % (product, day.timetuple().tm_yday, day.year % 100)
+
+
+def ionex_path(directory, product, day):
+    """Path of the IONEX file for 'product' and 'day' in 'directory'.
+
+    Upper case names (CODG2930.11I) are found too. Raises IOError when
+    the file is not there.
+    """
+    name = ionex_name(product, day)
+    for candidate in (name, name.upper()):
+        path = os.path.join(directory, candidate)
+        if os.path.exists(path):
+            return path
+    raise IOError("IONEX file %s not found in %s" % (name, directory))
@@ -0,0 +1,153 @@
+"""Progress journal of batch runs, so that a run that stopped half way
+can be resumed.
+
+While ionfr.batch.run_manifest writes its output it keeps a journal
+next to it (<output>.journal), one JSON line per (product, day) done:
+
+    {"unit": ["codg", "2011-10-20"], "jobs": [0, 3], "offset": 18342,
+     "inputs": {"ionex": "...", "field": "...", "code": "..."}}
+
+'jobs' are the jobs finished with that unit (those with no epochs on
+later days), 'offset' the size of the output once the rows of the unit
+are on disk and 'inputs' the digests of what they were computed from
+(see ionfr.provenance). The first line identifies the run (a digest of
+the manifest, the options and the output format), gives its settings
+and the offset at which its output starts. The output is synced to
+disk before each line is written, so after a crash the output may hold
+more than the journal says but never less: a resumed run cuts it back
+to the last offset and skips the units already done.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy
+
+from ionfr import provenance
+from ionfr.ionexfiles import ionex_path
+
+
+def journal_name(output):
+    """File name of the journal of 'output'."""
+    return output + ".journal"
+
+
+def fingerprint(manifest, **settings):
+    """Digest of the manifest file and the settings of a run; a journal
+    is only resumed by a run with the same one."""
+    digest = hashlib.sha256()
+    with open(manifest, "rb") as f:
+        digest.update(f.read())
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+class Journal:
+    """The journal 'filename' of a run identified by 'run' (see
+    fingerprint()).
+
+    With resume=True an existing journal of the same run (of any run
+    if 'run' is None) is read back: 'offset' is then the size of the
+    output to keep, units() the (product, day) already written and
+    'entries' their {"unit", "jobs", "start", "offset", "inputs"}.
+    Otherwise, or if there is no journal yet, 'offset' is None and
+    start() begins a new one.
+
+    'settings' ({"manifest", "ionexdir", "precision", "options"}, and
+    "teccache" when the TEC cache is on) are kept in the first line for
+    ionfr.refresh; with them every unit recorded is tagged with the
+    digests of its inputs.
+    """
+
+    def __init__(self, filename, run, resume=False, settings=None):
+        self.filename = filename
+        self.run = run
+        self.settings = settings
+        self.offset = None
+        self.jobs = set()
+        self.entries = []
+        self._units = []
+        self._file = None
+        if resume and os.path.exists(filename):
+            self._read()
+
+    def _read(self):
+        with open(self.filename, "rb") as f:
+            lines = f.read().split(b"\n")
+        good = 0
+        for number, line in enumerate(lines[:-1]):
+            # (a last line without its newline was cut by a crash)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if number == 0:
+                if self.run is None:
+                    self.run = entry.get("run")
+                elif entry.get("run") != self.run:
+                    raise ValueError(
+                        "%s belongs to another run (manifest or options changed); "
+                        "remove it to start again" % self.filename
+                    )
+                self.settings = entry.get("settings", self.settings)
+                self.offset = entry["offset"]
+            else:
+                unit = (entry["unit"][0], numpy.datetime64(entry["unit"][1], "D"))
+                self.entries.append(dict(entry, unit=unit, start=self.offset))
+                self._units.append(unit)
+                self.jobs.update(entry["jobs"])
+                self.offset = entry["offset"]
+            good += len(line) + 1
+        if self.offset is not None:
+            # the entries read are kept, anything after them dropped
+            os.truncate(self.filename, good)
+
+    def units(self):
+        """The (product, day) units already done."""
+        return set(self._units)
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def start(self, offset):
+        """Open the journal for writing; 'offset' is the size of the
+        output before the first unit (when not resuming)."""
+        if self.offset is not None:
+            self._file = open(self.filename, "a")
+        else:
+            self._file = open(self.filename, "w")
+            head = {"run": self.run, "offset": offset}
+            if self.settings is not None:
+                head["settings"] = self.settings
+            self._write(head)
+            self.offset = offset
+
+    def record(self, unit, jobs, offset):
+        """Note that 'unit' (product, day) is on disk, finishing 'jobs',
+        and the output is now 'offset' bytes long."""
+        product, day = unit
+        entry = {"unit": [product, str(day)], "jobs": sorted(jobs), "offset": offset}
+        if self.settings is not None:
+            entry["inputs"] = provenance.inputs(ionex_path(self.settings["ionexdir"], product, day))
+        self._write(entry)
+        self.entries.append(dict(entry, unit=unit, start=self.offset))
+        self._units.append(unit)
+        self.jobs.update(jobs)
+        self.offset = offset
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def cut_output(output, offset):
+    """Cut 'output' back to 'offset' bytes, dropping what a stopped run
+    wrote after its last journal entry."""
+    size = os.path.getsize(output) if os.path.exists(output) else 0
+    if size < offset:
+        raise ValueError("%s is shorter than its journal says (%d < %d bytes); cannot resume" % (output, size, offset))
+    os.truncate(output, offset)
@@ -0,0 +1,103 @@
+"""Make sure the IONEX files of a manifest are there before a run.
+
+plan() works out the (product, day) files the observations of a
+manifest need (every UT day they touch, and optionally the days around
+them), and sorts them into those already in the IONEX directory, those
+that only need unpacking from the local mirror and those to download.
+prefetch() then downloads the missing ones in one batch (ionfr.fetch)
+and unpacks them, so a batch run does not stop half way for want of a
+file.
+"""
+
+import gzip
+import os
+import shutil
+import subprocess
+from collections import namedtuple
+
+import numpy
+
+from ionfr import fetch
+from ionfr.batch import group_by_day
+from ionfr.ionexfiles import ionex_name, ionex_path
+
+# needed: every (product, day); present: already unpacked in the IONEX
+# directory; unpack: {(product, day): compressed file in the mirror};
+# download: not held at all
+Plan = namedtuple("Plan", "needed present unpack download")
+
+
+def required_files(jobs, neighbours=0):
+    """Sorted (product, day) pairs of the IONEX files 'jobs' need, with
+    'neighbours' more days on either side of each day."""
+    needed = set()
+    for product, day in group_by_day(jobs):
+        for offset in range(-neighbours, neighbours + 1):
+            needed.add((product, day + numpy.timedelta64(offset, "D")))
+    return sorted(needed, key=lambda pd: (pd[1], pd[0]))
+
+
+def _held(mirror, product, day, flat):
+    # the compressed file of (product, day) in the mirror, or None
+    for suffix in fetch.Suffixes:
+        path = fetch.mirror_file(mirror, product, day, suffix, flat)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def plan(jobs, ionexdir=".", mirror=None, neighbours=0):
+    """The Plan of the files needed by 'jobs'. Without 'mirror' the
+    compressed files are looked for (and go) in ionexdir itself."""
+    present, unpack, download = [], {}, []
+    needed = required_files(jobs, neighbours)
+    for product, day in needed:
+        try:
+            ionex_path(ionexdir, product, day)
+        except IOError:
+            pass
+        else:
+            present.append((product, day))
+            continue
+        held = _held(mirror or ionexdir, product, day, mirror is None)
+        if held is None:
+            download.append((product, day))
+        else:
+            unpack[(product, day)] = held
+    return Plan(needed, present, unpack, download)
+
+
+def unpack(compressed, ionexdir, product, day):
+    """Write the IONEX file of a .Z or .gz download to ionexdir."""
+    target = os.path.join(ionexdir, ionex_name(product, day))
+    part = target + ".part"
+    with open(part, "wb") as out:
+        if compressed.endswith(".gz"):
+            with gzip.open(compressed, "rb") as f:
+                shutil.copyfileobj(f, out)
+        else:
+            # Unix compress (.Z), which gzip can read
+            subprocess.run(["gzip", "-dc", compressed], stdout=out, check=True)
+    os.replace(part, target)
+    return target
+
+
+def prefetch(jobs, ionexdir=".", mirror=None, neighbours=0, url=fetch.DefaultURL, concurrency=fetch.Concurrency):
+    """Download and unpack the IONEX files 'jobs' need and do not have
+    yet; returns the Plan and the (product, day) still missing."""
+    p = plan(jobs, ionexdir, mirror, neighbours)
+    todo = dict(p.unpack)
+    missing = []
+    if p.download:
+        results = fetch.fetch(p.download, mirror or ionexdir, url, concurrency, flat=mirror is None)
+        for r in results:
+            if r.status in ("present", "downloaded"):
+                todo[(r.product, r.day)] = r.path
+            else:
+                missing.append((r.product, r.day))
+    for (product, day), compressed in sorted(todo.items(), key=lambda kv: (kv[0][1], kv[0][0])):
+        try:
+            unpack(compressed, ionexdir, product, day)
+        except (IOError, OSError, subprocess.CalledProcessError):
+            missing.append((product, day))
+    return p, sorted(missing, key=lambda pd: (pd[1], pd[0]))
@@ -0,0 +1,218 @@
+"""Wall time, calls and items of every stage of a run.
+
+enable() wraps the functions doing the work of each stage (IONEX
+parsing, map interpolation, sidereal time, piercing points, IGRF
+synthesis, ...) with timers; until it is called nothing is wrapped, so
+a run without profiling pays nothing at all. report() prints a table
+and to_json() gives the same numbers for other programs.
+
+Stages nest (the line of sight stages include the TEC, geometry and
+field ones), so the times do not add up to the total.
+
+The lookups and hits of the caches in CACHES (when they are on) are
+reported with the stages.
+"""
+
+import functools
+import importlib
+import json
+import sys
+import time
+from collections import OrderedDict
+
+import numpy
+
+
+def _count(result):
+    return 1
+
+
+def _size(result):
+    return int(numpy.size(result))
+
+
+def _first(result):
+    return int(numpy.size(result[0]))
+
+
+def _firstMember(result):
+    return int(numpy.size(result[0][0]))
+
+
+# stage: (module, attribute ('Class.method' for methods), items of a call
+# from its result, what the items are)
+STAGES = OrderedDict(
+    [
+        ("ionex.parse", ("ionfr.ionex.ionexmaps", "parseIONEX", _count, "files")),
+        ("ionex.interp", ("ionfr.ionex.ionexmaps", "interpMaps", _size, "points")),
+        ("ionex.series", ("ionfr.ionex.ionexmaps", "mapSeries", _first, "points")),
+        ("sidereal.altaz", ("ionfr.sidereal.siderealarray", "altAz", _first, "epochs")),
+        ("geometry.ipp", ("ionfr.puncture.ippcoor_v2", "PuncIonOffset", _first, "points")),
+        ("field.igrf", ("ionfr.igrf.igrffield", "calcField", _first, "points")),
+        ("field.coeffs", ("ionfr.igrf.igrffield", "coeffArrays", _count, "epochs")),
+        ("field.grid", ("ionfr.igrf.fieldgrid", "FieldGrid.field", _first, "points")),
+        ("field.gridbuild", ("ionfr.igrf.fieldgrid", "buildFieldGrid", _count, "grids")),
+        ("los.multishell", ("ionfr.puncture.multishell", "calcMultiShell", _first, "epochs")),
+        ("los.driftscan", ("ionfr.puncture.driftscan", "calcFixedAltAz", _first, "epochs")),
+        ("los.ensemble", ("ionfr.puncture.multishell", "calcEnsemble", _firstMember, "epochs")),
+        ("los.montecarlo", ("ionfr.puncture.montecarlo", "calcMonteCarlo", _first, "epochs")),
+        ("output.write", ("ionfr.writers", "RMWriter.write", None, "rows")),
+    ]
+)
+
+# cache: (module, attribute holding the cache object or None); the
+# object counts 'lookups' and 'hits'
+CACHES = OrderedDict(
+    [
+        ("ionex.tec", ("ionfr.ionex.ionexmaps", "_tecCache")),
+    ]
+)
+
+# stage: [calls, seconds, items]
+_stats = OrderedDict()
+# cache: [lookups, hits]
+_caches = OrderedDict()
+_wrapped = []
+_started = None
+
+
+def enabled():
+    return _started is not None
+
+
+def _timed(stage, function, items):
+    entry = _stats.setdefault(stage, [0, 0.0, 0])
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        entry[1] += time.perf_counter() - start
+        entry[0] += 1
+        if items is None:
+            # RMWriter.write(self, rows)
+            entry[2] += int(numpy.size(args[1]))
+        else:
+            entry[2] += items(result)
+        return result
+
+    return wrapper
+
+
+def enable():
+    """Start timing the stages (from now on, in this process)."""
+    global _started
+    if _started is not None:
+        return
+    for stage, (module, attribute, items, _) in STAGES.items():
+        owner = importlib.import_module(module)
+        name = attribute
+        if "." in attribute:
+            cls, name = attribute.split(".")
+            owner = getattr(owner, cls)
+        original = getattr(owner, name)
+        _wrapped.append((owner, name, original))
+        setattr(owner, name, _timed(stage, original, items))
+    _started = time.perf_counter()
+
+
+def disable():
+    """Stop timing and put the original functions back."""
+    global _started
+    while _wrapped:
+        owner, name, original = _wrapped.pop()
+        setattr(owner, name, original)
+    _started = None
+
+
+def _collect():
+    # move the counters of the caches into _caches
+    for name, (module, attribute) in CACHES.items():
+        cache = getattr(sys.modules.get(module), attribute, None)
+        if cache is None:
+            continue
+        entry = _caches.setdefault(name, [0, 0])
+        entry[0] += cache.lookups
+        entry[1] += cache.hits
+        cache.lookups = cache.hits = 0
+
+
+def reset():
+    _collect()
+    for entry in _stats.values():
+        entry[:] = [0, 0.0, 0]
+    for entry in _caches.values():
+        entry[:] = [0, 0]
+
+
+def take():
+    """The counters gathered so far, which are then set to zero
+    (for worker processes to hand them to the parent)."""
+    _collect()
+    stats = {
+        "stages": {stage: list(entry) for stage, entry in _stats.items() if entry[0]},
+        "caches": {name: list(entry) for name, entry in _caches.items() if entry[0]},
+    }
+    reset()
+    return stats
+
+
+def merge(stats):
+    """Add the counters of take() (of another process)."""
+    for stage, (calls, seconds, items) in stats["stages"].items():
+        entry = _stats.setdefault(stage, [0, 0.0, 0])
+        entry[0] += calls
+        entry[1] += seconds
+        entry[2] += items
+    for name, (lookups, hits) in stats["caches"].items():
+        entry = _caches.setdefault(name, [0, 0])
+        entry[0] += lookups
+        entry[1] += hits
+
+
+def to_json():
+    """The counters as a dict: {"total": seconds, "stages": {stage:
+    {"calls", "seconds", "items", "unit", "per_second"}}, "caches":
+    {cache: {"lookups", "hits", "hit_rate"}}}."""
+    _collect()
+    stages = OrderedDict()
+    for stage, (calls, seconds, items) in _stats.items():
+        if not calls:
+            continue
+        stages[stage] = {
+            "calls": calls,
+            "seconds": seconds,
+            "items": items,
+            "unit": STAGES[stage][3] if stage in STAGES else "items",
+            "per_second": items / seconds if seconds > 0 else None,
+        }
+    caches = OrderedDict()
+    for name, (lookups, hits) in _caches.items():
+        if lookups:
+            caches[name] = {"lookups": lookups, "hits": hits, "hit_rate": hits / lookups}
+    total = time.perf_counter() - _started if _started is not None else None
+    return {"total": total, "stages": stages, "caches": caches}
+
+
+def report(json_file=None, table=True, out=None):
+    """Print the table of the stages (to 'out', stderr by default)
+    and/or write the JSON to 'json_file'."""
+    data = to_json()
+    if json_file is not None:
+        with open(json_file, "w") as f:
+            json.dump(data, f, indent=1)
+    if not table:
+        return
+    out = out or sys.stderr
+    out.write("%-16s %8s %10s %12s %8s %14s\n" % ("stage", "calls", "seconds", "items", "", "items/s"))
+    for stage, s in data["stages"].items():
+        rate = "%14.4g" % s["per_second"] if s["per_second"] is not None else "%14s" % "-"
+        out.write(
+            "%-16s %8d %10.4f %12d %-8s %s\n" % (stage, s["calls"], s["seconds"], s["items"], s["unit"], rate)
+        )
+    if data["total"] is not None:
+        out.write("%-16s %8s %10.4f\n" % ("total", "", data["total"]))
+    if data["caches"]:
+        out.write("\n%-16s %12s %12s %8s\n" % ("cache", "lookups", "hits", "hit rate"))
+        for name, c in data["caches"].items():
+            out.write("%-16s %12d %12d %7.1f%%\n" % (name, c["lookups"], c["hits"], 100.0 * c["hit_rate"]))
@@ -0,0 +1,77 @@
+"""Digests of the inputs of a result, to tell the results whose inputs
+changed from those still up to date (see ionfr.refresh).
+
+Every (product, day) of a batch run is tagged in the journal of its
+output (see ionfr.journal) with
+
+    ionex   digest of the content of the IONEX file, which changes when
+            e.g. a final product replaces a rapid one
+    field   digest of the IGRF coefficients pyIGRF provides, which
+            changes with the IGRF generation installed
+    code    digest of the source of the modules the RM is computed
+            with, which changes with ionFR itself
+
+The digests are the first 16 hex digits of a SHA-256.
+"""
+
+import hashlib
+import importlib
+import os
+
+# The modules whose source makes up the 'code' digest
+CODE_MODULES = (
+    "ionfr.compute",
+    "ionfr.ionex.ionexmaps",
+    "ionfr.puncture.multishell",
+    "ionfr.puncture.driftscan",
+    "ionfr.puncture.ippcoor_v2",
+    "ionfr.sidereal.sidereal",
+    "ionfr.sidereal.siderealarray",
+    "ionfr.igrf.igrffield",
+    "ionfr.igrf.fieldgrid",
+)
+
+# {realpath: (mtime, size, digest)} of the files digested so far
+_files = {}
+_code = None
+
+
+def file_digest(path):
+    """Digest of the content of a file (computed again only when its
+    time stamp or size change)."""
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    known = _files.get(path)
+    if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+        return known[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    _files[path] = (st.st_mtime_ns, st.st_size, digest.hexdigest()[:16])
+    return _files[path][2]
+
+
+def field_digest():
+    """Digest of the IGRF coefficients."""
+    from ionfr.igrf import igrffield
+
+    return igrffield.modelDigest()
+
+
+def code_digest():
+    """Digest of the source of CODE_MODULES."""
+    global _code
+    if _code is None:
+        digest = hashlib.sha256()
+        for name in CODE_MODULES:
+            with open(importlib.import_module(name).__file__, "rb") as f:
+                digest.update(f.read())
+        _code = digest.hexdigest()[:16]
+    return _code
+
+
+def inputs(ionex):
+    """{"ionex", "field", "code"} digests of the results computed from
+    the IONEX file 'ionex'."""
+    return {"ionex": file_digest(ionex), "field": field_digest(), "code": code_digest()}
@@ -0,0 +1,3 @@
+"""Ionospheric piercing points and the Faraday rotation along the line
+of sight (the PunctureIonosphereCoord package of ionFR): ippcoor_v1,
+ippcoor_v2, multishell and driftscan."""
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+#-------------------------------------------------------------------
+# Ionospheric Faraday rotation for a fixed pointing in horizon
+# coordinates (drift scans, zenith pointing arrays).
+#
+# When the azimuth and altitude of the line of sight do not change,
+# neither do the Ionospheric piercing point, the angles at the IPP
+# nor (within a day) the geomagnetic field there. These are thus
+# computed once; no sidereal time is needed at all. Only the TEC
+# changes with time: the TEC of every hourly map is interpolated at
+# the IPP once and the resulting time series is then interpolated
+# at all the epochs, so any number of epochs costs a single
+# numpy.interp call.
+#
+# Input:
+#	LatObs		latitude of the antenna (radians, north > 0)
+#	LonObs		longitude of the antenna (radians, east > 0)
+#	AzS		azimuth of the line of sight (radians)
+#	AlS		altitude of the line of sight (radians)
+#	hour		UT hours of the epochs within the IONEX day
+#			(array)
+#	decimalyear	epoch of the geomagnetic field
+#	ionex		an ionexmaps.IonexData instance
+# Output:
+#	TECpath		TEC along the line of sight (m^-2)
+#	Totfield	geomagnetic field along the line of sight (Gauss)
+#	IFR		Ionospheric Faraday rotation (rad m^-2)
+#	RMSIFR		its uncertainty from the RMS TEC maps
+#	(arrays with the shape of 'hour')
+#-------------------------------------------------------------------
+
+import numpy
+
+from ionfr.puncture import ippcoor_v2 as ippcoor
+from ionfr.igrf import igrffield
+from ionfr.igrf import fieldgrid
+from ionfr.puncture.multishell import TEC2m2, EarthRadius, losField
+
+
+def calcFixedAltAz(LatObs, LonObs, AzS, AlS, hour, decimalyear, ionex, gridDir=None):
+
+    hour = numpy.asarray(hour, dtype=float)
+    ZenS = (numpy.pi / 2.0) - AlS
+    AltIon = ionex.height * 1000.0  # km to m
+
+    # the piercing point, once for all the epochs
+    offLat, offLon, AzPunct, ZenPunct = ippcoor.PuncIonOffset(LatObs, AzS, ZenS, AltIon)
+    lat = float(LatObs + offLat) * 180.0 / numpy.pi
+    lon = float(LonObs + offLon) * 180.0 / numpy.pi
+
+    # and the field along the line of sight there
+    radius = (EarthRadius + AltIon) / 1000.0  # from Earth centre in km
+    if gridDir is None:
+        Xfield, Yfield, Zfield = igrffield.calcField(lat, lon, radius, decimalyear)
+    else:
+        Xfield, Yfield, Zfield = fieldgrid.getFieldGrid(gridDir, decimalyear, radius).field(lat, lon)
+    Totfield = float(losField(Xfield, Yfield, Zfield, AzPunct, ZenPunct))
+
+    # TEC and RMS TEC of every hourly map at the IPP, then in time
+    maps = numpy.arange(ionex.tecMaps.shape[0])
+    slant = TEC2m2 / numpy.cos(float(ZenPunct))
+    TECpath = numpy.interp(hour, maps, ionex.tecSeries(lat, lon)) * slant
+    RMSTECpath = numpy.interp(hour, maps, ionex.rmsSeries(lat, lon)) * slant
+
+    IFR = 2.6 * pow(10, -17) * Totfield * TECpath
+    RMSIFR = 2.6 * pow(10, -17) * Totfield * RMSTECpath
+    return TECpath, numpy.full(hour.shape, Totfield), IFR, RMSIFR
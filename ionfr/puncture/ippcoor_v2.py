@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+#-------------------------------------------------------------------
+# Vectorised version of ippcoor_v1.PuncIonOffset
+#
+# Same geometry (thin shell at a uniform altitude, sine and cosine
+# rules for spherical triangles), but every argument can be a numpy
+# array: all of them are broadcast together, so piercing points for
+# many epochs, lines of sight and/or shell heights are obtained in
+# one call.
+#
+# Input:
+#	LatObs		latitude of the antenna (radians)
+#	AzSou		Azimtuh of the source (radians)
+#			from antenna location
+#	ZeSou		Zenith of the source (radians)
+#			from antenna location
+#	AltIon		height of the Ionospheric thin shell
+#			(meters)
+# Output:
+#	dLat		offset latitude (radians)
+#	dLon		offset longitude (radians)
+#	AzPunc		Azimuth of the source (radians)
+#			from IPP
+#	ZenPunc		Zenith of the source (radians)
+#			from IPP
+#-------------------------------------------------------------------
+
+import numpy
+from numpy import sin, cos, arcsin, pi
+
+RadiusEarth = 6371000.0 # in meters
+
+def PuncIonOffset(LatObs,AzSou,ZeSou,AltIon):
+
+	LatObs, AzSou, ZeSou, AltIon = numpy.broadcast_arrays(
+		numpy.asarray(LatObs, dtype=float),
+		numpy.asarray(AzSou, dtype=float),
+		numpy.asarray(ZeSou, dtype=float),
+		numpy.asarray(AltIon, dtype=float),
+	)
+
+	AzSou = numpy.where(AzSou > pi, AzSou - 2*pi, AzSou)
+
+	# The 2-D sine rule gives the zenith angle at the
+	# Ionospheric piercing point
+	ZenPunc = arcsin((RadiusEarth*sin(ZeSou))/(RadiusEarth + AltIon))
+
+	# Use the sum of the internal angles of a triange to determine theta
+	theta = ZeSou - ZenPunc
+
+	# The cosine rule for spherical triangles gives us the latitude
+	# at the IPP
+	lation = arcsin(sin(LatObs)*cos(theta) + cos(LatObs)*sin(theta)*cos(AzSou))
+	dLat = lation - LatObs # latitude difference
+
+	# Longitude difference using the 3-D sine rule (or for spherical triangles)
+	# (rounding can take the sines just past +/-1 for large offsets)
+	dLon = arcsin(numpy.clip(sin(AzSou)*sin(theta)/cos(lation), -1.0, 1.0))
+
+	# Azimuth at the IPP using the 3-D sine rule
+	sazion = sin(AzSou)*cos(LatObs)/cos(lation)
+	AzPunc = arcsin(numpy.clip(sazion, -1.0, 1.0))
+
+	AzPunc = numpy.where(AzSou > 0.5*pi, AzPunc + 2.*abs(AzPunc-pi/2.),
+		numpy.where(AzSou < -0.5*pi, AzPunc - 2.*abs((abs(AzPunc)-pi/2.)), AzPunc))
+
+	return dLat,dLon,AzPunc,ZenPunc
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+#-------------------------------------------------------------------
+# Monte Carlo distribution of the ionospheric Faraday rotation of a
+# thin shell.
+#
+# calcMultiShell turns the RMS TEC maps into an RM error by linear
+# scaling (RMSIFR = 2.6e-17 Totfield RMSTECpath), as if the TEC were
+# the only uncertain quantity. Here nSamples realisations of
+#
+#   the vertical TEC	VTEC + RMS z, z a Gaussian random field of
+#			unit variance correlated over 'corrLength'
+#			degrees and 'corrTime' hours (independent
+#			normals on a lattice of that spacing,
+#			interpolated to the piercing points)
+#   the shell height	normal around the IONEX height with
+#			'heightSigma' (meters, cut at 4 sigma), which
+#			moves the piercing points
+#   the field		times 1 + 'fieldSigma' n (relative error of
+#			the model)
+#
+# are evaluated as one broadcast (sample, epoch) array computation
+# and the percentiles of the RM over the samples are returned for
+# every epoch. The piercing points and the field are computed on a
+# ladder of 'nLadder' heights across +/- 4 heightSigma and
+# interpolated to the height of every sample, so the IGRF is only
+# synthesised nLadder times per epoch. The epochs are taken in
+# chunks of about ChunkSize (sample, epoch) values.
+#
+# Input (calcMonteCarlo):
+#	LatObs		latitude of the antenna (radians, north > 0)
+#	LonObs		longitude of the antenna (radians, east > 0)
+#	AzS		azimuth of the source (radians), array of epochs
+#	ZenS		zenith of the source (radians), array of epochs
+#	hour		UT hours of the epochs within the IONEX day
+#	decimalyear	epoch of the geomagnetic field
+#	ionex		an ionexmaps.IonexData instance
+#	nSamples	number of realisations
+#	percentiles	percentiles (0-100) of the RM to return
+#	seed		of the random numbers, for repeatable results
+# Output:
+#	RMpct		percentiles of the RM (rad m^-2), one row per
+#			percentile and one column per epoch
+#-------------------------------------------------------------------
+
+import numpy
+
+from ionfr.puncture import ippcoor_v2 as ippcoor
+from ionfr.puncture import multishell
+from ionfr.igrf import igrffield
+
+Percentiles = (2.5, 16.0, 50.0, 84.0, 97.5)
+HeightSigma = 50000.0  # meters
+FieldSigma = 0.005
+CorrLength = 5.0  # degrees
+CorrTime = 2.0  # hours
+ChunkSize = 1 << 18
+
+
+class LatticeNoise:
+    # Gaussian random field of unit variance for nSamples realisations:
+    # independent normals at the nodes of a lattice of 'length'
+    # degrees and 'time' hours, interpolated (and renormalised) to the
+    # points. The normals are drawn when a node is first needed and
+    # kept (sorted by node), so that chunks of points share them.
+
+    def __init__(self, nSamples, length, time, rng):
+        if length <= 0 or time <= 0:
+            raise ValueError("The correlation length and time must be positive")
+        self.nSamples = nSamples
+        self.length = float(length)
+        self.time = float(time)
+        self.rng = rng
+        self.nLon = int(numpy.ceil(360.0 / self.length))
+        self.nT = int(numpy.ceil(26.0 / self.time)) + 3
+        self.keys = numpy.empty(0, dtype=numpy.int64)
+        self.values = numpy.empty((nSamples, 0))
+
+    def __call__(self, lat, lon, hour):
+        # lat, lon (degrees) and hour broadcast to (nSamples, n)
+        lat, lon, hour, _ = numpy.broadcast_arrays(lat, lon, hour, numpy.empty((self.nSamples, 1)))
+        u = (lat + 90.0) / self.length
+        v = ((lon + 180.0) % 360.0) / self.length
+        s = numpy.clip(hour / self.time, -1.0, self.nT - 3.0) + 1.0
+        a, b, c = numpy.floor(u), numpy.floor(v), numpy.floor(s)
+        u, v, s = u - a, v - b, s - c
+        a, b, c = a.astype(numpy.int64), b.astype(numpy.int64), c.astype(numpy.int64)
+
+        # the block of nodes around the points: the rows of latitude
+        # and time between the extremes, the columns of longitude
+        # touched (which wrap around)
+        a0, c0 = a.min(), c.min()
+        na, nc = a.max() - a0 + 2, c.max() - c0 + 2
+        touched = numpy.zeros(self.nLon, dtype=bool)
+        touched[b] = True
+        touched[(b + 1) % self.nLon] = True
+        columns = numpy.flatnonzero(touched)
+        column = numpy.cumsum(touched) - 1
+        keys = (numpy.arange(a0, a0 + na)[:, None, None] * self.nLon + columns[:, None]) * self.nT + numpy.arange(
+            c0, c0 + nc
+        )
+        block = self._normals(keys.ravel()).ravel()
+
+        # the normals at the 8 corners of every point, from the block
+        rows = numpy.arange(self.nSamples)[:, None] * keys.size
+        a, c = a - a0, c - c0
+        b = (column[b], column[(b + 1) % self.nLon])
+        z = numpy.zeros(lat.shape)
+        norm = numpy.zeros(lat.shape)
+        for da in (0, 1):
+            for db in (0, 1):
+                for dc in (0, 1):
+                    w = (u if da else 1.0 - u) * (v if db else 1.0 - v) * (s if dc else 1.0 - s)
+                    index = ((a + da) * len(columns) + b[db]) * nc + (c + dc)
+                    z += w * block[rows + index]
+                    norm += w * w
+        return z / numpy.sqrt(norm)
+
+    def _normals(self, keys):
+        # the normals of every sample (row) at the nodes of 'keys'
+        new = numpy.setdiff1d(keys, self.keys)
+        if len(new):
+            allKeys = numpy.concatenate([self.keys, new])
+            values = numpy.concatenate([self.values, self.rng.standard_normal((self.nSamples, len(new)))], axis=1)
+            order = numpy.argsort(allKeys)
+            self.keys, self.values = allKeys[order], values[:, order]
+        return self.values[:, numpy.searchsorted(self.keys, keys)]
+
+
+def calcMonteCarlo(
+    LatObs,
+    LonObs,
+    AzS,
+    ZenS,
+    hour,
+    decimalyear,
+    ionex,
+    nSamples=1000,
+    percentiles=Percentiles,
+    heightSigma=HeightSigma,
+    fieldSigma=FieldSigma,
+    corrLength=CorrLength,
+    corrTime=CorrTime,
+    nLadder=9,
+    seed=None,
+):
+
+    AzS = numpy.asarray(AzS, dtype=float)
+    hour = numpy.broadcast_to(numpy.asarray(hour, dtype=float), AzS.shape)
+    LatObs = numpy.broadcast_to(numpy.asarray(LatObs, dtype=float), AzS.shape)[:, None]
+    LonObs = numpy.broadcast_to(numpy.asarray(LonObs, dtype=float), AzS.shape)[:, None]
+    ZenS = numpy.asarray(ZenS, dtype=float)[:, None]
+    if nSamples < 1:
+        raise ValueError("At least one sample is needed")
+    if heightSigma < 0 or fieldSigma < 0:
+        raise ValueError("The height and field errors cannot be negative")
+
+    # piercing points, slant factor and field on the ladder of heights
+    # (epoch, height)
+    height = ionex.height * 1000.0
+    ladder = height + heightSigma * (numpy.linspace(-4.0, 4.0, nLadder) if heightSigma > 0 else numpy.zeros(1))
+    if ladder[0] <= 0:
+        raise ValueError("The shell height error reaches below the ground")
+    offLat, offLon, AzPunct, ZenPunct = ippcoor.PuncIonOffset(LatObs, AzS[:, None], ZenS, ladder)
+    latL = (LatObs + offLat) * 180.0 / numpy.pi
+    lonL = (LonObs + offLon) * 180.0 / numpy.pi
+    slantL = multishell.TEC2m2 / numpy.cos(ZenPunct)
+    radius = (multishell.EarthRadius + ladder) / 1000.0
+    Xfield, Yfield, Zfield = igrffield.calcField(latL, lonL, radius, decimalyear)
+    BL = multishell.losField(Xfield, Yfield, Zfield, AzPunct, ZenPunct)
+
+    # the shell height and field error of every sample
+    rng = numpy.random.RandomState(seed)
+    h = numpy.clip(rng.standard_normal(nSamples), -4.0, 4.0)
+    g = 1.0 + fieldSigma * rng.standard_normal(nSamples)[:, None]
+    pos = (h + 4.0) / 8.0 * (len(ladder) - 1)
+    k0 = numpy.minimum(numpy.floor(pos).astype(int), max(len(ladder) - 2, 0))
+    k1 = numpy.minimum(k0 + 1, len(ladder) - 1)
+    f = (pos - k0)[:, None]
+
+    def atHeights(values):
+        # (epoch, ladder) values at the height of every sample,
+        # (sample, epoch)
+        values = values.T
+        return (1.0 - f) * values[k0] + f * values[k1]
+
+    noise = LatticeNoise(nSamples, corrLength, corrTime, rng)
+    RMpct = numpy.empty((len(percentiles), len(AzS)))
+    chunk = max(1, ChunkSize // nSamples)
+    for start in range(0, len(AzS), chunk):
+        sl = slice(start, start + chunk)
+        lat = atHeights(latL[sl])
+        lon = atHeights(lonL[sl])
+        hr = hour[sl]
+        TEC, RMSTEC = ionex.tecRms(lat, lon, hr)
+        VTEC = TEC + RMSTEC * noise(lat, lon, hr)
+        IFR = 2.6 * pow(10, -17) * numpy.maximum(VTEC, 0.0) * atHeights(slantL[sl]) * atHeights(BL[sl]) * g
+        RMpct[:, sl] = numpy.percentile(IFR, percentiles, axis=0)
+
+    return RMpct
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+#-------------------------------------------------------------------
+# Ionospheric Faraday rotation integrated along the line of sight
+# through several Ionospheric shells.
+#
+# Instead of a single thin shell at the height given in the IONEX
+# file, the slant path is sampled at 'nShells' heights. At every
+# sample the piercing point, the vertical TEC (from the IONEX maps)
+# and the geomagnetic field are evaluated, and the contribution of
+# the sample is weighted by a vertical electron density profile:
+#
+#   TECpath = sum_k w_k VTEC(IPP_k) / cos(ZenPunct_k)
+#   IFR     = 2.6e-17 sum_k w_k VTEC(IPP_k) / cos(ZenPunct_k) B_k
+#
+# with sum_k w_k = 1, so a single shell at the IONEX height gives
+# back the thin shell result. Every epoch and every shell is
+# evaluated in one vectorised pass. calcEnsemble does the same for
+# several IONEX files (products) of a day, sharing the piercing
+# points and the field.
+#
+# Input (calcMultiShell):
+#	LatObs		latitude of the antenna (radians, north > 0)
+#	LonObs		longitude of the antenna (radians, east > 0)
+#	AzS		azimuth of the source (radians), array of epochs
+#	ZenS		zenith of the source (radians), array of epochs
+#	hour		UT hours of the epochs within the IONEX day
+#	(LatObs and LonObs are scalars, or arrays with one
+#	antenna per epoch, e.g. for several stations)
+#	decimalyear	epoch of the geomagnetic field
+#	ionex		an ionexmaps.IonexData instance
+# Output:
+#	TECpath		TEC along the line of sight (m^-2)
+#	Totfield	TEC weighted geomagnetic field along the line of
+#			sight (Gauss)
+#	IFR		Ionospheric Faraday rotation (rad m^-2)
+#	RMSIFR		its uncertainty from the RMS TEC maps
+#-------------------------------------------------------------------
+
+import numpy
+
+from ionfr.puncture import ippcoor_v2 as ippcoor
+from ionfr.ionex import ionexmaps
+from ionfr.igrf import igrffield
+from ionfr.igrf import fieldgrid
+
+TECU = pow(10, 16)
+TEC2m2 = 0.1 * TECU
+EarthRadius = 6371000.0  # in meters
+Tesla2Gauss = pow(10, 4)
+
+# Default range of heights sampled along the line of sight and
+# scale height of the Chapman profile (meters)
+ShellBottom = 100000.0
+ShellTop = 1000000.0
+ScaleHeight = 100000.0
+
+
+def shellHeights(nShells, bottom=ShellBottom, top=ShellTop):
+    # heights (meters) of the middle of nShells equally thick layers
+    step = (top - bottom) / nShells
+    return bottom + step * (numpy.arange(nShells) + 0.5)
+
+
+def chapmanProfile(heights, peak, scale=ScaleHeight):
+    # Chapman-alpha layer with its maximum at 'peak'
+    z = (heights - peak) / scale
+    return numpy.exp(0.5 * (1.0 - z - numpy.exp(-z)))
+
+
+def uniformProfile(heights, peak, scale=ScaleHeight):
+    return numpy.ones_like(heights)
+
+
+Profiles = {"chapman": chapmanProfile, "uniform": uniformProfile}
+
+
+def shellWeights(heights, peak, profile="chapman", scale=ScaleHeight):
+    # Normalised weights of the shells. 'profile' is the name of one
+    # of Profiles, a function f(heights, peak, scale) or an array
+    # with one (relative) density per shell.
+    if isinstance(profile, str):
+        if profile not in Profiles:
+            raise ValueError("Unknown vertical profile '%s'" % profile)
+        w = Profiles[profile](heights, peak, scale)
+    elif callable(profile):
+        w = profile(heights, peak, scale)
+    else:
+        w = numpy.asarray(profile, dtype=float)
+        if w.shape != heights.shape:
+            raise ValueError("One profile value per shell is needed")
+    return w / w.sum()
+
+
+def losField(Xfield, Yfield, Zfield, AzPunct, ZenPunct):
+    # Geomagnetic field (nT components) projected on the line of
+    # sight at the IPP, in Gauss
+    Xfield = abs(Xfield) * pow(10, -9) * Tesla2Gauss
+    Yfield = abs(Yfield) * pow(10, -9) * Tesla2Gauss
+    Zfield = abs(Zfield) * pow(10, -9) * Tesla2Gauss
+    return (
+        Zfield * numpy.cos(ZenPunct)
+        + Yfield * numpy.sin(ZenPunct) * numpy.sin(AzPunct)
+        - Xfield * numpy.sin(ZenPunct) * numpy.cos(AzPunct)
+    )
+
+
+def shellGeometry(LatObs, LonObs, AzS, ZenS, heights, decimalyear, gridDir=None):
+    # Piercing points (degrees), slant factor and line of sight field
+    # of every (epoch, shell), which do not depend on the TEC maps.
+    # The arguments are as those of calcMultiShell, with a trailing
+    # axis for the shells.
+    offLat, offLon, AzPunct, ZenPunct = ippcoor.PuncIonOffset(LatObs, AzS, ZenS, heights)
+    lat = (LatObs + offLat) * 180.0 / numpy.pi
+    lon = (LonObs + offLon) * 180.0 / numpy.pi
+
+    # vertical TEC (and RMS TEC) to line of sight TEC
+    slant = TEC2m2 / numpy.cos(ZenPunct)
+
+    radius = (EarthRadius + heights) / 1000.0  # from Earth centre in km
+    if gridDir is None:
+        Xfield, Yfield, Zfield = igrffield.calcField(lat, lon, radius, decimalyear)
+    else:
+        # one daily grid per shell height
+        Xfield = numpy.empty_like(lat)
+        Yfield = numpy.empty_like(lat)
+        Zfield = numpy.empty_like(lat)
+        for k in range(len(heights)):
+            grid = fieldgrid.getFieldGrid(gridDir, decimalyear, radius[k])
+            Xfield[..., k], Yfield[..., k], Zfield[..., k] = grid.field(lat[..., k], lon[..., k])
+    Bk = losField(Xfield, Yfield, Zfield, AzPunct, ZenPunct)
+    return lat, lon, slant, Bk
+
+
+def shellRM(TEC, RMSTEC, slant, Bk, w):
+    # TECpath, Totfield, IFR and RMSIFR from the vertical TEC and RMS
+    # TEC of every (epoch, shell)
+    TECk = TEC * slant
+    RMSTECk = RMSTEC * slant
+
+    TECpath = (w * TECk).sum(axis=-1)
+    IFR = 2.6 * pow(10, -17) * (w * TECk * Bk).sum(axis=-1)
+    RMSIFR = 2.6 * pow(10, -17) * (w * RMSTECk * Bk).sum(axis=-1)
+    # the TEC weighted mean of the field; where there is no TEC on
+    # the line of sight, the mean weighted by the profile alone
+    some = TECpath > 0
+    Totfield = numpy.where(
+        some,
+        IFR / (2.6 * pow(10, -17) * numpy.where(some, TECpath, 1.0)),
+        (w * Bk).sum(axis=-1),
+    )
+
+    return TECpath, Totfield, IFR, RMSIFR
+
+
+def calcMultiShell(
+    LatObs,
+    LonObs,
+    AzS,
+    ZenS,
+    hour,
+    decimalyear,
+    ionex,
+    nShells=10,
+    profile="chapman",
+    scale=ScaleHeight,
+    bottom=ShellBottom,
+    top=ShellTop,
+    gridDir=None,
+):
+
+    LatObs = numpy.asarray(LatObs, dtype=float)[..., None]
+    LonObs = numpy.asarray(LonObs, dtype=float)[..., None]
+    AzS = numpy.asarray(AzS, dtype=float)[..., None]
+    ZenS = numpy.asarray(ZenS, dtype=float)[..., None]
+    hour = numpy.asarray(hour, dtype=float)[..., None]
+
+    heights = shellHeights(nShells, bottom, top)
+    w = shellWeights(heights, ionex.height * 1000.0, profile, scale)
+
+    # piercing points and field of every (epoch, shell), then the TEC
+    lat, lon, slant, Bk = shellGeometry(LatObs, LonObs, AzS, ZenS, heights, decimalyear, gridDir)
+    TEC, RMSTEC = ionex.tecRms(lat, lon, hour)
+    return shellRM(TEC, RMSTEC, slant, Bk, w)
+
+
+def calcEnsemble(
+    LatObs,
+    LonObs,
+    AzS,
+    ZenS,
+    hour,
+    decimalyear,
+    datasets,
+    nShells=10,
+    profile="chapman",
+    scale=ScaleHeight,
+    bottom=ShellBottom,
+    top=ShellTop,
+    gridDir=None,
+):
+    # calcMultiShell for several IONEX files (products) of one day,
+    # a list of (TECpath, Totfield, IFR, RMSIFR), one per file. The
+    # piercing points and the field do not depend on the maps, so
+    # they are computed once for all the files with the same shell
+    # heights, and the TEC of those files is interpolated in one
+    # pass (ionexmaps.tecStack). With bottom and top None every file
+    # has a thin shell at its own height.
+
+    LatObs = numpy.asarray(LatObs, dtype=float)[..., None]
+    LonObs = numpy.asarray(LonObs, dtype=float)[..., None]
+    AzS = numpy.asarray(AzS, dtype=float)[..., None]
+    ZenS = numpy.asarray(ZenS, dtype=float)[..., None]
+    hour = numpy.asarray(hour, dtype=float)[..., None]
+
+    # the files by shell heights
+    groups = {}
+    for n, ionex in enumerate(datasets):
+        if bottom is None:
+            heights = numpy.array([ionex.height * 1000.0])
+        else:
+            heights = shellHeights(nShells, bottom, top)
+        groups.setdefault(tuple(heights), []).append(n)
+
+    results = [None] * len(datasets)
+    for heights, members in groups.items():
+        heights = numpy.array(heights)
+        lat, lon, slant, Bk = shellGeometry(LatObs, LonObs, AzS, ZenS, heights, decimalyear, gridDir)
+        TEC, RMSTEC = ionexmaps.tecStack([datasets[n] for n in members], lat, lon, hour)
+        for m, n in enumerate(members):
+            w = shellWeights(heights, datasets[n].height * 1000.0, profile, scale)
+            results[n] = shellRM(TEC[m], RMSTEC[m], slant, Bk, w)
+    return results
@@ -0,0 +1,151 @@
+"""Recompute only the results of a batch run whose inputs changed
+(ionfr-refresh).
+
+The journal of a manifest run (see ionfr.journal) tags every
+(product, day) of its output with the digests of the IONEX file, the
+IGRF coefficients and the code it was computed with. refresh() digests
+them again and computes only the units where one of them differs (a
+final IONEX product replacing a rapid one, a new IGRF generation, a new
+version of ionFR), and those the run did not get to. The rows of the
+other units are copied from the old output as they are. The new output
+and journal replace the old ones once complete, so an interrupted
+refresh leaves the old ones untouched.
+
+    ionfr-refresh IonRMbatch.txt [--ionexdir DIR] [--processes N] [--dry-run]
+"""
+
+import optparse as op
+import os
+import sys
+
+from ionfr.batch import BATCH_DTYPE, group_by_day, last_day, read_manifest, result_rows, run_fingerprint, run_jobs
+from ionfr.ionexfiles import ionex_path
+from ionfr.ionex import ionexmaps
+from ionfr.journal import Journal, journal_name
+from ionfr.provenance import inputs
+from ionfr.writers import RMWriter, guess_format
+
+
+def read_journal(output):
+    """The Journal of 'output', which must hold the settings of its run."""
+    journal = Journal(journal_name(output), None, resume=True)
+    if journal.offset is None:
+        raise IOError("No journal of %s (%s)" % (output, journal.filename))
+    if journal.settings is None:
+        raise ValueError("%s does not have the settings of its run; run the manifest again" % journal.filename)
+    return journal
+
+
+def stale_units(output, ionexdir=None):
+    """The (product, day) units of 'output' to compute again, in the
+    order of the output, and the Journal of 'output'."""
+    journal = read_journal(output)
+    settings = journal.settings
+    run = run_fingerprint(settings["manifest"], output, settings)
+    if run != journal.run:
+        raise ValueError("The manifest %s changed since %s was written; run it again" % (settings["manifest"], output))
+    ionexdir = ionexdir or settings["ionexdir"]
+    recorded = {entry["unit"]: entry for entry in journal.entries}
+    stale = []
+    for product, day in group_by_day(read_manifest(settings["manifest"])):
+        entry = recorded.get((product, day))
+        if entry is None or entry.get("inputs") != inputs(ionex_path(ionexdir, product, day)):
+            stale.append((product, day))
+    return stale, journal
+
+
+def refresh(output, ionexdir=None, processes=1):
+    """Compute again the units of 'output' whose inputs changed and
+    rewrite it; returns those units. 'ionexdir' replaces the IONEX
+    directory of the run."""
+    stale, journal = stale_units(output, ionexdir)
+    if not stale:
+        return stale
+    settings = dict(journal.settings, ionexdir=os.path.abspath(ionexdir or journal.settings["ionexdir"]))
+    options = settings["options"]
+    # the units are computed again with the TEC cache of the run
+    if settings.get("teccache"):
+        ionexmaps.setTecCache(*settings["teccache"])
+    else:
+        ionexmaps.setTecCache(None)
+    jobs = read_manifest(settings["manifest"])
+    groups = group_by_day(jobs)
+    kept = {entry["unit"]: entry for entry in journal.entries if entry["unit"] not in stale}
+    if processes == 1:
+        results = run_jobs(jobs, settings["ionexdir"], kept, **options)
+    else:
+        from ionfr.scheduler import run_jobs_parallel
+
+        results = run_jobs_parallel(jobs, settings["ionexdir"], processes, kept, **options)
+
+    part = output + ".refresh"
+    new = Journal(journal_name(part), journal.run, settings=settings)
+    try:
+        with open(output, "rb") as old:
+            # whatever the output held before the run (--append)
+            with open(part, "wb") as f:
+                f.write(old.read(journal.entries[0]["start"] if journal.entries else journal.offset))
+            with RMWriter(
+                part, BATCH_DTYPE, format=guess_format(output), mode="a", precision=settings["precision"], header=True
+            ) as writer:
+                new.start(writer.flush())
+                for unit, segments in groups.items():
+                    if unit in kept:
+                        entry = kept[unit]
+                        old.seek(entry["start"])
+                        writer.write_raw(old.read(entry["offset"] - entry["start"]))
+                        new.record(unit, entry["jobs"], writer.flush())
+                        continue
+                    finished = []
+                    for _ in segments:
+                        job, times, rm = next(results)
+                        writer.write(result_rows(job, times, rm))
+                        if unit[1] == last_day(job):
+                            finished.append(job.id)
+                    new.record(unit, finished, writer.flush())
+    except BaseException:
+        new.close()
+        for name in (part, new.filename):
+            if os.path.exists(name):
+                os.remove(name)
+        raise
+    new.close()
+    os.replace(part, output)
+    os.replace(new.filename, journal.filename)
+    return stale
+
+
+def main(argv=None):
+    p = op.OptionParser(usage="%prog [options] OUTPUT [OUTPUT ...]")
+    p.add_option("--ionexdir", default=None, help="Directory of the IONEX files [that of the run]")
+    p.add_option(
+        "--processes", default=1, type="int", help="Worker processes, each one taking whole IONEX days [%default]"
+    )
+    p.add_option(
+        "--dry-run", action="store_true", default=False, help="Only list the IONEX days whose inputs changed"
+    )
+    ops, args = p.parse_args(argv)
+    if not args:
+        p.error("The output file(s) of manifest runs are needed.")
+    if ops.processes < 0:
+        p.error("The number of processes cannot be negative.")
+    failed = False
+    for output in args:
+        try:
+            if ops.dry_run:
+                units, journal = stale_units(output, ops.ionexdir)
+            else:
+                units = refresh(output, ops.ionexdir, ops.processes)
+        except (IOError, ValueError) as detail:
+            print("%s: %s" % (output, detail))
+            failed = True
+            continue
+        state = "to refresh" if ops.dry_run else "refreshed"
+        print("%s: %d IONEX days %s" % (output, len(units), state))
+        for product, day in units:
+            print("  %s %s" % (product, day))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
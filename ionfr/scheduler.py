@@ -0,0 +1,76 @@
+"""Batch processing on a pool of worker processes.
+
+The jobs of a manifest are partitioned by (product, day) as in
+ionfr.batch, and every partition is one task of a multiprocessing
+pool. Partitions are handed out in day order, so a worker moves on
+from one IONEX day to the next instead of switching back and forth,
+and each worker keeps the IONEX files it parsed last in its own cache.
+The results come back in the order of the partitions, whatever the
+number of processes, so the output is the same as that of a serial
+run (ionfr.batch.run_jobs).
+"""
+
+import multiprocessing
+
+from ionfr import profiling
+from ionfr.batch import compute_group, group_by_day
+from ionfr.ionex import ionexmaps
+from ionfr.ionexfiles import ionex_path
+
+# Parsed IONEX files kept by every worker
+WorkerCacheSize = 2
+
+
+def _initWorker(profile, tecCache):
+    ionexmaps.setDatasetCache(WorkerCacheSize)
+    # (a fresh TEC cache, whatever the worker inherited)
+    if tecCache is None:
+        ionexmaps.setTecCache(None)
+    else:
+        ionexmaps.setTecCache(*tecCache)
+    if profile:
+        # (a forked worker starts with the counters of its parent)
+        profiling.enable()
+        profiling.reset()
+
+
+def _work(task):
+    path, day, segments, options = task
+    results = compute_group(path, day, segments, options)
+    return results, profiling.take() if profiling.enabled() else None
+
+
+def make_tasks(jobs, ionexdir=".", done=(), **options):
+    """One (IONEX path, day, segments, options) task per (product, day),
+    but those in 'done'.
+
+    The paths are looked up here, so a missing file raises IOError
+    before any work is done.
+    """
+    return [
+        (ionex_path(ionexdir, product, day), day, segments, options)
+        for (product, day), segments in group_by_day(jobs).items()
+        if (product, day) not in done
+    ]
+
+
+def run_jobs_parallel(jobs, ionexdir=".", processes=None, done=(), **options):
+    """As ionfr.batch.run_jobs, on 'processes' worker processes (all
+    the cores by default); yields (job, times, rm) in the same order."""
+    tasks = make_tasks(jobs, ionexdir, done, **options)
+    if not tasks:
+        return
+    processes = min(processes or multiprocessing.cpu_count(), len(tasks))
+    pool = multiprocessing.Pool(processes, _initWorker, (profiling.enabled(), ionexmaps.tecCacheSettings()))
+    try:
+        for results, stats in pool.imap(_work, tasks):
+            if stats:
+                profiling.merge(stats)
+            for result in results:
+                yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -0,0 +1,408 @@
+"""A long-running RM service with warm caches (ionfr-serve).
+
+Starting python, importing the IGRF and parsing an IONEX file take far
+longer than the RM of a few epochs. The service does them once and
+answers JSON queries over HTTP, on localhost or on a Unix socket. A
+query is a JSON object
+
+    {"source": "08h37m05.6s+06d10m14.5s",     or "ra" and "dec" (degrees)
+     "station": "52d54m54.6sn 6d52m11.7se",   or "lat" and "lon" (degrees)
+     "times": ["2011-10-20T03:00:00", ...],   or "start", "stop", "cadence"
+     "ionex": "codg2930.11i",                 or "product": "codg"
+     "shells": 1, "profile": "chapman", "scale": 100000.0}
+
+(the last three are optional) POSTed to the service, or a list of
+them. IONEX files are looked for in the directory the service was
+started with; with "product" the file of every UT day of the epochs is
+used. The answer has, for every query, the lists time, hour, tecpath,
+bfield, rm and rmerr (null below the horizon), or an error message.
+
+The queries that arrive within a few milliseconds of each other are
+evaluated together, one compute_rm call per IONEX file and options.
+Parsed IONEX files and field grids are kept in bounded LRU caches.
+"""
+
+import http.client
+import json
+import optparse as op
+import os
+import queue
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy
+
+from ionfr.batch import parse_source, parse_station
+from ionfr.compute import RM_DTYPE, compute_rm, epoch_range, ionex_hours, load_ionex, to_datetime64
+from ionfr.igrf import fieldgrid as grids
+from ionfr.ionex import ionexmaps
+from ionfr.puncture import multishell
+from ionfr.ionexfiles import ionex_path
+
+DefaultPort = 8537
+
+# Seconds to wait for more queries before evaluating a batch, and the
+# most queries evaluated together
+BatchWindow = 0.005
+BatchSize = 256
+
+# Parsed IONEX files and field grids kept in memory
+DatasetCacheSize = 8
+GridCacheSize = 8
+
+
+class QueryError(ValueError):
+    """A query that cannot be answered."""
+
+
+def _value(query, name, parse=float):
+    if name not in query:
+        raise QueryError("Missing '%s'" % name)
+    try:
+        return parse(query[name])
+    except (TypeError, ValueError) as detail:
+        raise QueryError("Invalid '%s': %s" % (name, detail))
+
+
+def parse_query(query, ionexdir):
+    """(times, [(key, positions), ...], ra, dec, lat, lon) of a query.
+
+    key is (IONEX path, shells, profile, scale) and positions the
+    indices of the epochs computed with it.
+    """
+    if not isinstance(query, dict):
+        raise QueryError("A query is a JSON object")
+    if "source" in query:
+        ra, dec = _value(query, "source", parse_source)
+    else:
+        ra, dec = _value(query, "ra"), _value(query, "dec")
+    if "station" in query:
+        lat, lon = _value(query, "station", parse_station)
+    else:
+        lat, lon = _value(query, "lat"), _value(query, "lon")
+
+    if "times" in query:
+        times = _value(query, "times", to_datetime64)
+    else:
+        cadence = _value(query, "cadence")
+        if not cadence > 0:
+            raise QueryError("The cadence must be positive")
+        times = epoch_range(_value(query, "start", str), _value(query, "stop", str), cadence)
+
+    shells = _value(query, "shells", int) if "shells" in query else 1
+    profile = query.get("profile", "chapman")
+    scale = _value(query, "scale") if "scale" in query else multishell.ScaleHeight
+    if shells < 1:
+        raise QueryError("At least one shell is needed")
+    if profile not in multishell.Profiles:
+        raise QueryError("Unknown vertical profile '%s'" % profile)
+
+    if "ionex" in query:
+        path = os.path.realpath(os.path.join(ionexdir, str(query["ionex"])))
+        if os.path.dirname(path) != os.path.realpath(ionexdir) or not os.path.exists(path):
+            raise QueryError("IONEX file %s not found in %s" % (query["ionex"], ionexdir))
+        segments = [((path, shells, profile, scale), numpy.arange(len(times)))]
+    else:
+        product = _value(query, "product", str)
+        days = times.astype("datetime64[D]")
+        segments = []
+        for day in numpy.unique(days):
+            try:
+                path = ionex_path(ionexdir, product, day)
+            except IOError as detail:
+                raise QueryError(str(detail))
+            segments.append(((path, shells, profile, scale), numpy.flatnonzero(days == day)))
+    return times, segments, ra, dec, lat, lon
+
+
+class Batcher:
+    """Evaluates the queries submitted within 'window' seconds of each
+    other together, in a thread of its own (so the caches are only
+    ever used by that thread)."""
+
+    def __init__(self, fieldgrid=None, window=BatchWindow, maxsize=BatchSize):
+        self.fieldgrid = fieldgrid
+        self.window = window
+        self.maxsize = maxsize
+        self.queries = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        thread = threading.Thread(target=self._run, name="ionfr-batcher")
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, parsed):
+        """Queue a query parsed by parse_query; returns the item to
+        pass to result()."""
+        item = {"parsed": parsed, "done": threading.Event(), "error": None}
+        item["out"] = numpy.full(len(parsed[0]), numpy.nan, dtype=RM_DTYPE)
+        self._queue.put(item)
+        return item
+
+    @staticmethod
+    def result(item):
+        """RM_DTYPE array of a submitted query (blocks until its batch
+        has been evaluated)."""
+        item["done"].wait()
+        if item["error"] is not None:
+            raise item["error"]
+        return item["out"]
+
+    def evaluate(self, parsed):
+        """RM_DTYPE array for a query parsed by parse_query."""
+        return self.result(self.submit(parsed))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.window
+            while len(batch) < self.maxsize:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._evaluate(batch)
+            except BaseException as detail:
+                # (whatever went wrong, the thread goes on with the
+                # next batch)
+                for item in batch:
+                    if item["error"] is None:
+                        item["error"] = detail
+            finally:
+                self.queries += len(batch)
+                self.batches += 1
+                for item in batch:
+                    item["done"].set()
+
+    def _evaluate(self, batch):
+        # one compute_rm call per (IONEX file, options)
+        groups = {}
+        for item in batch:
+            for key, positions in item["parsed"][1]:
+                groups.setdefault(key, []).append((item, positions))
+        for (path, shells, profile, scale), members in groups.items():
+            # (a query with epochs outside the IONEX file fails alone)
+            try:
+                ionex = load_ionex(path)
+            except Exception as detail:
+                for item, _ in members:
+                    item["error"] = detail
+                continue
+            good = []
+            for item, positions in members:
+                try:
+                    ionex_hours(ionex, item["parsed"][0][positions])
+                except ValueError as detail:
+                    item["error"] = detail
+                else:
+                    good.append((item, positions))
+            members = good
+            if not members:
+                continue
+            sizes = [len(positions) for _, positions in members]
+            times = numpy.concatenate([item["parsed"][0][positions] for item, positions in members])
+            coords = [
+                numpy.repeat([item["parsed"][i] for item, _ in members], sizes) for i in (2, 3, 4, 5)
+            ]
+            try:
+                rm = compute_rm(
+                    coords[0],
+                    coords[1],
+                    coords[2],
+                    coords[3],
+                    times,
+                    ionex,
+                    shells=shells,
+                    profile=profile,
+                    scale=scale,
+                    fieldgrid=self.fieldgrid,
+                )
+            except Exception as detail:
+                for item, _ in members:
+                    item["error"] = detail
+                continue
+            start = 0
+            for (item, positions), size in zip(members, sizes):
+                item["out"][positions] = rm[start : start + size]
+                start += size
+
+
+def answers(queries, ionexdir, batcher):
+    """The JSON answers to a list of queries. They are all queued
+    before any answer is waited for, so they end up in the same
+    batch."""
+    pending = []
+    for query in queries:
+        try:
+            parsed = parse_query(query, ionexdir)
+            pending.append((parsed, batcher.submit(parsed)))
+        except Exception as detail:
+            pending.append((detail, None))
+    results = []
+    for parsed, item in pending:
+        try:
+            if item is None:
+                raise parsed
+            rm = batcher.result(item)
+        except Exception as detail:
+            results.append({"error": str(detail)})
+            continue
+        result = {"time": parsed[0].astype(str).tolist()}
+        for name in RM_DTYPE.names:
+            values = rm[name]
+            result[name] = numpy.where(numpy.isnan(values), None, values).tolist()
+        results.append(result)
+    return results
+
+
+def answer(query, ionexdir, batcher):
+    """The JSON answer to one query."""
+    return answers([query], ionexdir, batcher)[0]
+
+
+class Handler(BaseHTTPRequestHandler):
+    # self.server.ionexdir and self.server.batcher are set by serve()
+
+    def do_GET(self):
+        batcher = self.server.batcher
+        status = {
+            "queries": batcher.queries,
+            "batches": batcher.batches,
+            "ionex": len(ionexmaps._datasets),
+            "grids": len(grids._openGrids),
+        }
+        self._send(200, status)
+
+    def do_POST(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError as detail:
+            self._send(400, {"error": "Invalid JSON: %s" % detail})
+            return
+        if isinstance(body, list):
+            self._send(200, answers(body, self.server.ionexdir, self.server.batcher))
+        else:
+            result = answer(body, self.server.ionexdir, self.server.batcher)
+            self._send(400 if "error" in result else 200, result)
+
+    def _send(self, code, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def is_socket(path):
+    """Whether 'path' is a Unix socket (not a file, or nothing)."""
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # a socket left by an earlier service is replaced, anything
+        # else at the path is left alone
+        if is_socket(self.server_address):
+            os.unlink(self.server_address)
+        elif os.path.lexists(self.server_address):
+            raise IOError("%s exists and is not a socket" % self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_server(ionexdir=".", port=DefaultPort, socket_path=None, fieldgrid=None, verbose=False):
+    """The HTTP server of the service, on a Unix socket if 'socket_path'
+    is given and on localhost:port otherwise (see serve_forever())."""
+    ionexmaps.setDatasetCache(DatasetCacheSize)
+    grids.setGridCache(GridCacheSize)
+    if socket_path is not None:
+        server = UnixHTTPServer(socket_path, Handler)
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+    server.ionexdir = ionexdir
+    server.batcher = Batcher(fieldgrid)
+    server.verbose = verbose
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def query(queries, port=DefaultPort, socket_path=None, timeout=None):
+    """Send a query (or a list of them) to a running service and return
+    its answer."""
+    if socket_path is not None:
+        connection = _UnixHTTPConnection(socket_path, timeout)
+    else:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        connection.request("POST", "/", json.dumps(queries), {"Content-Type": "application/json"})
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    p = op.OptionParser(usage="%prog [options]")
+    p.add_option("--ionexdir", default=".", help="Directory of the IONEX files [%default]")
+    p.add_option("--port", default=DefaultPort, type="int", help="Port on localhost [%default]")
+    p.add_option("--socket", default=None, help="Listen on this Unix socket instead of a port")
+    p.add_option(
+        "--fieldgrid",
+        default=None,
+        help="Directory of daily geomagnetic field grids (see ionFRM.py --fieldgrid)",
+    )
+    p.add_option("--verbose", action="store_true", default=False, help="Log every request")
+    ops, args = p.parse_args(argv)
+    if args:
+        p.error("No arguments are expected.")
+    try:
+        server = make_server(ops.ionexdir, ops.port, ops.socket, ops.fieldgrid, ops.verbose)
+    except IOError as detail:
+        p.error(str(detail))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if ops.socket is not None and is_socket(ops.socket):
+            os.unlink(ops.socket)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3 @@
+"""Sidereal time and coordinate conversions (the SiderealPackage of
+ionFR): sidereal, its vectorised siderealarray, and the command line
+tools aard, rdalaz, jd and conjd (python -m ionfr.sidereal.jd ...)."""
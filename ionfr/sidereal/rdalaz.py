@@ -12,7 +12,7 @@
 from __future__ import print_function
 
 import sys, re
-import sidereal
+from ionfr.sidereal import sidereal
 from math import *
 #================================================================
 # Manifest consants
@@ -21,8 +21,10 @@ from math import *
 SIGN_PAT  =  re.compile ( r'[\-+]' )
 # - - - - -   m a i n
 
-def alaz(tim):
+def alaz(tim, argList=None):
     """Main program for rdaa.
+
+      argList defaults to the command line arguments (sys.argv[1:])
     """
 
     #-- 1 --
@@ -37,7 +39,7 @@ def alaz(tim):
     #   else ->
     #     sys.stderr  +:=  error message
     #     stop execution ]
-    raDec, latLon, dt  =  checkArgs(tim)
+    raDec, latLon, dt  =  checkArgs(tim, argList)
     #-- 2 --
     # [ if dt has no time zone information ->
     #     utc  :=  dt
@@ -101,10 +103,11 @@ def alaz(tim):
     return azradians, alradians, h, latradians, lonradians
 
 
-def checkArgs(ti):
+def checkArgs(ti, argList=None):
     """Process all command line arguments.
 
-      [ if sys.argv[1:] is a valid set of command line arguments ->
+      [ if argList (sys.argv[1:] if None) is a valid set of
+        command line arguments ->
           return (raDec, latLon, dt) where raDec is a set of
           celestial coordinates as a sidereal.RADec instance,
           latLon is position as a sidereal.LatLon instance, and
@@ -114,12 +117,13 @@ def checkArgs(ti):
           stop execution ]
     """
     #-- 1 --
-    # [ if sys.argv[1:] has exactly four elements ->
+    # [ if argList has exactly five elements ->
     #     rawRADec, rawLat, rawLon, rawDT  :=  those elements
     #   else ->
     #     sys.stderr  +:=  error message
     #     stop execution ]
-    argList  =  sys.argv[1:]
+    if  argList is None:
+        argList  =  sys.argv[1:]
     if  len(argList) != 5:
         usage ("Incorrect command line argument count." )
     else:
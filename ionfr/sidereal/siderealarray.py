@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#================================================================
+# siderealarray: sidereal time and horizon coordinates for arrays
+#   of epochs.
+#
+#   The same formulas as sidereal.SiderealTime.fromDatetime,
+#   sidereal.RADec.hourAngle and sidereal.coordRotate, written
+#   with numpy so that any number of epochs (as numpy.datetime64,
+#   UTC) is converted in one call.
+#----------------------------------------------------------------
+#================================================================
+# Imports
+#----------------------------------------------------------------
+
+import numpy
+from ionfr.sidereal import sidereal
+# - - -   g s t H o u r s
+
+def gstHours ( times ):
+    """Greenwich sidereal time of an array of UTC epochs.
+
+      [ times is an array of numpy.datetime64 ->
+          return the GST at every epoch, in hours, in [0,24) ]
+    """
+    #-- 1 --
+    # [ year  :=  year of every epoch
+    #   nDays  :=  day number of every epoch within its year
+    #   decUTC  :=  UTC of every epoch in decimal hours ]
+    times  =  numpy.asarray ( times, dtype="datetime64[us]" )
+    days  =  times.astype ( "datetime64[D]" )
+    years  =  days.astype ( "datetime64[Y]" )
+    year  =  years.astype ( int ) + 1970
+    nDays  =  ( days - years ).astype ( int ) + 1
+    decUTC  =  ( times - days ) / numpy.timedelta64 ( 3600, "s" )
+
+    #-- 2 --
+    # [ factorB  :=  sidereal factor B of the year of every epoch ]
+    uniq, inverse  =  numpy.unique ( year, return_inverse=True )
+    factorB  =  numpy.array ( [ sidereal.SiderealTime.factorB ( int(y) )
+                                for y in uniq ] )[inverse].reshape ( year.shape )
+
+    #-- 3 --
+    t0  =  nDays * sidereal.SIDEREAL_A - factorB
+    return  ( decUTC * sidereal.SiderealTime.SIDEREAL_C + t0 ) % 24.0
+# - - -   a l t A z
+
+def altAz ( ra, dec, lat, eLong, times ):
+    """Horizon coordinates of a source at an array of epochs.
+
+      [ (ra, dec are equatorial coordinates in radians) and
+        (lat, eLong are the observer's latitude and east longitude
+        in radians) and
+        (times is an array of numpy.datetime64, UTC) ->
+          return (az, alt, h), the azimuth in [0,2*pi), the
+          altitude and the hour angle of the source at every
+          epoch, in radians ]
+    """
+    #-- 1 --
+    # [ h  :=  hour angle at every epoch, in [0,2*pi) ]
+    lst  =  ( gstHours ( times ) + sidereal.radiansToHours ( eLong ) ) % 24.0
+    h  =  ( sidereal.hoursToRadians ( lst ) - ra % sidereal.TWO_PI ) % sidereal.TWO_PI
+
+    #-- 2 --
+    # [ alt, az  :=  sidereal.coordRotate ( dec, lat, h ) ]
+    alt  =  numpy.arcsin ( numpy.sin(dec) * numpy.sin(lat) +
+                           numpy.cos(dec) * numpy.cos(lat) * numpy.cos(h) )
+    cosAz  =  ( ( numpy.sin(dec) - numpy.sin(lat) * numpy.sin(alt) ) /
+                ( numpy.cos(lat) * numpy.cos(alt) ) )
+    az  =  numpy.arccos ( numpy.clip ( cosAz, -1.0, 1.0 ) )
+    az  =  numpy.where ( numpy.sin(h) > 0.0, sidereal.TWO_PI - az, az )
+
+    return  az, alt, h
@@ -0,0 +1,218 @@
+"""Ionospheric RM over the whole sky seen from a station (ionfr-sky).
+
+A sky map is a grid of 'resolution' degrees in horizon coordinates
+(frame "altaz": rows of altitude from min_alt to the zenith, columns
+of azimuth from 0, north, through east) or in equatorial coordinates
+(frame "radec": rows of declination from -90 to 90, columns of right
+ascension from 0), the values being those at the centres of the rows
+and at the columns (see sky_axes). Pixels below min_alt are NaN.
+
+The piercing point, TEC, field and RM of every pixel are computed in
+one array pass. In the altaz frame the piercing points and the field
+of the pixels are the same at every epoch, so for a series of epochs
+(a movie) they are computed once and only the TEC is interpolated
+for every frame, a chunk of frames at a time. write_sky() streams the
+frames of the RM into a .npy file of (epoch, row, column), in float64
+or float32.
+
+    ionfr-sky LAT LON DATETIME IONEX_file [--stop DATETIME --step SECONDS]
+        [--resolution DEG] [--frame altaz|radec] [--float32] [--output FILE]
+"""
+
+import optparse as op
+import sys
+from math import degrees
+
+import numpy
+import numpy.lib.format as npformat
+
+from ionfr.compute import decimal_year, ionex_hours, load_ionex, to_datetime64
+from ionfr.puncture import multishell
+from ionfr.sidereal import siderealarray
+
+FRAMES = ("altaz", "radec")
+
+# (epoch, pixel, shell) values evaluated at a time
+ChunkSize = 1 << 22
+
+# the fields of a sky map
+SKY_FIELDS = ("tecpath", "bfield", "rm", "rmerr")
+
+
+def sky_axes(resolution=1.0, frame="altaz", min_alt=0.0):
+    """(rows, columns) of a sky map, in degrees: altitudes and azimuths,
+    or declinations and right ascensions."""
+    if frame not in FRAMES:
+        raise ValueError("Unknown frame '%s' (use one of %s)" % (frame, ", ".join(FRAMES)))
+    if not 0 < resolution <= 90:
+        raise ValueError("The resolution must be more than 0 and at most 90 degrees")
+    if not 0 <= min_alt < 90:
+        raise ValueError("The minimum altitude must be from 0 to 90 degrees")
+    columns = numpy.arange(0.0, 360.0, resolution)
+    if frame == "altaz":
+        return numpy.arange(min_alt + 0.5 * resolution, 90.0, resolution), columns
+    return numpy.arange(-90.0 + 0.5 * resolution, 90.0, resolution), columns
+
+
+def sky_frames(
+    lat,
+    lon,
+    times,
+    ionex,
+    resolution=1.0,
+    frame="altaz",
+    min_alt=0.0,
+    dtype=numpy.float64,
+    shells=1,
+    profile="chapman",
+    scale=multishell.ScaleHeight,
+    fieldgrid=None,
+):
+    """The sky maps seen from (lat, lon) (degrees) at 'times' (within
+    the day of the IONEX file), in chunks: yields (first, maps), 'maps'
+    being a dict {field: array of (epoch, row, column)} of SKY_FIELDS
+    for the epochs from 'first' on."""
+    ionex = load_ionex(ionex)
+    times = to_datetime64(times)
+    hours = ionex_hours(ionex, times)
+    rows, columns = sky_axes(resolution, frame, min_alt)
+    shape = (len(rows), len(columns))
+    latRad = numpy.radians(lat)
+    lonRad = numpy.radians(lon)
+    year = decimal_year(*ionex.epoch)
+    if shells == 1:
+        bottom = top = ionex.height * 1000.0
+    else:
+        bottom, top = multishell.ShellBottom, multishell.ShellTop
+    heights = multishell.shellHeights(shells, bottom, top)
+    chunk = max(1, ChunkSize // (shape[0] * shape[1] * shells))
+
+    if frame == "altaz":
+        # the geometry and field of the pixels, once for all the epochs
+        Az = numpy.radians(numpy.broadcast_to(columns, shape)).ravel()[:, None]
+        Zen = numpy.radians(90.0 - numpy.broadcast_to(rows[:, None], shape)).ravel()[:, None]
+        ipp = multishell.shellGeometry(latRad, lonRad, Az, Zen, heights, year, fieldgrid)
+        w = multishell.shellWeights(heights, ionex.height * 1000.0, profile, scale)
+
+    for first in range(0, len(times), chunk):
+        stop = min(first + chunk, len(times))
+        if frame == "altaz":
+            ippLat, ippLon, slant, Bk = ipp
+            hour = hours[first:stop, None, None]
+            TEC, RMSTEC = ionex.tecRms(ippLat, ippLon, hour)
+            res = multishell.shellRM(TEC, RMSTEC, slant, Bk, w)
+            maps = {name: values.reshape((stop - first,) + shape) for name, values in zip(SKY_FIELDS, res)}
+        else:
+            # the horizon coordinates of the pixels at every epoch
+            ra = numpy.radians(numpy.broadcast_to(columns, shape)).ravel()[:, None]
+            dec = numpy.radians(numpy.broadcast_to(rows[:, None], shape)).ravel()[:, None]
+            Az, Alt, _ = siderealarray.altAz(ra, dec, latRad, lonRad, times[first:stop])
+            Az, Alt = Az.T, Alt.T
+            up = Alt > numpy.radians(min_alt)
+            maps = {name: numpy.full((stop - first,) + shape, numpy.nan) for name in SKY_FIELDS}
+            if up.any():
+                res = multishell.calcMultiShell(
+                    latRad,
+                    lonRad,
+                    Az[up],
+                    (numpy.pi / 2.0) - Alt[up],
+                    numpy.broadcast_to(hours[first:stop, None], up.shape)[up],
+                    year,
+                    ionex,
+                    nShells=shells,
+                    profile=profile,
+                    scale=scale,
+                    bottom=bottom,
+                    top=top,
+                    gridDir=fieldgrid,
+                )
+                for name, values in zip(SKY_FIELDS, res):
+                    maps[name].reshape(stop - first, -1)[up] = values
+        yield first, {name: values.astype(dtype, copy=False) for name, values in maps.items()}
+
+
+def compute_rm_sky(lat, lon, times, ionex, **options):
+    """The sky maps of sky_frames() for all the epochs at once: a dict
+    {field: array of (epoch, row, column)}."""
+    frames = list(sky_frames(lat, lon, times, ionex, **options))
+    return {name: numpy.concatenate([maps[name] for _, maps in frames]) for name in SKY_FIELDS}
+
+
+def write_sky(filename, lat, lon, times, ionex, field="rm", **options):
+    """Write the 'field' (rm by default) of the sky maps of sky_frames()
+    to the .npy file 'filename', frame by frame."""
+    if field not in SKY_FIELDS:
+        raise ValueError("Unknown field '%s' (use one of %s)" % (field, ", ".join(SKY_FIELDS)))
+    times = to_datetime64(times)
+    rows, columns = sky_axes(
+        options.get("resolution", 1.0), options.get("frame", "altaz"), options.get("min_alt", 0.0)
+    )
+    out = npformat.open_memmap(
+        filename, mode="w+", dtype=options.get("dtype", numpy.float64), shape=(len(times), len(rows), len(columns))
+    )
+    for first, maps in sky_frames(lat, lon, times, ionex, **options):
+        out[first : first + len(maps[field])] = maps[field]
+    out.flush()
+    del out
+
+
+def main(argv=None):
+    from ionfr.sidereal import sidereal
+
+    p = op.OptionParser(usage="%prog [options] LAT LON DATETIME IONEX_file")
+    p.add_option("--stop", default=None, help="With --step, a map every STEP seconds from DATETIME to this epoch")
+    p.add_option("--step", default=60.0, type="float", help="Seconds between the maps [%default]")
+    p.add_option("--resolution", default=1.0, type="float", help="Pixel size in degrees [%default]")
+    p.add_option("--frame", default="altaz", type="choice", choices=FRAMES, help="altaz or radec [%default]")
+    p.add_option("--minalt", default=0.0, type="float", help="Lowest altitude mapped, in degrees [%default]")
+    p.add_option(
+        "--field", default="rm", type="choice", choices=SKY_FIELDS, help="%s [%%default]" % ", ".join(SKY_FIELDS)
+    )
+    p.add_option("--float32", action="store_true", default=False, help="Write float32 maps instead of float64")
+    p.add_option("--shells", default=1, type="int", help="Number of ionospheric shells (see ionFRM.py) [%default]")
+    p.add_option("--fieldgrid", default=None, help="Directory of daily geomagnetic field grids (see ionFRM.py)")
+    p.add_option("--output", default="IonRMsky.npy", help="Output .npy file, of (epoch, row, column) [%default]")
+    ops, args = p.parse_args(argv)
+    if len(args) != 4:
+        p.error("The latitude, longitude, epoch and IONEX file are needed.")
+    if not ops.step > 0 or ops.shells < 1:
+        p.error("The step and the number of shells must be positive.")
+    rawLat, rawLon, rawTime, nameIONEX = args
+    try:
+        lat = degrees(sidereal.parseLat(rawLat))
+        lon = degrees(sidereal.parseLon(rawLon))
+    except SyntaxError as detail:
+        p.error("Invalid location: %s" % detail)
+    if lon > 180.0:
+        lon -= 360.0
+    try:
+        start = numpy.datetime64(sidereal.parseDatetime(rawTime).replace(tzinfo=None), "us")
+        if ops.stop is None:
+            times = [start]
+        else:
+            stop = numpy.datetime64(sidereal.parseDatetime(ops.stop).replace(tzinfo=None), "us")
+            times = numpy.arange(start, stop, numpy.timedelta64(int(round(ops.step * 1e6)), "us"))
+    except SyntaxError as detail:
+        p.error("Invalid timestamp: %s" % detail)
+    try:
+        write_sky(
+            ops.output,
+            lat,
+            lon,
+            times,
+            nameIONEX,
+            field=ops.field,
+            resolution=ops.resolution,
+            frame=ops.frame,
+            min_alt=ops.minalt,
+            dtype=numpy.float32 if ops.float32 else numpy.float64,
+            shells=ops.shells,
+            fieldgrid=ops.fieldgrid,
+        )
+    except (IOError, ValueError) as detail:
+        p.error(str(detail))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
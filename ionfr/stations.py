@@ -0,0 +1,33 @@
+"""Station tables for the multi-station (interferometer) mode.
+
+A station table is a text file with one station per line,
+
+    name  latitude  longitude
+
+with the coordinates as on the ionFRM.py command line (52d54m54.6sn
+6d52m11.7se) or in degrees (52.915 6.870, north and east positive).
+Blank lines and lines starting with '#' are skipped.
+"""
+
+from ionfr.batch import parse_station
+
+
+def read_stations(filename):
+    """[(name, lat, lon), ...] of a station table (degrees)."""
+    stations = []
+    with open(filename) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            if len(parts) != 3:
+                raise ValueError("%s, line %d: expected 'name latitude longitude'" % (filename, number))
+            lat, lon = parse_station(" ".join(parts[1:]))
+            stations.append((parts[0], lat, lon))
+    if not stations:
+        raise ValueError("No stations in %s" % filename)
+    names = [name for name, _, _ in stations]
+    if len(set(names)) != len(names):
+        raise ValueError("Station names in %s are not unique" % filename)
+    return stations
@@ -0,0 +1,201 @@
+"""Output files for RM results.
+
+An RMWriter is opened once, takes blocks of rows (numpy structured
+arrays) and writes them through a large buffer. The format follows
+the extension of the file name:
+
+    .txt     space separated columns, as IonRM.txt
+    .csv     comma separated columns with a header line
+    .jsonl   one JSON object per row (NaN as null)
+    .npy     one structured array, streamed to disk as rows come
+    .npz     one array per column, written when the writer is closed
+
+With mode "w" an existing file is overwritten and with mode "a" the
+rows are added to it (not for .npz). Floats are written with
+'precision' significant digits, or, by default, with as many as needed
+to read back the same values.
+"""
+
+import json
+import os
+import struct
+
+import numpy
+import numpy.lib.format as npformat
+
+FORMATS = {
+    ".txt": "txt",
+    ".dat": "txt",
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".json": "jsonl",
+    ".npy": "npy",
+    ".npz": "npz",
+}
+
+# Bytes buffered by the text writers before they go to disk
+BufferSize = 1 << 20
+
+_NPY_MAGIC = npformat.magic(1, 0)
+
+
+def guess_format(filename):
+    """Output format (txt, csv, jsonl, npy, npz) of a file name."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError("Unknown output format '%s' (use one of %s)" % (ext, ", ".join(sorted(FORMATS))))
+    return FORMATS[ext]
+
+
+def _npy_dict(dtype, rows):
+    return "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (npformat.dtype_to_descr(dtype), rows)
+
+
+def _npy_header(dtype, rows):
+    # .npy (version 1.0) header long enough for any row count, so that
+    # it can be rewritten in place with the final count
+    size = len(_NPY_MAGIC) + 2 + len(_npy_dict(dtype, 2**63 - 1)) + 1
+    size = -(-size // 64) * 64 - len(_NPY_MAGIC) - 2
+    return _NPY_MAGIC + struct.pack("<H", size) + (_npy_dict(dtype, rows).ljust(size - 1) + "\n").encode("latin1")
+
+
+class RMWriter:
+    """Buffered writer of the rows of structured arrays of 'dtype'.
+
+    Use as a context manager, or call close() when done. 'header'
+    adds a '# column names' line at the top of new .txt files.
+    """
+
+    def __init__(self, filename, dtype, format=None, mode="w", precision=None, header=False):
+        if mode not in ("w", "a"):
+            raise ValueError("The output mode is 'w' (overwrite) or 'a' (append), not '%s'" % mode)
+        self.filename = filename
+        self.dtype = numpy.dtype(dtype)
+        self.format = format or guess_format(filename)
+        self.precision = precision
+        self.rows = 0
+        self._blocks = []
+        appending = mode == "a" and os.path.exists(filename) and os.path.getsize(filename) > 0
+
+        if self.format == "npz":
+            if mode == "a":
+                raise ValueError(".npz files cannot be appended to")
+            self._file = None
+        elif self.format == "npy":
+            self._file = open(filename, "r+b" if appending else "wb")
+            if appending:
+                self._file.seek(0)
+                npformat.read_magic(self._file)
+                shape, _, dtype = npformat.read_array_header_1_0(self._file)
+                start = self._file.tell()
+                if dtype != self.dtype or start != len(_npy_header(self.dtype, 0)):
+                    raise ValueError("%s was not written by this writer with these columns" % filename)
+                # counted from the size: the header of a file whose
+                # writer was not closed still says 0 rows
+                self.rows = (self._file.seek(0, os.SEEK_END) - start) // self.dtype.itemsize
+            else:
+                self._file.write(_npy_header(self.dtype, 0))
+        else:
+            self._file = open(filename, mode, buffering=BufferSize)
+            if not appending:
+                if self.format == "csv":
+                    self._file.write(",".join(self.dtype.names) + "\n")
+                elif self.format == "txt" and header:
+                    self._file.write("# " + " ".join(self.dtype.names) + "\n")
+        self._template = self._makeTemplate()
+
+    def _makeTemplate(self):
+        # %-format of a text row
+        fields = []
+        for name in self.dtype.names:
+            kind = self.dtype[name].kind
+            if kind == "f":
+                fields.append("%r" if self.precision is None else "%%.%dg" % self.precision)
+            elif kind in "iub":
+                fields.append("%d")
+            else:
+                fields.append("%s")
+        sep = "," if self.format == "csv" else " "
+        return sep.join(fields)
+
+    def _columns(self, rows):
+        # the columns of 'rows' as lists of python values
+        columns = []
+        for name in self.dtype.names:
+            column = rows[name]
+            if column.dtype.kind == "M":
+                column = column.astype(str)
+            columns.append(column.tolist())
+        return columns
+
+    def write(self, rows):
+        """Write a block of rows (a structured array or sequence of
+        tuples of the writer's dtype)."""
+        rows = numpy.asarray(rows, dtype=self.dtype).ravel()
+        if len(rows) == 0:
+            return
+        self.rows += len(rows)
+        if self.format == "npz":
+            self._blocks.append(rows.copy())
+        elif self.format == "npy":
+            rows.tofile(self._file)
+        elif self.format == "jsonl":
+            self._file.write("".join(self._jsonRow(values) for values in zip(*self._columns(rows))))
+        else:
+            template = self._template
+            self._file.write("\n".join(template % values for values in zip(*self._columns(rows))) + "\n")
+
+    def write_raw(self, data):
+        """Write bytes holding whole rows as this writer formats them
+        (e.g. a piece of a file written with the same dtype, format
+        and precision)."""
+        if self.format == "npz":
+            raise ValueError(".npz files only take rows")
+        if self.format == "npy":
+            self._file.write(data)
+            self.rows += len(data) // self.dtype.itemsize
+        else:
+            self._file.flush()
+            self._file.buffer.write(data)
+            self.rows += data.count(b"\n")
+
+    def flush(self):
+        """Put the rows written so far on disk; returns the size of the
+        file (not for .npz, written when closed)."""
+        if self._file is None:
+            raise ValueError("%s is only written when closed" % self.filename)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return os.fstat(self._file.fileno()).st_size
+
+    def _jsonRow(self, values):
+        row = {}
+        for name, value in zip(self.dtype.names, values):
+            if isinstance(value, float):
+                if value != value:
+                    value = None
+                elif self.precision is not None:
+                    value = float("%.*g" % (self.precision, value))
+            row[name] = value
+        return json.dumps(row) + "\n"
+
+    def close(self):
+        if self._blocks is None:
+            return
+        if self.format == "npz":
+            rows = numpy.concatenate(self._blocks) if self._blocks else numpy.empty(0, self.dtype)
+            numpy.savez(self.filename, **{name: rows[name] for name in self.dtype.names})
+        self._blocks = None
+        if self._file is None:
+            return
+        if self.format == "npy":
+            self._file.seek(0)
+            self._file.write(_npy_header(self.dtype, self.rows))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,239 @@
+"""compute_rm and friends against the reference output of ionFRM.py."""
+
+import os
+
+import numpy
+import pytest
+
+import ionfr
+from ionfr.ionex import ionexmaps
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IONEX = os.path.join(HERE, "codg2930.11i")
+
+# the example of README.md, whose output is test/IonRM.txt
+RA = (8 + 37 / 60.0 + 5.6 / 3600.0) * 15.0
+DEC = 6 + 10 / 60.0 + 14.5 / 3600.0
+LAT = 52 + 54 / 60.0 + 54.6 / 3600.0
+LON = 6 + 52 / 60.0 + 11.7 / 3600.0
+
+
+def hours():
+    return ionfr.epoch_range("2011-10-20T00:00:00", "2011-10-21T00:00:00", 3600)
+
+
+def test_compute_rm_matches_reference():
+    # IonRM.txt was written with an earlier IGRF generation, so the
+    # field (and the RM) differ from it; the TEC, the hours up and the
+    # ratios that do not depend on the field must not (the field
+    # itself is checked against pyIGRF in test_igrf.py)
+    hour, tecpath, bfield, rm, rmerr = numpy.loadtxt(os.path.join(HERE, "IonRM.txt"), unpack=True)
+    out = ionfr.compute_rm(RA, DEC, LAT, LON, hours(), IONEX)
+    up = ~numpy.isnan(out["rm"])
+    assert numpy.array_equal(out["hour"][up], hour)
+    assert numpy.allclose(out["tecpath"][up], tecpath, rtol=1e-6, atol=0)
+    assert numpy.allclose(out["rmerr"][up] / out["rm"][up], rmerr / rm, rtol=1e-6, atol=0)
+    assert numpy.allclose(out["rm"][up] / (out["bfield"][up] * out["tecpath"][up]), 2.6e-17, rtol=1e-9, atol=0)
+
+
+def test_compute_rm_altaz_of_the_same_line_of_sight():
+    from ionfr.sidereal import siderealarray
+
+    times = hours()[:4]
+    az, alt, _ = siderealarray.altAz(
+        numpy.radians(RA), numpy.radians(DEC), numpy.radians(LAT), numpy.radians(LON), times
+    )
+    rm = ionfr.compute_rm(RA, DEC, LAT, LON, times, IONEX)
+    for k in range(len(times)):
+        fixed = ionfr.compute_rm_altaz(numpy.degrees(az[k]), numpy.degrees(alt[k]), LAT, LON, times[k], IONEX)
+        assert numpy.allclose(fixed["rm"], rm["rm"][k], rtol=1e-12)
+
+
+def test_epochs_outside_the_ionex_day_are_refused():
+    with pytest.raises(ValueError):
+        ionfr.compute_rm(RA, DEC, LAT, LON, ["2011-10-21T03:00:00"], IONEX)
+    with pytest.raises(ValueError):
+        ionfr.compute_rm_altaz(0.0, 45.0, LAT, LON, ["2011-10-19T23:00:00"], IONEX)
+    # the last map, 24:00, is still within the file
+    assert ionfr.compute_rm(RA, DEC, LAT, LON, ["2011-10-21T00:00:00"], IONEX)["hour"] == 24.0
+
+
+def test_tec_wraps_around_the_dateline_and_stops_at_the_poles():
+    ionex = ionexmaps.readIONEX(IONEX)
+    assert ionex.tec(-40.0, 185.0, 3.5) == ionex.tec(-40.0, -175.0, 3.5)
+    assert ionex.tec(-40.0, -190.0, 3.5) == ionex.tec(-40.0, 170.0, 3.5)
+    assert ionex.tec(89.9, 10.0, 3.5) == ionex.tec(87.5, 10.0, 3.5)
+
+
+def test_sub_hourly_tec_is_continuous_across_the_dateline():
+    # the odd hourly maps are completed across the dateline, so the
+    # TEC between the maps neither drops to zero nor jumps there
+    ionex = ionexmaps.readIONEX(IONEX)
+    hour = numpy.linspace(0.0, 24.0, 97)
+    west, east = ionex.tec(50.0, 179.9, hour), ionex.tec(50.0, -179.9, hour)
+    assert (west > 0).all() and (east > 0).all()
+    assert numpy.allclose(west, east, rtol=0.01, atol=0)
+    for lon in (-177.0, 177.0):
+        tec = ionex.tec(50.0, lon, hour)
+        assert numpy.allclose(tec[2::4], 0.5 * (tec[0:-4:4] + tec[4::4]), rtol=0.1, atol=0)
+
+
+def test_field_without_tec_on_the_line_of_sight():
+    # no TEC: the field is still that along the line of sight, the
+    # mean of the shells weighted by the profile
+    import warnings
+
+    from ionfr.puncture import multishell
+
+    ionex = ionexmaps.readIONEX(IONEX)
+    empty = ionexmaps.IonexData(
+        numpy.zeros_like(ionex.tecMaps),
+        numpy.zeros_like(ionex.rmsMaps),
+        ionex.height,
+        ionex.lat1,
+        ionex.dlat,
+        ionex.lon1,
+        ionex.dlon,
+        ionex.epoch,
+    )
+    args = (numpy.radians(LAT), numpy.radians(LON), [0.5, 2.0], [0.3, 1.0], [1.0, 13.5], 2011.8)
+    for shells in (1, 5):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            tecpath, bfield, rm, rmerr = multishell.calcMultiShell(*args, empty, nShells=shells)
+        assert (tecpath == 0).all() and (rm == 0).all()
+        assert numpy.isfinite(bfield).all()
+    # a single shell: the same field as with the real maps
+    _, bfield, _, _ = multishell.calcMultiShell(*args, empty, nShells=1)
+    _, expected, _, _ = multishell.calcMultiShell(*args, ionex, nShells=1)
+    assert numpy.allclose(bfield, expected, rtol=1e-12, atol=0)
+
+
+def products():
+    # three products of the day: the file, one with other maps on the
+    # same grid and one on a coarser grid
+    ionex = ionexmaps.readIONEX(IONEX)
+    scaled = ionexmaps.IonexData(
+        1.1 * ionex.tecMaps,
+        0.9 * ionex.rmsMaps,
+        ionex.height,
+        ionex.lat1,
+        ionex.dlat,
+        ionex.lon1,
+        ionex.dlon,
+        ionex.epoch,
+    )
+    coarse = ionexmaps.IonexData(
+        ionex.tecMaps[:, ::2, ::2],
+        ionex.rmsMaps[:, ::2, ::2],
+        ionex.height,
+        ionex.lat1,
+        2 * ionex.dlat,
+        ionex.lon1,
+        2 * ionex.dlon,
+        ionex.epoch,
+    )
+    return {"codg": ionex, "scaled": scaled, "coarse": coarse}
+
+
+@pytest.mark.parametrize("shells", [1, 4])
+@pytest.mark.parametrize("names", [("codg", "scaled"), ("codg", "scaled", "coarse")])
+def test_ensemble_members_are_those_of_compute_rm(shells, names):
+    # (products on one grid are interpolated together, see tecStack)
+    times = ionfr.epoch_range("2011-10-20T00:00:00", "2011-10-21T00:00:00", 1200)
+    ionexes = {name: ionex for name, ionex in products().items() if name in names}
+    members, ensemble = ionfr.compute_rm_ensemble(RA, DEC, LAT, LON, times, ionexes, shells=shells)
+    assert list(members) == list(names)
+    for name, ionex in ionexes.items():
+        alone = ionfr.compute_rm(RA, DEC, LAT, LON, times, ionex, shells=shells)
+        for field in alone.dtype.names:
+            assert numpy.array_equal(members[name][field], alone[field], equal_nan=True)
+    rm = numpy.array([members[name]["rm"] for name in names])
+    up = ~numpy.isnan(rm[0])
+    assert up.any() and not up.all()
+    assert numpy.allclose(ensemble["rm"][up], rm[:, up].mean(axis=0), rtol=1e-12, atol=0)
+    assert numpy.allclose(ensemble["rmspread"][up], rm[:, up].std(axis=0, ddof=1), rtol=1e-12, atol=0)
+    assert (ensemble["rmspread"][up] > 0).all()
+    assert numpy.isnan(ensemble["rmspread"][~up]).all()
+    if len(names) == 2:
+        spread = numpy.abs(rm[0, up] - rm[1, up]) / numpy.sqrt(2.0)
+        assert numpy.allclose(ensemble["rmspread"][up], spread, rtol=1e-9, atol=0)
+
+
+def dense(start, stop):
+    # brute force: the RM every second of the scan
+    rm = ionfr.compute_rm(RA, DEC, LAT, LON, ionfr.epoch_range(start, stop, 1), IONEX)
+    up = ~numpy.isnan(rm["rm"])
+    return {name: numpy.nanmean(rm[name]) for name in ("tecpath", "rm", "rmerr")}, up.mean()
+
+
+@pytest.mark.parametrize(
+    "start, stop, up",
+    [
+        # the source is up all through the scan, and sets during it
+        ("2011-10-20T02:00:00", "2011-10-20T05:00:00", 1.0),
+        ("2011-10-20T11:00:00", "2011-10-20T13:30:00", 0.72),
+    ],
+)
+def test_scan_means_match_dense_sampling(start, stop, up):
+    (scan,) = ionfr.compute_rm_scans(RA, DEC, LAT, LON, [start], [stop], IONEX)
+    means, fraction = dense(start, stop)
+    for name, value in means.items():
+        assert numpy.isclose(scan[name], value, rtol=1e-3, atol=0)
+    assert numpy.isclose(scan["up"], fraction, rtol=0, atol=1e-3)
+    assert numpy.isclose(scan["up"], up, rtol=0, atol=0.01)
+    assert 0 < scan["error"] < 1e-2
+
+
+def test_scan_of_no_length_is_a_single_epoch():
+    epoch = "2011-10-20T03:00:00"
+    (scan,) = ionfr.compute_rm_scans(RA, DEC, LAT, LON, [epoch], [epoch], IONEX)
+    (rm,) = ionfr.compute_rm(RA, DEC, LAT, LON, [epoch], IONEX)
+    assert scan["start"] == scan["stop"] == 3.0
+    for name in ("tecpath", "rm", "rmerr"):
+        assert scan[name] == rm[name]
+    assert (scan["up"], scan["error"]) == (1.0, 0.0)
+
+
+def test_scan_rounds():
+    from ionfr.compute import KRONROD_NODES, KRONROD_WEIGHTS
+
+    start, stop = "2011-10-20T11:00:00", "2011-10-20T13:30:00"
+    # one round: the 15-point rule over the whole scan, whatever its error
+    (scan,) = ionfr.compute_rm_scans(RA, DEC, LAT, LON, [start], [stop], IONEX, rounds=1)
+    nodes = 12.25 + 1.25 * KRONROD_NODES
+    times = numpy.datetime64("2011-10-20", "us") + numpy.round(nodes * 3.6e9).astype("timedelta64[us]")
+    rm = ionfr.compute_rm(RA, DEC, LAT, LON, times, IONEX)["rm"]
+    seen = ~numpy.isnan(rm)
+    mean = (KRONROD_WEIGHTS * numpy.where(seen, rm, 0.0)).sum() / (KRONROD_WEIGHTS * seen).sum()
+    assert numpy.isclose(scan["rm"], mean)
+    assert numpy.isclose(scan["up"], 0.5 * (KRONROD_WEIGHTS * seen).sum())
+    # more rounds bring the time up closer to the dense sampling
+    fraction = dense(start, stop)[1]
+    errors = [
+        abs(ionfr.compute_rm_scans(RA, DEC, LAT, LON, [start], [stop], IONEX, rounds=rounds)["up"][0] - fraction)
+        for rounds in (1, 4, 8)
+    ]
+    assert errors[0] > errors[1] > errors[2]
+
+
+def test_monte_carlo_shares_the_alt_az_with_the_nominal_rm(monkeypatch):
+    from ionfr.sidereal import siderealarray
+
+    times = hours()
+    calls = []
+    altAz = siderealarray.altAz
+
+    def counted(*args, **kwargs):
+        calls.append(len(args[-1]))
+        return altAz(*args, **kwargs)
+
+    monkeypatch.setattr(siderealarray, "altAz", counted)
+    out = ionfr.compute_rm_mc(RA, DEC, LAT, LON, times, IONEX, samples=200, seed=1)
+    assert calls == [len(times)]
+    nominal = ionfr.compute_rm(RA, DEC, LAT, LON, times, IONEX)
+    for name in nominal.dtype.names:
+        assert numpy.array_equal(out[name], nominal[name], equal_nan=True)
+    up = ~numpy.isnan(out["rm"])
+    assert numpy.isnan(out["rmpct"][~up]).all()
+    assert (numpy.diff(out["rmpct"][up], axis=-1) >= 0).all()
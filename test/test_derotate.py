@@ -0,0 +1,67 @@
+"""Faraday derotation of Q/U cubes (ionfr-derotate)."""
+
+import numpy
+import pytest
+
+from ionfr import derotate
+
+FREQS = numpy.array([120e6, 150e6, 180e6])
+RM = "00 1e17 0.1 0.5 0.05\n01 1e17 0.1 1.0 0.05\n02 1e17 0.1 1.5 0.05\n"
+
+
+def rotated(rm, freqs, times):
+    # Q + iU of unit polarisation at angle 0, turned by rm lambda^2
+    angle = 2.0 * rm[:, None] * (derotate.SpeedOfLight / freqs) ** 2
+    return numpy.cos(angle)[..., None] * numpy.ones(4), numpy.sin(angle)[..., None] * numpy.ones(4)
+
+
+@pytest.mark.parametrize("sign", [1, -1])
+def test_derotate_files(tmp_path, sign):
+    rmfile = tmp_path / "IonRM.txt"
+    rmfile.write_text(RM)
+    times = numpy.array([0.0, 0.5, 1.0, 2.0])
+    q, u = rotated(sign * numpy.interp(times, [0.0, 1.0, 2.0], [0.5, 1.0, 1.5]), FREQS, times)
+    numpy.save(str(tmp_path / "Q.npy"), q)
+    numpy.save(str(tmp_path / "U.npy"), u)
+    derotate.derotate_files(
+        str(rmfile), str(tmp_path / "Q.npy"), str(tmp_path / "U.npy"), times, FREQS, chunk=100, threads=2, sign=sign
+    )
+    assert numpy.allclose(numpy.load(str(tmp_path / "Q.npy")), 1.0)
+    assert numpy.allclose(numpy.load(str(tmp_path / "U.npy")), 0.0, atol=1e-12)
+
+
+def test_read_rm_of_the_output_layouts(tmp_path):
+    stations = tmp_path / "all.txt"
+    stations.write_text(
+        "# station hour tecpath bfield rm rmerr\n"
+        + "".join("%s %s\n" % (name, line) for name in ("wsrt", "lofar") for line in RM.splitlines())
+    )
+    with pytest.raises(ValueError):
+        derotate.read_rm(str(stations))
+    hours, rm = derotate.read_rm(str(stations), station="lofar")
+    assert list(hours) == [0.0, 1.0, 2.0] and list(rm) == [0.5, 1.0, 1.5]
+
+    products = tmp_path / "products.txt"
+    products.write_text(
+        "# hour tecpath rm rmerr rmspread rm_codg rm_igsg\n"
+        + "".join("%02d 1e17 %g 0.05 0.1 %g %g\n" % (h, r, r - 0.1, r + 0.1) for h, r in enumerate((0.5, 1.0)))
+    )
+    assert list(derotate.read_rm(str(products))[1]) == [0.5, 1.0]
+
+
+def test_rm_at_refuses_the_gaps_of_the_rm():
+    # a source up until 12 h and again from 20 h (rows dropped) ...
+    hours = numpy.array([10.0, 11.0, 12.0, 20.0, 21.0])
+    rm = numpy.array([1.0, 2.0, 3.0, 2.0, 1.0])
+    assert numpy.allclose(derotate.rm_at(hours, rm, [10.5, 12.0, 20.0, 20.25]), [1.5, 3.0, 2.0, 1.75])
+    with pytest.raises(ValueError):
+        derotate.rm_at(hours, rm, [11.0, 15.0])
+    # ... or with NaN rows while it was down
+    hours = numpy.arange(10.0, 16.0)
+    rm = numpy.array([1.0, 2.0, numpy.nan, numpy.nan, 2.0, 1.0])
+    assert numpy.allclose(derotate.rm_at(hours, rm, [11.0, 14.5]), [2.0, 1.5])
+    for time in (11.5, 12.0, 13.5):
+        with pytest.raises(ValueError):
+            derotate.rm_at(hours, rm, [time])
+    with pytest.raises(ValueError):
+        derotate.rm_at(hours, rm, [9.5])
@@ -0,0 +1,280 @@
+"""ionfr.fetch against local stand-ins of the archive (HTTP and FTP)."""
+
+import asyncio
+import hashlib
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ionfr import fetch
+
+DAY = "2011-10-20"
+PATH = fetch.archive_path("codg", DAY)
+DIRECTORY = PATH.rsplit("/", 1)[0]
+DATA = bytes(range(256)) * 400
+
+
+def sums(data=DATA):
+    return ("%s  %s\n" % (hashlib.sha512(data).hexdigest(), os.path.basename(PATH))).encode()
+
+
+class Archive(BaseHTTPRequestHandler):
+    # files: {path: bytes}; drops: {path: bytes sent before the
+    # connection is dropped, once}; log: (path, Range, Cookie)
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = self.path.lstrip("/")
+        self.server.log.append((path, self.headers.get("Range"), self.headers.get("Cookie")))
+        if path == "login":
+            self.send_response(200)
+            for cookie in self.server.cookies:
+                self.send_header("Set-Cookie", cookie)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = self.server.files.get(path)
+        if data is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        drop = self.server.drops.pop(path, None)
+        if drop is not None:
+            self.wfile.write(data[start : start + drop])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_archive():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Archive)
+    server.daemon_threads = True
+    server.files, server.drops, server.log, server.cookies = {}, {}, [], []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:%d" % server.server_port
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_http_download_verified(http_archive, tmp_path):
+    http_archive.files[PATH] = DATA
+    http_archive.files[DIRECTORY + "/SHA512SUMS"] = sums()
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), http_archive.url)
+    assert result.status == "downloaded"
+    with open(result.path, "rb") as f:
+        assert f.read() == DATA
+    assert result.path == str(tmp_path / PATH)
+
+
+def test_http_checksum_mismatch(http_archive, tmp_path):
+    http_archive.files[PATH] = DATA
+    http_archive.files[DIRECTORY + "/SHA512SUMS"] = sums(b"something else")
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), http_archive.url)
+    assert result.status == "failed"
+    assert "Checksum mismatch" in result.error
+    assert not os.path.exists(tmp_path / PATH)
+
+
+def test_http_resume_after_dropped_connection(http_archive, tmp_path):
+    http_archive.files[PATH] = DATA
+    http_archive.files[DIRECTORY + "/SHA512SUMS"] = sums()
+    http_archive.drops[PATH] = 10000
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), http_archive.url)
+    assert result.status == "downloaded"
+    with open(result.path, "rb") as f:
+        assert f.read() == DATA
+    ranges = [r for path, r, _ in http_archive.log if path == PATH]
+    assert ranges == [None, "bytes=10000-"]
+
+
+def test_http_missing_then_present(http_archive, tmp_path):
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), http_archive.url)
+    assert result.status == "missing"
+    # both compressed forms were tried
+    assert {path for path, _, _ in http_archive.log} >= {PATH, PATH[:-2] + ".gz"}
+
+    http_archive.files[PATH] = DATA
+    fetch.fetch([("codg", DAY)], str(tmp_path), http_archive.url)
+    del http_archive.log[:]
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), http_archive.url, verify=False)
+    assert result.status == "present"
+    assert not http_archive.log
+
+
+def test_http_cookie_attributes(http_archive):
+    http_archive.cookies = [
+        "session=1; Path=/",
+        "secret=2; Path=/; Secure",
+        "elsewhere=3; Path=/other",
+        "stale=4; Path=/; Expires=Thu, 01 Jan 1970 00:00:00 GMT",
+    ]
+    http_archive.files[PATH] = DATA
+    client = fetch.HTTPClient()
+
+    async def run():
+        await client.get(http_archive.url + "/login")
+        await client.get(http_archive.url + "/" + PATH)
+        client.close()
+
+    asyncio.run(run())
+    assert http_archive.log[-1][2] == "session=1"
+
+
+class FTPStandIn:
+    """A minimal FTP server (USER, PASS, TYPE, PASV, REST, RETR, QUIT)
+    serving 'files' ({path: bytes}) on 127.0.0.1. 'drops' ({path: [bytes
+    sent, ...]}) drops the control connection in the middle of a RETR
+    of the path, once per item."""
+
+    def __init__(self):
+        self.files = {}
+        self.drops = {}
+        self.log = []
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(8)
+        self.url = "ftp://127.0.0.1:%d" % self.listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._session, args=(conn,), daemon=True).start()
+
+    def _session(self, conn):
+        f = conn.makefile("rwb", buffering=0)
+
+        def reply(text):
+            f.write((text + "\r\n").encode())
+
+        reply("220 stand-in")
+        data = None
+        offset = 0
+        for line in f:
+            command, _, argument = line.decode().strip().partition(" ")
+            command = command.upper()
+            self.log.append((command, argument))
+            if command == "USER":
+                reply("331 password please")
+            elif command in ("PASS", "TYPE"):
+                reply("230 ok" if command == "PASS" else "200 ok")
+            elif command == "PASV":
+                data = socket.socket()
+                data.bind(("127.0.0.1", 0))
+                data.listen(1)
+                port = data.getsockname()[1]
+                reply("227 Entering Passive Mode (127,0,0,1,%d,%d)" % (port >> 8, port & 255))
+            elif command == "REST":
+                offset = int(argument)
+                reply("350 restarting")
+            elif command == "RETR":
+                channel, _ = data.accept()
+                content = self.files.get(argument.lstrip("/"))
+                if content is None:
+                    channel.close()
+                    reply("550 no such file")
+                elif self.drops.get(argument.lstrip("/")):
+                    reply("150 sending")
+                    sent = self.drops[argument.lstrip("/")].pop(0)
+                    channel.sendall(content[offset : offset + sent])
+                    channel.close()
+                    data.close()
+                    break
+                else:
+                    reply("150 sending")
+                    channel.sendall(content[offset:])
+                    channel.close()
+                    reply("226 done")
+                data.close()
+                offset = 0
+            elif command == "QUIT":
+                reply("221 bye")
+                break
+            else:
+                reply("502 not implemented")
+        conn.close()
+
+    def close(self):
+        self.listener.close()
+
+
+@pytest.fixture
+def ftp_archive():
+    server = FTPStandIn()
+    yield server
+    server.close()
+
+
+def test_ftp_download_verified(ftp_archive, tmp_path):
+    ftp_archive.files[PATH] = DATA
+    ftp_archive.files[DIRECTORY + "/SHA512SUMS"] = sums()
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), ftp_archive.url)
+    assert result.status == "downloaded"
+    with open(result.path, "rb") as f:
+        assert f.read() == DATA
+
+
+def test_ftp_resume_from_partial_file(ftp_archive, tmp_path):
+    ftp_archive.files[PATH] = DATA
+    ftp_archive.files[DIRECTORY + "/SHA512SUMS"] = sums()
+    target = tmp_path / PATH
+    target.parent.mkdir(parents=True)
+    with open(str(target) + ".part", "wb") as f:
+        f.write(DATA[:5000])
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), ftp_archive.url)
+    assert result.status == "downloaded"
+    with open(result.path, "rb") as f:
+        assert f.read() == DATA
+    assert ("REST", "5000") in ftp_archive.log
+
+
+def test_ftp_missing_then_present(ftp_archive, tmp_path):
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), ftp_archive.url)
+    assert result.status == "missing"
+    ftp_archive.files[PATH] = DATA
+    assert fetch.fetch([("codg", DAY)], str(tmp_path), ftp_archive.url)[0].status == "downloaded"
+    assert fetch.fetch([("codg", DAY)], str(tmp_path), ftp_archive.url)[0].status == "present"
+
+
+def test_ftp_resume_after_lost_control_connection(ftp_archive, tmp_path):
+    ftp_archive.files[PATH] = DATA
+    ftp_archive.files[DIRECTORY + "/SHA512SUMS"] = sums()
+    ftp_archive.drops[PATH] = [3000, 7000]
+    (result,) = fetch.fetch([("codg", DAY)], str(tmp_path), ftp_archive.url)
+    assert result.status == "downloaded"
+    with open(result.path, "rb") as f:
+        assert f.read() == DATA
+    assert [argument for command, argument in ftp_archive.log if command == "REST"] == ["3000", "10000"]
+
+
+def test_ftp_lost_for_good_fails_one_file(ftp_archive, tmp_path):
+    other = fetch.archive_path("codg", "2011-10-21")
+    ftp_archive.files[PATH] = DATA
+    ftp_archive.files[other] = DATA
+    ftp_archive.drops[PATH] = [1000] * (fetch.Retries + 1)
+    results = fetch.fetch([("codg", DAY), ("codg", "2011-10-21")], str(tmp_path), ftp_archive.url, verify=False)
+    assert [r.status for r in results] == ["failed", "downloaded"]
+    assert results[0].error
@@ -0,0 +1,63 @@
+"""The vectorised IGRF synthesis and the field grids."""
+
+import numpy
+import pytest
+from pyIGRF.calculate import igrf12syn
+
+from ionfr.igrf import fieldgrid, igrffield
+
+EPOCH = 2011.8
+
+
+def points():
+    rng = numpy.random.RandomState(1)
+    lat = rng.uniform(-89.0, 89.0, 50)
+    lon = rng.uniform(-180.0, 180.0, 50)
+    radius = rng.uniform(6371.2, 7500.0, 50)
+    return lat, lon, radius
+
+
+def test_calcfield_matches_pyigrf():
+    lat, lon, radius = points()
+    X, Y, Z = igrffield.calcField(lat, lon, radius, EPOCH)
+    epoch = igrffield.roundEpoch(EPOCH)
+    for k in range(len(lat)):
+        x, y, z, _ = igrf12syn(epoch, 2, radius[k], lat[k], lon[k] % 360.0)
+        assert numpy.allclose((X[k], Y[k], Z[k]), (x, y, z), rtol=0, atol=1e-9)
+
+
+def test_calcfield_broadcasts():
+    lat, lon, radius = points()
+    X, Y, Z = igrffield.calcField(lat[:, None], lon[None, :5], 6721.0, EPOCH)
+    assert X.shape == (50, 5)
+    x, y, z = igrffield.calcField(lat, lon[2], 6721.0, EPOCH)
+    assert numpy.array_equal(X[:, 2], x) and numpy.array_equal(Z[:, 2], z)
+
+
+def test_fieldgrid_matches_calcfield(tmp_path):
+    grid = fieldgrid.getFieldGrid(str(tmp_path), EPOCH, 6721.0, step=0.5)
+    lat, lon, _ = points()
+    exact = igrffield.calcField(lat, lon, 6721.0, grid.epoch)
+    for approx, value in zip(grid.field(lat, lon), exact):
+        # bilinear interpolation on a half degree grid
+        assert numpy.abs(approx - value).max() < 5.0
+    # on the nodes the values are those synthesised, and the
+    # longitudes wrap around
+    nodes = grid.field([10.0, -45.5], [20.0, 200.0])
+    exact = igrffield.calcField(numpy.array([10.0, -45.5]), numpy.array([20.0, -160.0]), 6721.0, grid.epoch)
+    assert numpy.allclose(nodes, exact, rtol=1e-12, atol=1e-9)
+
+
+def test_fieldgrid_is_reused(tmp_path):
+    first = fieldgrid.getFieldGrid(str(tmp_path), EPOCH, 6721.0, step=5.0)
+    fieldgrid._openGrids.clear()
+    second = fieldgrid.getFieldGrid(str(tmp_path), EPOCH, 6721.0, step=5.0)
+    assert numpy.array_equal(first.data, second.data)
+    # the grid and its description, no temporary files
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == [".json", ".npy"]
+
+
+def test_fieldgrid_refuses_points_outside(tmp_path):
+    grid = fieldgrid.getFieldGrid(str(tmp_path), EPOCH, 6721.0, step=5.0, latRange=(0.0, 60.0))
+    with pytest.raises(ValueError):
+        grid.field(-10.0, 0.0)
@@ -0,0 +1,62 @@
+"""Resuming batch runs from their journal."""
+
+import os
+
+import numpy
+import pytest
+
+from ionfr.journal import Journal, cut_output
+
+
+def write_journal(name):
+    journal = Journal(name, "run1")
+    journal.start(10)
+    journal.record(("codg", numpy.datetime64("2011-10-20")), [0], 100)
+    journal.record(("codg", numpy.datetime64("2011-10-21")), [1, 2], 250)
+    journal.close()
+
+
+def test_resume(tmp_path):
+    name = str(tmp_path / "out.txt.journal")
+    write_journal(name)
+    journal = Journal(name, "run1", resume=True)
+    assert journal.offset == 250
+    assert journal.units() == {("codg", numpy.datetime64("2011-10-20")), ("codg", numpy.datetime64("2011-10-21"))}
+    assert journal.jobs == {0, 1, 2}
+    assert [entry["start"] for entry in journal.entries] == [10, 100]
+
+
+def test_resume_after_torn_line(tmp_path):
+    name = str(tmp_path / "out.txt.journal")
+    write_journal(name)
+    with open(name, "rb") as f:
+        lines = f.read().split(b"\n")
+    # a crash in the middle of the last line
+    with open(name, "wb") as f:
+        f.write(b"\n".join(lines[:2]) + b"\n" + lines[2][:15])
+    journal = Journal(name, "run1", resume=True)
+    assert journal.offset == 100
+    assert journal.units() == {("codg", numpy.datetime64("2011-10-20"))}
+    # the torn line is dropped from the file, and new entries follow
+    assert os.path.getsize(name) == len(lines[0]) + len(lines[1]) + 2
+    journal.start(None)
+    journal.record(("codg", numpy.datetime64("2011-10-21")), [1, 2], 260)
+    journal.close()
+    assert Journal(name, "run1", resume=True).offset == 260
+
+
+def test_journal_of_another_run(tmp_path):
+    name = str(tmp_path / "out.txt.journal")
+    write_journal(name)
+    with pytest.raises(ValueError):
+        Journal(name, "run2", resume=True)
+
+
+def test_cut_output(tmp_path):
+    output = str(tmp_path / "out.txt")
+    with open(output, "wb") as f:
+        f.write(b"x" * 300)
+    cut_output(output, 250)
+    assert os.path.getsize(output) == 250
+    with pytest.raises(ValueError):
+        cut_output(output, 400)
@@ -0,0 +1,125 @@
+"""ionfr.refresh: recomputing the units of a batch run whose inputs changed."""
+
+import os
+
+import numpy
+import pytest
+
+import ionfr.batch
+import ionfr.refresh
+from ionfr.batch import run_manifest
+from ionfr.journal import Journal, journal_name
+from ionfr.refresh import refresh, stale_units
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IONEX = os.path.join(HERE, "codg2930.11i")
+
+DAY1 = ("codg", numpy.datetime64("2011-10-20"))
+DAY2 = ("codg", numpy.datetime64("2011-10-21"))
+
+MANIFEST = """source,station,start,stop,cadence,product
+08h37m05.6s+06d10m14.5s,52d54m54.6sn 6d52m11.7se,2011-10-20T02:00:00,2011-10-20T06:00:00,900,codg
+05h34m31.9s+22d00m52.2s,52d54m54.6sn 6d52m11.7se,2011-10-20T20:00:00,2011-10-21T04:00:00,900,codg
+"""
+
+
+def write_ionex(directory, day, height="450.0"):
+    # the maps of test/codg2930.11i, for 2011-10-'day' and at 'height'
+    with open(IONEX) as f:
+        text = f.read()
+    text = text.replace("2011    10    21", "2011    10    %02d" % (day + 1))
+    text = text.replace("2011    10    20", "2011    10    %02d" % day)
+    text = text.replace("   450.0 450.0   0.0", "%8s%6s   0.0" % (height, height))
+    with open(os.path.join(directory, "codg%03d0.11i" % (273 + day)), "w") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def run(tmp_path):
+    # a manifest over two IONEX days, its IONEX files and a function
+    # running it to an output
+    write_ionex(str(tmp_path), 20)
+    write_ionex(str(tmp_path), 21)
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(MANIFEST)
+
+    def run_to(name):
+        output = str(tmp_path / name)
+        run_manifest(str(manifest), output, str(tmp_path), precision=6)
+        return output
+
+    return run_to
+
+
+def contents(name):
+    with open(name, "rb") as f:
+        return f.read()
+
+
+def test_nothing_changed(run):
+    output = run("out.txt")
+    before, journal = contents(output), contents(journal_name(output))
+    assert refresh(output) == []
+    assert contents(output) == before
+    assert contents(journal_name(output)) == journal
+
+
+@pytest.mark.parametrize("name", ["out.txt", "out.csv", "out.npy"])
+def test_one_day_changed(run, tmp_path, monkeypatch, name):
+    output = run(name)
+    before = contents(output)
+    first = Journal(journal_name(output), None, resume=True).entries[0]
+    assert first["unit"] == DAY1
+    write_ionex(str(tmp_path), 21, height="350.0")
+    assert stale_units(output)[0] == [DAY2]
+
+    computed = []
+
+    def run_jobs(jobs, ionexdir, done, **options):
+        computed.append((DAY1 in done, DAY2 in done))
+        return ionfr.batch.run_jobs(jobs, ionexdir, done, **options)
+
+    monkeypatch.setattr(ionfr.refresh, "run_jobs", run_jobs)
+    assert refresh(output) == [DAY2]
+    # the first day was copied as it was, only the second computed
+    assert computed == [(True, False)]
+    after = contents(output)
+    assert after[: first["offset"]] == before[: first["offset"]]
+    assert after != before
+    # the same as a new run with the new file
+    assert after == contents(run("again" + os.path.splitext(name)[1]))
+    # and now nothing is left to refresh
+    assert refresh(output) == []
+
+
+def test_unfinished_run(run):
+    output = run("out.txt")
+    complete = contents(output)
+    # the run stopped after the first day (with part of the second
+    # day in the output, but not in the journal)
+    with open(journal_name(output), "rb") as f:
+        lines = f.read().split(b"\n")
+    with open(journal_name(output), "wb") as f:
+        f.write(b"\n".join(lines[:2]) + b"\n")
+    with open(output, "ab") as f:
+        f.write(b"half a row")
+    assert refresh(output) == [DAY2]
+    assert contents(output) == complete
+
+
+def test_interrupted_refresh_leaves_the_output(run, tmp_path, monkeypatch):
+    output = run("out.txt")
+    before, journal = contents(output), contents(journal_name(output))
+    write_ionex(str(tmp_path), 21, height="350.0")
+
+    def broken(*args, **options):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(ionfr.refresh, "result_rows", broken)
+    with pytest.raises(KeyboardInterrupt):
+        refresh(output)
+    assert contents(output) == before
+    assert contents(journal_name(output)) == journal
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["manifest.csv", "codg2930.11i", "codg2940.11i", "out.txt", "out.txt.journal"]
+    )
@@ -0,0 +1,79 @@
+"""Manifest runs on worker processes against serial runs."""
+
+import os
+
+import pytest
+
+from ionfr import profiling
+from ionfr.batch import run_manifest
+from ionfr.ionex import ionexmaps
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IONEX = os.path.join(HERE, "codg2930.11i")
+
+# three observations over three IONEX days (2011-10-20 to 22)
+MANIFEST = """source,station,start,stop,cadence,product
+08h37m05.6s+06d10m14.5s,52d54m54.6sn 6d52m11.7se,2011-10-20T02:00:00,2011-10-20T06:00:00,600,codg
+05h34m31.9s+22d00m52.2s,52d54m54.6sn 6d52m11.7se,2011-10-20T20:00:00,2011-10-22T04:00:00,900,codg
+05h34m31.9s+22d00m52.2s,30d43m17.3ss 21d24m40.6se,2011-10-21T10:00:00,2011-10-21T12:00:00,300,codg
+"""
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    # the maps of test/codg2930.11i for every day
+    with open(IONEX) as f:
+        text = f.read()
+    for day in (20, 21, 22):
+        with open(str(tmp_path / ("codg%03d0.11i" % (273 + day))), "w") as f:
+            f.write(
+                text.replace("2011    10    21", "2011    10    %02d" % (day + 1)).replace(
+                    "2011    10    20", "2011    10    %02d" % day
+                )
+            )
+    name = tmp_path / "manifest.csv"
+    name.write_text(MANIFEST)
+    yield str(name)
+    for day in (20, 21, 22):
+        ionexmaps.dropIONEX(str(tmp_path / ("codg%03d0.11i" % (273 + day))))
+
+
+def run(manifest, output, processes):
+    # a run with the profile on, from empty caches: the contents of
+    # the output and the counters (the calls and items of the stages,
+    # the lookups and hits of the caches)
+    directory = os.path.dirname(manifest)
+    for name in os.listdir(directory):
+        ionexmaps.dropIONEX(os.path.join(directory, name))
+    profiling.enable()
+    profiling.reset()
+    try:
+        run_manifest(manifest, output, directory, processes=processes, precision=6)
+        counters = profiling.take()
+    finally:
+        profiling.disable()
+    counters["stages"] = {stage: (calls, items) for stage, (calls, _, items) in counters["stages"].items()}
+    with open(output, "rb") as f:
+        return f.read(), counters
+
+
+@pytest.mark.parametrize("name", ["out.txt", "out.npy"])
+def test_parallel_run_is_the_serial_one(manifest, tmp_path, name):
+    serial, serialCounters = run(manifest, str(tmp_path / ("serial-" + name)), 1)
+    parallel, parallelCounters = run(manifest, str(tmp_path / ("parallel-" + name)), 2)
+    assert parallel == serial
+    assert serialCounters["stages"]["ionex.parse"] == (3, 3)
+    assert parallelCounters == serialCounters
+
+
+def test_parallel_run_with_the_tec_cache(manifest, tmp_path):
+    ionexmaps.setTecCache((2.0, 2.0, 1.0), 1000)
+    try:
+        serial, serialCounters = run(manifest, str(tmp_path / "serial.txt"), 1)
+        parallel, parallelCounters = run(manifest, str(tmp_path / "parallel.txt"), 2)
+    finally:
+        ionexmaps.setTecCache(None)
+    assert parallel == serial
+    lookups, hits = serialCounters["caches"]["ionex.tec"]
+    assert lookups > hits > 0
+    assert parallelCounters == serialCounters
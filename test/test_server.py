@@ -0,0 +1,75 @@
+"""The RM service (ionfr-serve), in process on a free port."""
+
+import os
+import threading
+
+import pytest
+
+from ionfr import server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUERY = {
+    "source": "08h37m05.6s+06d10m14.5s",
+    "station": "52d54m54.6sn 6d52m11.7se",
+    "ionex": "codg2930.11i",
+    "start": "2011-10-20T00:00:00",
+    "stop": "2011-10-20T03:00:00",
+    "cadence": 3600,
+}
+
+
+@pytest.fixture
+def service():
+    s = server.make_server(HERE, port=0)
+    threading.Thread(target=s.serve_forever, daemon=True).start()
+    yield s
+    s.shutdown()
+    s.server_close()
+
+
+def test_list_of_queries_without_a_thread_each(service):
+    port = service.server_address[1]
+    threads = threading.active_count()
+    late = dict(QUERY, start="2011-10-21T00:00:00", stop="2011-10-21T03:00:00")
+    results = server.query([QUERY] * 500 + [late], port)
+    assert threading.active_count() <= threads + 2
+    assert all(r["rm"] == results[0]["rm"] for r in results[:500])
+    assert "outside the maps" in results[-1]["error"]
+
+
+def test_batcher_survives_a_failed_batch(service, monkeypatch):
+    port = service.server_address[1]
+    batcher = service.batcher
+    original = batcher._evaluate
+
+    def broken(batch):
+        monkeypatch.setattr(batcher, "_evaluate", original)
+        raise RuntimeError("broken batch")
+
+    monkeypatch.setattr(batcher, "_evaluate", broken)
+    assert server.query(QUERY, port, timeout=10) == {"error": "broken batch"}
+    assert len(server.query(QUERY, port, timeout=10)["rm"]) == 3
+
+
+def test_unix_socket_replaces_only_a_socket(tmp_path):
+    path = str(tmp_path / "rm.sock")
+    # a socket left by an earlier service is replaced
+    for _ in range(2):
+        s = server.make_server(HERE, socket_path=path)
+        threading.Thread(target=s.serve_forever, daemon=True).start()
+        try:
+            assert len(server.query(QUERY, socket_path=path, timeout=10)["rm"]) == 3
+        finally:
+            s.shutdown()
+            s.server_close()
+        assert server.is_socket(path)
+    # a file given by mistake is not
+    with open(str(tmp_path / "notes.txt"), "w") as f:
+        f.write("keep me")
+    with pytest.raises(IOError):
+        server.make_server(HERE, socket_path=str(tmp_path / "notes.txt"))
+    with open(str(tmp_path / "notes.txt")) as f:
+        assert f.read() == "keep me"
+    with pytest.raises(SystemExit):
+        server.main(["--socket", str(tmp_path / "notes.txt")])
+    assert os.path.exists(str(tmp_path / "notes.txt"))
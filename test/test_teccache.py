@@ -0,0 +1,103 @@
+"""The quantized TEC cache of ionfr.ionex.ionexmaps."""
+
+import os
+import shutil
+
+import numpy
+import pytest
+
+from ionfr.batch import run_manifest
+from ionfr.ionex import ionexmaps
+from ionfr.refresh import refresh
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IONEX = os.path.join(HERE, "codg2930.11i")
+
+
+@pytest.fixture(autouse=True)
+def no_cache():
+    yield
+    ionexmaps.setTecCache(None)
+
+
+def test_values_are_those_of_the_centre_of_the_quantum():
+    data = ionexmaps.readIONEX(IONEX)
+    cache = ionexmaps.TecCache((1.0, 2.0, 0.5), 100)
+    lat = numpy.array([10.2, 10.9, 10.5, -33.3])
+    lon = numpy.array([20.1, 21.9, 21.0, 100.7])
+    hour = numpy.array([3.1, 3.4, 3.25, 17.9])
+    tec, rms = cache.lookup(data, lat, lon, hour)
+    # the first three points share the quantum centred at (10.5, 21, 3.25)
+    centre = ([10.5, 10.5, 10.5, -33.5], [21.0, 21.0, 21.0, 101.0], [3.25, 3.25, 3.25, 17.75])
+    assert numpy.array_equal(tec, ionexmaps.interpMaps(data, data.tecMaps, *centre))
+    assert numpy.array_equal(rms, ionexmaps.interpMaps(data, data.rmsMaps, *centre))
+    assert len(cache) == 2
+
+
+def test_hits():
+    data = ionexmaps.readIONEX(IONEX)
+    cache = ionexmaps.TecCache((1.0, 1.0, 0.5), 100)
+    lat, lon = numpy.meshgrid(numpy.arange(5.0), numpy.arange(4.0))
+    first = cache.lookup(data, lat + 0.5, lon + 0.5, 1.2)
+    assert (cache.lookups, cache.hits) == (20, 0)
+    # the same quanta again, at other points within them
+    second = cache.lookup(data, lat + 0.9, lon + 0.1, 1.4)
+    assert (cache.lookups, cache.hits) == (40, 20)
+    assert numpy.array_equal(first, second)
+    # through IonexData, with the cache on
+    ionexmaps.setTecCache((1.0, 1.0, 0.5), 100)
+    assert numpy.array_equal(data.tec(lat + 0.5, lon + 0.5, 1.2), first[0])
+    assert numpy.array_equal(data.tecRms(lat + 0.5, lon + 0.5, 1.2)[1], first[1])
+
+
+def test_eviction_keeps_the_points_used_last():
+    data = ionexmaps.readIONEX(IONEX)
+    cache = ionexmaps.TecCache((0.01, 0.01, 1 / 3600.0), 10)
+    cache.lookup(data, numpy.linspace(0.0, 50.0, 1000), 10.0, 1.0)
+    assert len(cache) == 10
+    old = numpy.arange(5.0)
+    new = numpy.arange(5.0) + 60.0
+    cache.lookup(data, old, 0.0, 2.0)
+    cache.lookup(data, new, 0.0, 2.0)
+    cache.lookup(data, old, 0.0, 2.0)
+    assert len(cache) == 10
+    # one more point pushes out the one used longest ago, of 'new'
+    cache.lookup(data, 70.0, 0.0, 2.0)
+    hits = cache.hits
+    cache.lookup(data, numpy.concatenate([old, new[1:]]), 0.0, 2.0)
+    assert len(cache) == 10 and cache.hits == hits + 9
+    # points of another file share the same room
+    other = ionexmaps.parseIONEX(IONEX)
+    cache.lookup(other, numpy.arange(8.0), 0.0, 2.0)
+    assert len(cache) == 10 and len(cache.tables[other.serial][0]) == 8
+
+
+def test_refresh_uses_the_tec_cache_of_the_run(tmp_path):
+    shutil.copy(IONEX, tmp_path / "codg2930.11i")
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(
+        "source,station,start,stop,cadence,product\n"
+        "08h37m05.6s+06d10m14.5s,52d54m54.6sn 6d52m11.7se,2011-10-20T00:00:00,2011-10-20T06:00:00,600,codg\n"
+    )
+    cached = str(tmp_path / "cached.txt")
+    plain = str(tmp_path / "plain.txt")
+    quantum = (1.0, 1.0, 0.5)
+    ionexmaps.setTecCache(quantum, 1000)
+    run_manifest(str(manifest), cached, str(tmp_path), precision=6)
+    ionexmaps.setTecCache(None)
+    run_manifest(str(manifest), plain, str(tmp_path), precision=6)
+    with open(cached, "rb") as f:
+        before = f.read()
+    with open(plain, "rb") as f:
+        assert f.read() != before
+    # the cache is part of the run: resuming without it is refused
+    with pytest.raises(ValueError):
+        run_manifest(str(manifest), cached, str(tmp_path), precision=6, resume=True)
+
+    # a new IONEX file: the unit is computed again, with the cache
+    with open(tmp_path / "codg2930.11i", "a") as f:
+        f.write("\n")
+    assert refresh(cached) == [("codg", numpy.datetime64("2011-10-20"))]
+    assert tuple(ionexmaps.tecCacheSettings()[0]) == quantum
+    with open(cached, "rb") as f:
+        assert f.read() == before
@@ -0,0 +1,82 @@
+"""Round trips of the output writers."""
+
+import json
+
+import numpy
+import pytest
+
+from ionfr.compute import RM_DTYPE
+from ionfr.writers import RMWriter, guess_format
+
+
+def rows(n=7, start=0.0):
+    out = numpy.zeros(n, dtype=RM_DTYPE)
+    out["hour"] = start + numpy.arange(n) / 3.0
+    out["tecpath"] = 1e17 * numpy.linspace(1.0, 3.0, n)
+    out["bfield"] = numpy.linspace(0.1, 0.4, n)
+    out["rm"] = numpy.pi * out["bfield"]
+    out["rmerr"] = out["rm"] / 7.0
+    return out
+
+
+def test_txt_round_trip(tmp_path):
+    name = str(tmp_path / "IonRM.txt")
+    with RMWriter(name, RM_DTYPE) as writer:
+        writer.write(rows())
+        writer.write(rows(3, 10.0))
+    back = numpy.loadtxt(name)
+    expected = numpy.concatenate([rows(), rows(3, 10.0)])
+    for k, column in enumerate(RM_DTYPE.names):
+        # (repr of the floats: the same values are read back)
+        assert numpy.array_equal(back[:, k], expected[column])
+
+
+def test_txt_header_and_precision(tmp_path):
+    name = str(tmp_path / "IonRM.txt")
+    with RMWriter(name, RM_DTYPE, precision=4, header=True) as writer:
+        writer.write(rows())
+    with open(name) as f:
+        assert f.readline().split() == ["#"] + list(RM_DTYPE.names)
+    back = numpy.loadtxt(name)
+    assert numpy.allclose(back[:, 3], rows()["rm"], rtol=1e-3)
+
+
+def test_npy_round_trip_and_append(tmp_path):
+    name = str(tmp_path / "IonRM.npy")
+    with RMWriter(name, RM_DTYPE) as writer:
+        writer.write(rows())
+    with RMWriter(name, RM_DTYPE, mode="a") as writer:
+        writer.write(rows(3, 10.0))
+    back = numpy.load(name)
+    assert back.dtype == RM_DTYPE
+    assert numpy.array_equal(back, numpy.concatenate([rows(), rows(3, 10.0)]))
+
+
+def test_npy_of_a_writer_not_closed(tmp_path):
+    # rows flushed by a writer that never closed (a crash) are still
+    # counted when the file is appended to
+    name = str(tmp_path / "IonRM.npy")
+    writer = RMWriter(name, RM_DTYPE)
+    writer.write(rows())
+    writer.flush()
+    with RMWriter(name, RM_DTYPE, mode="a") as again:
+        assert again.rows == 7
+        again.write(rows(1, 10.0))
+    assert len(numpy.load(name)) == 8
+
+
+def test_jsonl_nan_as_null(tmp_path):
+    name = str(tmp_path / "IonRM.jsonl")
+    data = rows(2)
+    data["rm"][1] = numpy.nan
+    with RMWriter(name, RM_DTYPE) as writer:
+        writer.write(data)
+    with open(name) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0]["rm"] == data["rm"][0]
+    assert lines[1]["rm"] is None
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        guess_format("IonRM.xls")